@@ -0,0 +1,131 @@
+# Playwright helpers: a pool of reusable product pages and a request blocklist.
+
+from collections import defaultdict
+from urllib.parse import urlparse
+
+from scrapy import signals
+from scrapy.utils.defer import deferred_from_coro
+from scrapy_playwright.handler import ScrapyPlaywrightDownloadHandler
+
+DEFAULT_CONTEXT_NAME = "default"
+
+# Sent with name=<context name> when a browser context will get no more
+# requests (e.g. its proxy was evicted), so its slot under
+# PLAYWRIGHT_MAX_CONTEXTS can go to another context.
+browser_context_retired = object()
+
+
+class ResourceBlocker:
+    # Predicate for PLAYWRIGHT_ABORT_REQUEST: aborts browser sub-requests the
+    # extractor never reads (images, fonts, ads, trackers). Only the DOM and the
+    # description iframe document are needed; image URLs come from src attributes.
+
+    def __init__(self, resource_types=(), blocked_hosts=()):
+        self.resource_types = frozenset(resource_types)
+        self.blocked_hosts = tuple(host.lower() for host in blocked_hosts)
+
+    def __call__(self, request):
+        if request.resource_type in self.resource_types:
+            return True
+        host = (urlparse(request.url).hostname or "").lower()
+        return any(host == blocked or host.endswith("." + blocked) for blocked in self.blocked_hosts)
+
+
+class PagePool:
+    # Idle Playwright pages kept open between product renders, per browser context.
+    # A page is closed instead of recycled after `max_uses` renders so long
+    # crawls do not accumulate renderer memory.
+
+    def __init__(self, max_idle_per_context=4, max_uses=50):
+        self.max_idle_per_context = max_idle_per_context
+        self.max_uses = max_uses
+        self._idle = defaultdict(list)  # context name -> idle pages
+        self._uses = {}                 # page -> renders served
+        self.reused = 0
+        self.created = 0
+
+    def acquire(self, context_name=DEFAULT_CONTEXT_NAME):
+        idle = self._idle[context_name]
+        while idle:
+            page = idle.pop()
+            if not page.is_closed():
+                self._uses[page] += 1
+                self.reused += 1
+                return page
+            self._uses.pop(page, None)
+        return None
+
+    def track(self, page):
+        # Registers a page freshly created by the download handler. Pages the
+        # handler closes itself (renders without playwright_include_page, errors)
+        # never come back through release(), so they are forgotten on close.
+        self._uses[page] = 1
+        self.created += 1
+        page.on("close", self._forget)
+
+    def _forget(self, page):
+        self._uses.pop(page, None)
+        for idle in self._idle.values():
+            if page in idle:
+                idle.remove(page)
+
+    async def release(self, page, context_name=DEFAULT_CONTEXT_NAME):
+        if page.is_closed():
+            self._uses.pop(page, None)
+            return
+        idle = self._idle[context_name]
+        if self._uses.get(page, self.max_uses) >= self.max_uses or len(idle) >= self.max_idle_per_context:
+            await self.discard(page)
+            return
+        try:
+            await page.goto("about:blank")  # drop the previous listing's DOM and frames
+        except Exception:
+            await self.discard(page)
+            return
+        idle.append(page)
+
+    async def discard(self, page):
+        self._uses.pop(page, None)
+        if not page.is_closed():
+            await page.close()
+
+
+class PooledPlaywrightDownloadHandler(ScrapyPlaywrightDownloadHandler):
+    # Serves browser requests with a recycled page from the spider's PagePool
+    # when one is idle, and only opens a new page otherwise. The pool is
+    # attached to the spider as `page_pool`; callbacks hand pages back with
+    # `page_pool.release()` instead of closing them.
+
+    def __init__(self, crawler):
+        super().__init__(crawler)
+        settings = crawler.settings
+        self.page_pool = PagePool(
+            max_idle_per_context=settings.getint(
+                "PLAYWRIGHT_PAGE_POOL_SIZE", settings.getint("PLAYWRIGHT_MAX_PAGES_PER_CONTEXT", 4)
+            ),
+            max_uses=settings.getint("PLAYWRIGHT_PAGE_POOL_MAX_USES", 50),
+        )
+        self.pool_stats = crawler.stats
+        crawler.signals.connect(self._attach_pool, signal=signals.spider_opened)
+        crawler.signals.connect(self._record_pool_stats, signal=signals.spider_closed)
+        crawler.signals.connect(self._retire_context, signal=browser_context_retired)
+
+    def _attach_pool(self, spider):
+        spider.page_pool = self.page_pool
+
+    def _record_pool_stats(self, spider):
+        self.pool_stats.set_value("playwright/page_pool/created", self.page_pool.created)
+        self.pool_stats.set_value("playwright/page_pool/reused", self.page_pool.reused)
+
+    def _retire_context(self, name):
+        wrapper = self.context_wrappers.get(name)
+        if wrapper is not None:
+            return deferred_from_coro(wrapper.context.close())
+
+    async def _create_page(self, request, spider):
+        page = self.page_pool.acquire(request.meta.setdefault("playwright_context", DEFAULT_CONTEXT_NAME))
+        if page is not None:
+            return page
+        page = await super()._create_page(request, spider)
+        self.page_pool.track(page)
+        return page
@@ -0,0 +1,157 @@
+# Listing fingerprints for change-detection output (-a change_store_path=...).
+#
+# For every listing the store keeps one short hash per tracked field group
+# (price, title, condition, seller stats, description) plus the last price,
+# link and the search keyword it was last found under; the records themselves
+# are not kept. A scraped listing is compared against its fingerprint and
+# turned into at most one event:
+#
+#   new            first sight; `changes` holds the full record
+#   price_changed  the price moved (`previous_price` is the old one); any other
+#                  changed fields are included as well
+#   changed        other tracked fields changed, the price did not
+#   relisted       a listing reported as disappeared is back; changed fields only
+#   disappeared    see sweep()
+#
+# Unchanged listings produce nothing.
+#
+# A listing has disappeared when its keyword was searched but the listing was
+# not on any of its result pages for `disappear_after` consecutive completed
+# runs. Result cards count as sightings whether or not the product page was
+# rendered (duplicates, incremental skips, failed renders). A run that stops
+# early never sweeps, so its sightings carry over to the next run's sweep.
+
+import hashlib
+import json
+import sqlite3
+import time
+
+# Field group -> item fields it covers
+FINGERPRINT_FIELDS = {
+    'price': ('price',),
+    'title': ('title',),
+    'condition': ('condition',),
+    'seller': ('seller_name', 'seller_positive_feedback_percentage', 'seller_feedback_count', 'top_rated_seller'),
+    'description': ('description',),
+}
+
+MISSING_DESCRIPTION = "Description not found."
+
+
+def fingerprint(item):
+    # Field group -> 8-byte hash; None for a description that could not be fetched,
+    # which leaves the stored one in place rather than reporting a change
+    hashes = {}
+    for group, fields in FINGERPRINT_FIELDS.items():
+        values = [item.get(name) for name in fields]
+        if group == 'description' and values[0] in (None, MISSING_DESCRIPTION):
+            hashes[group] = None
+            continue
+        encoded = json.dumps(values, ensure_ascii=False, default=str).encode('utf-8')
+        hashes[group] = hashlib.blake2b(encoded, digest_size=8).digest()
+    return hashes
+
+
+class ChangeStore:
+    def __init__(self, path, disappear_after=2, commit_every=100):
+        self.path = path
+        self.disappear_after = disappear_after
+        self.commit_every = commit_every
+        self._pending_writes = 0
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS fingerprints ("
+            " product_id TEXT PRIMARY KEY,"
+            " price_hash BLOB, title_hash BLOB, condition_hash BLOB, seller_hash BLOB, description_hash BLOB,"
+            " price TEXT,"
+            " link TEXT,"
+            " scope TEXT,"
+            " status TEXT NOT NULL DEFAULT 'active',"
+            " first_seen REAL NOT NULL,"
+            " last_seen REAL NOT NULL,"
+            " missed_runs INTEGER NOT NULL DEFAULT 0)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS fingerprints_scope ON fingerprints (scope, status)")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS sweeps (swept_at REAL NOT NULL)")
+        self.conn.commit()
+        self.scopes = set()  # keywords searched in this run
+
+    def _written(self):
+        self._pending_writes += 1
+        if self._pending_writes >= self.commit_every:
+            self.conn.commit()
+            self._pending_writes = 0
+
+    def sighted(self, product_id, scope, now=None):
+        # A result card for the listing; keeps it from being reported as disappeared
+        self.conn.execute(
+            "UPDATE fingerprints SET last_seen = ?, missed_runs = 0, scope = ? WHERE product_id = ?",
+            (time.time() if now is None else now, scope, product_id),
+        )
+        self._written()
+
+    def diff(self, item, scope=None, now=None):
+        # Returns (event, changed fields, previous price) for a scraped listing,
+        # or None when nothing tracked changed; records the new fingerprint.
+        product_id = item.get('product_id')
+        now = time.time() if now is None else now
+        hashes = fingerprint(item)
+        row = self.conn.execute(
+            "SELECT price_hash, title_hash, condition_hash, seller_hash, description_hash, price, status"
+            " FROM fingerprints WHERE product_id = ?", (product_id,)
+        ).fetchone()
+        self.conn.execute(
+            "INSERT INTO fingerprints (product_id, price_hash, title_hash, condition_hash, seller_hash,"
+            " description_hash, price, link, scope, first_seen, last_seen)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"
+            " ON CONFLICT(product_id) DO UPDATE SET"
+            " price_hash = excluded.price_hash, title_hash = excluded.title_hash,"
+            " condition_hash = excluded.condition_hash, seller_hash = excluded.seller_hash,"
+            " description_hash = COALESCE(excluded.description_hash, fingerprints.description_hash),"
+            " price = excluded.price, link = excluded.link, scope = COALESCE(excluded.scope, fingerprints.scope),"
+            " status = 'active', last_seen = excluded.last_seen, missed_runs = 0",
+            (product_id, hashes['price'], hashes['title'], hashes['condition'], hashes['seller'],
+             hashes['description'], item.get('price'), item.get('link'), scope, now, now),
+        )
+        self._written()
+        if row is None:
+            return 'new', [name for name, value in item.items() if value is not None], None
+        stored = dict(zip(FINGERPRINT_FIELDS, row[:5]))
+        changed_groups = [group for group, value in hashes.items()
+                          if value is not None and value != stored[group]]
+        changed = [name for group in changed_groups for name in FINGERPRINT_FIELDS[group]]
+        previous_price = row[5] if 'price' in changed_groups else None
+        if row[6] == 'disappeared':
+            return 'relisted', changed, previous_price
+        if not changed:
+            return None
+        return ('price_changed' if 'price' in changed_groups else 'changed'), changed, previous_price
+
+    def sweep(self, now=None):
+        # Ends a completed run: listings of this run's keywords that were not sighted
+        # since the previous sweep miss a run; those that reached `disappear_after`
+        # misses are marked disappeared and returned as (product_id, link, scope, price).
+        now = time.time() if now is None else now
+        last_swept = self.conn.execute("SELECT MAX(swept_at) FROM sweeps").fetchone()[0] or 0
+        self.conn.execute("CREATE TEMP TABLE IF NOT EXISTS swept_scopes (scope TEXT PRIMARY KEY)")
+        self.conn.execute("DELETE FROM swept_scopes")
+        self.conn.executemany("INSERT OR IGNORE INTO swept_scopes VALUES (?)", [(scope,) for scope in self.scopes])
+        in_scope = "status = 'active' AND scope IN (SELECT scope FROM swept_scopes)"
+        self.conn.execute(f"UPDATE fingerprints SET missed_runs = missed_runs + 1 WHERE {in_scope} AND last_seen < ?",
+                          (last_swept,))
+        gone = self.conn.execute(
+            f"SELECT product_id, link, scope, price FROM fingerprints WHERE {in_scope} AND missed_runs >= ?",
+            (self.disappear_after,),
+        ).fetchall()
+        self.conn.executemany("UPDATE fingerprints SET status = 'disappeared' WHERE product_id = ?",
+                              [(product_id,) for product_id, *_ in gone])
+        self.conn.execute("INSERT INTO sweeps (swept_at) VALUES (?)", (now,))
+        self.conn.commit()
+        self._pending_writes = 0
+        return gone
+
+    def close(self):
+        self.conn.commit()
+        self.conn.close()
@@ -0,0 +1,105 @@
+# Crash-safe checkpoint of a crawl's frontier.
+#
+# The spider's work units (suggest:<kwd>, search:<cat>:<kwd>:<page> and
+# product:<id>, see MainSpider._dispatch) are recorded as pending when they
+# are requested and as done once their callback has produced all of its
+# output. The state is written to a JSON file at most every `interval`
+# seconds, and once more at close, through a temporary file that atomically
+# replaces the previous checkpoint, so a crash leaves the last complete one.
+#
+# A resumed run requests the units that were still pending (with the meta
+# they were first requested with, so no live Playwright page is needed) and
+# skips every unit that is already pending or done: expanded suggestions,
+# fetched search pages and rendered listings are not paid for again.
+
+import json
+import os
+import time
+
+
+class CrawlCheckpoint:
+    version = 1
+
+    def __init__(self, path, interval=15, max_attempts=3):
+        self.path = path
+        self.interval = interval
+        self.max_attempts = max_attempts
+        self.pending = {}   # key -> {'kind', 'url', 'meta', 'priority', 'attempts'}
+        self.done = set()
+        self.failed = set()
+        self._dirty = False
+        self._saved_at = time.monotonic()
+
+    def load(self):
+        # Returns False when there is no checkpoint to resume from
+        if not os.path.exists(self.path):
+            return False
+        with open(self.path, encoding='utf-8') as f:
+            state = json.load(f)
+        if state.get('version') != self.version:
+            raise ValueError(f"Unsupported checkpoint version in {self.path}: {state.get('version')!r}")
+        self.pending = state['pending']
+        self.done = set(state['done'])
+        self.failed = set(state['failed'])
+        return True
+
+    def add(self, kind, key, url, meta, priority=0):
+        # Returns False for a unit that is already pending, done or given up on
+        if key in self.pending or key in self.done or key in self.failed:
+            return False
+        self.pending[key] = {'kind': kind, 'url': url, 'meta': dict(meta), 'priority': priority, 'attempts': 0}
+        self._changed()
+        return True
+
+    def complete(self, key):
+        # True only the first time a pending unit is completed
+        if self.pending.pop(key, None) is None:
+            return False
+        self.done.add(key)
+        self._changed()
+        return True
+
+    def fail(self, key):
+        # The unit stays pending for the next resume until it has used up its attempts.
+        # Returns True when it will be retried, False when it has now failed for good,
+        # and None for a unit that is unknown or already settled (done or failed).
+        unit = self.pending.get(key)
+        if unit is None:
+            return None
+        unit['attempts'] += 1
+        if unit['attempts'] >= self.max_attempts:
+            del self.pending[key]
+            self.failed.add(key)
+        self._changed()
+        return key in self.pending
+
+    def counts(self):
+        counts = {'pending': len(self.pending), 'failed': len(self.failed)}
+        for key in self.done:
+            kind = key.split(':', 1)[0]
+            counts[f'done_{kind}'] = counts.get(f'done_{kind}', 0) + 1
+        return counts
+
+    def _changed(self):
+        self._dirty = True
+        if time.monotonic() - self._saved_at >= self.interval:
+            self.save()
+
+    def save(self):
+        if not self._dirty:
+            return
+        state = {
+            'version': self.version,
+            'saved_at': time.time(),
+            'pending': self.pending,
+            'done': sorted(self.done),
+            'failed': sorted(self.failed),
+        }
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(state, f, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+        self._dirty = False
+        self._saved_at = time.monotonic()
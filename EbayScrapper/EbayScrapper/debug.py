@@ -0,0 +1,198 @@
+# Debug artifacts for failed product renders, captured without stalling the crawl.
+#
+# When a render fails (challenge timeout, missing required fields, a callback
+# error), the spider grabs the page HTML and an optional viewport screenshot
+# and hands them to DebugCapture. Only the grab happens in the callback;
+# compressing and writing run in a background task that writes from a worker
+# thread, fed by a bounded queue. When eBay pushes back and every render fails,
+# captures are thinned out instead of piling up:
+#
+#   * sampling: DEBUG_CAPTURE_SAMPLE_RATE of the failures of each type are
+#     considered at all;
+#   * rate limit: at most DEBUG_CAPTURE_PER_MINUTE captures per failure type
+#     (a token bucket, so short bursts up to that many go through);
+#   * backpressure: a capture that finds the writer queue full is dropped.
+#
+# HTML is gzipped and screenshots are JPEGs. Captures are written under
+# DEBUG_CAPTURE_DIR/<failure type>/, and the oldest files are deleted once the
+# directory grows past DEBUG_CAPTURE_MAX_BYTES.
+
+import asyncio
+import gzip
+import os
+import random
+import re
+import time
+from collections import deque
+from datetime import datetime, timezone
+
+from scrapy import signals
+from scrapy.exceptions import NotConfigured
+from scrapy.utils.defer import deferred_from_coro
+
+
+def _safe_name(value):
+    return re.sub(r'[^A-Za-z0-9_.-]+', '_', str(value))[:80] or 'unknown'
+
+
+class _TokenBucket:
+    __slots__ = ('rate', 'capacity', 'tokens', 'updated')
+
+    def __init__(self, per_minute, clock):
+        self.rate = per_minute / 60.0
+        self.capacity = max(1.0, float(per_minute))
+        self.tokens = self.capacity
+        self.updated = clock()
+
+    def take(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+
+class DebugCapture:
+    def __init__(self, directory, sample_rate=1.0, per_minute=6, queue_size=8, max_bytes=200 * 1024 * 1024,
+                 screenshots=True, stats=None, clock=time.monotonic):
+        self.directory = directory
+        self.sample_rate = sample_rate
+        self.per_minute = per_minute
+        self.queue_size = queue_size
+        self.max_bytes = max_bytes
+        self.screenshots = screenshots
+        self.stats = stats
+        self.clock = clock
+        self._buckets = {}       # failure type -> _TokenBucket
+        self._queue = None       # created on first use, inside the running event loop
+        self._writer = None
+        self._files = None       # (mtime, path, size) of the files on disk, oldest first
+        self._bytes = 0
+
+    def _inc(self, key, count=1):
+        if self.stats is not None:
+            self.stats.inc_value(f'debug_capture/{key}', count)
+
+    def admit(self, reason):
+        # Whether a failure of this type should be captured; cheap, call it before touching the page
+        if self.sample_rate < 1 and random.random() >= self.sample_rate:
+            self._inc(f'sampled_out/{reason}')
+            return False
+        if self._queue is not None and self._queue.full():
+            self._inc('dropped/queue_full')
+            return False
+        bucket = self._buckets.get(reason)
+        if bucket is None:
+            bucket = self._buckets[reason] = _TokenBucket(self.per_minute, self.clock)
+        if not bucket.take(self.clock()):
+            self._inc(f'rate_limited/{reason}')
+            return False
+        return True
+
+    def submit(self, reason, product_id, url, html, screenshot=None):
+        # Queues a capture for the writer; never waits. Returns False when it was dropped.
+        if self._queue is None:
+            self._queue = asyncio.Queue(maxsize=self.queue_size)
+            self._writer = asyncio.get_running_loop().create_task(self._write_loop())
+        try:
+            self._queue.put_nowait((reason, product_id, url, html, screenshot, datetime.now(timezone.utc)))
+        except asyncio.QueueFull:
+            self._inc('dropped/queue_full')
+            return False
+        return True
+
+    async def _write_loop(self):
+        while True:
+            capture = await self._queue.get()
+            try:
+                await asyncio.to_thread(self._write, *capture)
+            except OSError:
+                self._inc('write_errors')
+            finally:
+                self._queue.task_done()
+
+    def _write(self, reason, product_id, url, html, screenshot, captured_at):
+        # Runs in a worker thread
+        if self._files is None:
+            self._scan()
+        folder = os.path.join(self.directory, _safe_name(reason))
+        os.makedirs(folder, exist_ok=True)
+        stem = os.path.join(folder, f"{captured_at:%Y%m%dT%H%M%S.%f}-{_safe_name(product_id)}")
+        header = f"<!-- url: {url} | reason: {reason} | captured: {captured_at.isoformat()} -->\n"
+        written = [(f"{stem}.html.gz", gzip.compress((header + (html or '')).encode('utf-8'), compresslevel=6))]
+        if screenshot:
+            written.append((f"{stem}.jpg", screenshot))
+        for path, data in written:
+            with open(path, 'wb') as f:
+                f.write(data)
+            self._files.append((time.time(), path, len(data)))
+            self._bytes += len(data)
+            self._inc('bytes_written', len(data))
+        self._inc(f'captured/{reason}')
+        self._enforce_retention()
+
+    def _scan(self):
+        files = []
+        for folder, _, names in os.walk(self.directory):
+            for name in names:
+                path = os.path.join(folder, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                files.append((stat.st_mtime, path, stat.st_size))
+        files.sort()
+        self._files = deque(files)
+        self._bytes = sum(size for _, _, size in files)
+
+    def _enforce_retention(self):
+        while self._bytes > self.max_bytes and self._files:
+            _, path, size = self._files.popleft()
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            self._bytes -= size
+            self._inc('evicted_files')
+
+    async def close(self, timeout=30):
+        # Lets queued captures finish writing, for up to `timeout` seconds
+        if self._writer is None:
+            return
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout)
+        except asyncio.TimeoutError:
+            self._inc('dropped/shutdown', self._queue.qsize())
+        self._writer.cancel()
+
+
+class DebugCaptureExtension:
+    # Attaches a DebugCapture to the spider as `debug_capture` and flushes it at close
+
+    def __init__(self, crawler):
+        settings = crawler.settings
+        if not settings.getbool('DEBUG_CAPTURE_ENABLED'):
+            raise NotConfigured
+        self.capture = DebugCapture(
+            settings.get('DEBUG_CAPTURE_DIR', 'debug'),
+            sample_rate=settings.getfloat('DEBUG_CAPTURE_SAMPLE_RATE', 1.0),
+            per_minute=settings.getfloat('DEBUG_CAPTURE_PER_MINUTE', 6),
+            queue_size=settings.getint('DEBUG_CAPTURE_QUEUE_SIZE', 8),
+            max_bytes=settings.getint('DEBUG_CAPTURE_MAX_BYTES', 200 * 1024 * 1024),
+            screenshots=settings.getbool('DEBUG_CAPTURE_SCREENSHOTS', True),
+            stats=crawler.stats,
+        )
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        ext = cls(crawler)
+        crawler.signals.connect(ext.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(ext.spider_closed, signal=signals.spider_closed)
+        return ext
+
+    def spider_opened(self, spider):
+        spider.debug_capture = self.capture
+
+    def spider_closed(self, spider, reason):
+        return deferred_from_coro(self.capture.close())
@@ -0,0 +1,86 @@
+# Run-wide deduplication of listings discovered on search result pages.
+#
+# With suggestions enabled the same /itm/<id> listing is found by many
+# keyword/category/page combinations. The spider asks the deduplicator before
+# scheduling a product request so every listing is fetched once per run, and
+# repeat sightings are kept as extra keyword provenance instead.
+
+import hashlib
+import math
+from collections import OrderedDict
+
+
+class BloomFilter:
+    # Fixed-size probabilistic set. False positives (a new listing reported as
+    # seen) happen at roughly `error_rate` once `capacity` keys are added.
+
+    def __init__(self, capacity, error_rate=0.001):
+        self.num_bits = max(8, int(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.num_hashes = max(1, round(self.num_bits / capacity * math.log(2)))
+        self.bits = bytearray((self.num_bits + 7) // 8)
+
+    def _positions(self, key):
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return [(h1 + i * h2) % self.num_bits for i in range(self.num_hashes)]
+
+    def __contains__(self, key):
+        return all(self.bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(key))
+
+    def add(self, key):
+        # Returns True if the key was not present before.
+        added = False
+        for pos in self._positions(key):
+            mask = 1 << (pos & 7)
+            if not self.bits[pos >> 3] & mask:
+                self.bits[pos >> 3] |= mask
+                added = True
+        return added
+
+
+class ListingDeduplicator:
+    # backend="set": exact, keeps keyword provenance, holds at most
+    #   `max_entries` listings (the oldest are forgotten first).
+    # backend="bloom": constant memory for very large crawls, no provenance.
+    backends = ("set", "bloom")
+
+    def __init__(self, backend="set", max_entries=1_000_000, error_rate=0.001, max_keywords_per_listing=32):
+        if backend not in self.backends:
+            raise ValueError(f"Unknown dedup backend: {backend!r}")
+        self.backend = backend
+        self.max_entries = max_entries
+        self.max_keywords_per_listing = max_keywords_per_listing
+        self.duplicates = 0
+        if backend == "bloom":
+            self._bloom = BloomFilter(max_entries, error_rate)
+        else:
+            self._seen = OrderedDict()  # product_id -> list of keywords that surfaced it
+
+    def first_sighting(self, product_id, keyword=None):
+        # Records the sighting and returns True only the first time a listing is seen.
+        if self.backend == "bloom":
+            if self._bloom.add(product_id):
+                return True
+            self.duplicates += 1
+            return False
+
+        keywords = self._seen.get(product_id)
+        if keywords is None:
+            self._seen[product_id] = [keyword] if keyword else []
+            if len(self._seen) > self.max_entries:
+                self._seen.popitem(last=False)
+            return True
+        if keyword and keyword not in keywords and len(keywords) < self.max_keywords_per_listing:
+            keywords.append(keyword)
+        self.duplicates += 1
+        return False
+
+    def keywords_for(self, product_id):
+        # Keywords that surfaced the listing so far, in discovery order.
+        if self.backend == "bloom":
+            return []
+        return list(self._seen.get(product_id) or [])
+
+    def __len__(self):
+        return len(self._seen) if self.backend == "set" else 0
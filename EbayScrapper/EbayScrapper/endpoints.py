@@ -0,0 +1,27 @@
+# Classification of eBay URLs into the endpoint classes the crawler talks to.
+#
+# Routing, throttling and caching decisions are made per endpoint class rather
+# than per domain because the search and product pages share www.ebay.com.
+
+from urllib.parse import urlparse
+
+AUTOSUG = "autosug"
+SRP = "srp"
+ITEM = "item"
+DESCRIPTION = "description"
+OTHER = "other"
+
+
+def classify_url(url):
+    parsed = urlparse(url)
+    host = parsed.netloc.lower()
+    path = parsed.path
+    if host.startswith("autosug."):
+        return AUTOSUG
+    if "ebaydesc.com" in host:
+        return DESCRIPTION
+    if path.startswith("/sch/"):
+        return SRP
+    if path.startswith("/itm/"):
+        return ITEM
+    return OTHER
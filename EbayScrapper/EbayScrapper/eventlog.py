@@ -0,0 +1,171 @@
+# Structured, sampled event log for the spider's hot paths.
+#
+# The spider reports per-request, per-page and per-listing happenings as
+# events, spider.events.event("srp_page", keyword=..., products=...), instead
+# of INFO lines built with f-strings. An event is a name plus its raw field
+# values. Nothing is formatted in the crawl thread. Once the log is opened
+# (see MainSpider.from_crawler), records go through a bounded queue to a
+# listener thread that writes them as JSON lines to EVENT_LOG_FILE (stderr
+# when unset). A full queue drops records rather than blocking the reactor.
+#
+# High-volume event types are sampled: EVENT_LOG_SAMPLE_RATES maps an event
+# name to the share of its occurrences that are written (every Nth one,
+# 0 writes none). What sampling held back is reported every
+# EVENT_LOG_SUMMARY_INTERVAL seconds, and at close, as an "event_summary"
+# event with the number seen and written per event type.
+#
+# Event logs share their writer per logger name: several spiders in one
+# process (crawls started from a script, the benchmark) open the same
+# "<spider name>.events" logger, and each record is written once. The writer
+# is set up with the first open's settings and stopped by the last close.
+#
+# Until the log is opened, events go through standard logging like any other
+# record and render as "name key=value ...", formatted only if a handler
+# actually emits them.
+
+import json
+import logging
+import queue
+import sys
+import time
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+
+
+class _Event:
+    # A record's msg; rendered lazily, by whichever handler emits it
+    __slots__ = ('name', 'fields')
+
+    def __init__(self, name, fields):
+        self.name = name
+        self.fields = fields
+
+    def __str__(self):
+        return ' '.join([self.name, *(f'{key}={value!r}' for key, value in self.fields.items())])
+
+
+class JsonLinesFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+        }
+        if isinstance(record.msg, _Event):
+            entry['event'] = record.msg.name
+            entry.update(record.msg.fields)
+        else:
+            entry['event'] = 'log'
+            entry['message'] = record.getMessage()
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class _DroppingQueueHandler(QueueHandler):
+    def __init__(self, queue):
+        super().__init__(queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # Left for the listener thread to format
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class _Writer:
+    # The queue handler and listener thread behind one logger, and how many open logs use them
+    def __init__(self, handler, listener, output):
+        self.handler = handler
+        self.listener = listener
+        self.output = output
+        self.users = 0
+
+
+_writers = {}  # logger name -> _Writer
+
+
+class EventLog:
+    def __init__(self, name, sample_rates=None, summary_interval=60, clock=time.monotonic):
+        self.logger = logging.getLogger(name)
+        self.summary_interval = summary_interval
+        self.clock = clock
+        self._every = {}
+        self.set_sample_rates(sample_rates or {})
+        self._seen = {}     # event name -> occurrences since the last summary
+        self._written = {}  # event name -> occurrences written since the last summary
+        self._summarized_at = clock()
+        self._handler = None  # the shared writer's queue handler while open
+
+    def set_sample_rates(self, sample_rates):
+        # rate -> write every Nth occurrence; 0 writes none
+        self._every = {name: (round(1 / rate) if rate > 0 else 0) for name, rate in sample_rates.items()}
+
+    def event(self, name, level=logging.INFO, **fields):
+        if not self.logger.isEnabledFor(level):
+            return
+        every = self._every.get(name, 1)
+        seen = self._seen.get(name, 0) + 1
+        self._seen[name] = seen
+        if every and (seen - 1) % every == 0:
+            self._written[name] = self._written.get(name, 0) + 1
+            self.logger.log(level, _Event(name, fields))
+        if self.clock() - self._summarized_at >= self.summary_interval:
+            self.summarize()
+
+    def summarize(self):
+        # Reports the event types sampling held back since the last summary
+        held_back = {name: {'seen': seen, 'written': self._written.get(name, 0)}
+                     for name, seen in self._seen.items() if seen > self._written.get(name, 0)}
+        dropped = 0
+        if self._handler is not None:
+            dropped, self._handler.dropped = self._handler.dropped, 0
+        if held_back or dropped:
+            self.logger.info(_Event('event_summary', {'interval': self.summary_interval, 'events': held_back,
+                                                      'dropped_records': dropped}))
+        self._seen.clear()
+        self._written.clear()
+        self._summarized_at = self.clock()
+
+    def open(self, settings):
+        self.summary_interval = settings.getfloat('EVENT_LOG_SUMMARY_INTERVAL', 60)
+        self.set_sample_rates(settings.getdict('EVENT_LOG_SAMPLE_RATES'))
+        self.logger.setLevel(settings.get('EVENT_LOG_LEVEL', 'INFO'))
+        if self._handler is not None:
+            return
+        writer = _writers.get(self.logger.name)
+        if writer is None:
+            path = settings.get('EVENT_LOG_FILE')
+            output = logging.FileHandler(path, encoding='utf-8') if path else logging.StreamHandler(sys.stderr)
+            output.setFormatter(JsonLinesFormatter())
+            records = queue.Queue(maxsize=settings.getint('EVENT_LOG_QUEUE_SIZE', 10000))
+            writer = _writers[self.logger.name] = _Writer(_DroppingQueueHandler(records),
+                                                          QueueListener(records, output), output)
+            writer.listener.start()
+            self.logger.addHandler(writer.handler)
+            self.logger.propagate = False
+        writer.users += 1
+        self._handler = writer.handler
+
+    def close(self):
+        # Writes the final summary; the last log to close waits for the listener
+        # to drain the queue
+        self.summarize()
+        if self._handler is None:
+            return
+        self._handler = None
+        writer = _writers[self.logger.name]
+        writer.users -= 1
+        if writer.users:
+            return
+        del _writers[self.logger.name]
+        self.logger.removeHandler(writer.handler)
+        self.logger.propagate = True
+        writer.listener.queue.join()  # so the stop sentinel always fits
+        writer.listener.stop()
+        writer.output.close()
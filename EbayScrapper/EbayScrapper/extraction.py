@@ -0,0 +1,179 @@
+# Declarative field extraction.
+#
+# A field is described once by a FieldSpec: CSS/XPath queries tried in order
+# (primary first, then fallbacks), an optional scope, a post-processor and a
+# required flag. FieldExtractor compiles every query to an lxml XPath object
+# once, when the spider starts, and evaluates the whole table against a single
+# parsed tree per page. Scopes (seller card, price block, returns section, ...)
+# are located once per page, and the fields inside them only search that
+# subtree rather than the whole document.
+#
+# New fields are added to the tables at the bottom of this module (and to the
+# item); the spider callbacks do not change.
+
+from dataclasses import dataclass
+from typing import Any, Callable, Optional
+
+from lxml import etree
+from parsel.csstranslator import HTMLTranslator
+
+_translator = HTMLTranslator()
+
+
+def css(query):
+    # Supports parsel's ::text and ::attr(name) pseudo-elements
+    return ('css', query)
+
+
+def xpath(query):
+    # Relative to the scope node: start with "./" or ".//"
+    return ('xpath', query)
+
+
+def _compile(query):
+    kind, text = query
+    if kind == 'css':
+        text = _translator.css_to_xpath(text)
+    return etree.XPath(text, smart_strings=False)
+
+
+@dataclass(slots=True)
+class FieldSpec:
+    name: str
+    queries: tuple                           # css(...) / xpath(...), tried in order until one yields a value
+    scope: Optional[str] = None              # scope name; None searches the whole tree passed to extract()
+    many: bool = False                       # keep every match (a list) instead of the first one
+    process: Optional[Callable] = None       # applied to the first match, or to the list when many=True
+    accept: Optional[Callable] = None        # a processed value failing this check falls through to the next query
+    required: bool = False
+    default: Any = None                      # value when no query matches ([] for many=True fields)
+
+
+class FieldExtractor:
+    def __init__(self, specs, scopes=None):
+        # scopes: name -> queries locating the subtree; the first query that matches
+        # wins. A field whose scope is not found on a page gets its default.
+        self.specs = tuple(specs)
+        self._fields = [(spec, [_compile(query) for query in spec.queries]) for spec in self.specs]
+        self._scopes = {name: [_compile(query) for query in queries] for name, queries in (scopes or {}).items()}
+        unknown = {spec.scope for spec in self.specs if spec.scope} - set(self._scopes)
+        if unknown:
+            raise ValueError(f"Unknown extraction scopes: {sorted(unknown)}")
+
+    def _find_scope(self, name, root):
+        for query in self._scopes[name]:
+            nodes = query(root)
+            if nodes:
+                return nodes[0]
+        return None
+
+    def extract(self, root):
+        # root: an lxml element (response.selector.root, or a card's .root).
+        # Returns (values by field name, names of required fields that came out empty).
+        scope_nodes = {}
+        values = {}
+        missing = []
+        for spec, queries in self._fields:
+            node = root
+            if spec.scope:
+                if spec.scope not in scope_nodes:
+                    scope_nodes[spec.scope] = self._find_scope(spec.scope, root)
+                node = scope_nodes[spec.scope]
+            default = [] if spec.many and spec.default is None else spec.default
+            value = default
+            if node is not None:
+                for query in queries:
+                    results = query(node)
+                    if not results:
+                        continue
+                    value = results if spec.many else results[0]
+                    if spec.process is not None:
+                        value = spec.process(value)
+                    if spec.accept is None or spec.accept(value):
+                        break
+                    value = default
+            values[spec.name] = value
+            if spec.required and not value:
+                missing.append(spec.name)
+        return values, missing
+
+
+# --- Post-processors ---
+
+def strip(value):
+    return value.strip()
+
+
+def strip_or_none(value):
+    return value.strip() or None
+
+
+def join_words(values):
+    return " ".join(values).strip()
+
+
+def join_words_or_none(values):
+    return " ".join(values).strip() or None
+
+
+def join_breadcrumbs(values):
+    return " > ".join(value.strip() for value in values if value.strip())
+
+
+def present(_):
+    return True
+
+
+# --- eBay field tables ---
+
+PRODUCT_SCOPES = {
+    'main': (css('#mainContent'), xpath('/html/body')),
+    'price': (css('div.x-price-section'), css('#mainContent')),
+    'seller': (css('div.x-sellercard-atf'), css('#mainContent')),
+    'returns': (css('div.ux-labels-values--returns'),),
+}
+
+PRODUCT_FIELDS = (
+    FieldSpec('title', (css('h1.x-item-title__mainTitle span.ux-textspans--BOLD::text'),),
+              scope='main', process=strip, required=True),
+    FieldSpec('price', (css('div[data-testid="x-price-approx"] span.x-price-approx__price span.ux-textspans::text'),
+                        css('div[data-testid="x-price-primary"] span.ux-textspans::text')),
+              scope='price', process=strip, accept=lambda price: "US $" in price, required=True),
+    FieldSpec('category', (css('nav.breadcrumbs ul li a span::text'),
+                           xpath(".//nav[contains(@aria-label, 'breadcrumb')]//li//a/descendant-or-self::*/text()")),
+              scope='main', many=True, process=join_breadcrumbs),
+    FieldSpec('condition', (css('div.x-item-condition-text span.ux-textspans::text'),), scope='main', process=strip),
+    # Brand and location are searched in the whole page: a listing can have several
+    # specifics and shipping sections, and the first one need not hold the field
+    FieldSpec('brand', (xpath(".//dl[contains(@class, 'ux-labels-values--brand')]/dd//span[@class='ux-textspans']/text()"),),
+              process=strip),
+    FieldSpec('location', (xpath(".//span[contains(@class, 'ux-textspans--SECONDARY')"
+                                 " and starts-with(normalize-space(.), 'Located in:')]/text()"),),
+              process=lambda text: text.replace('Located in:', '').strip()),
+    FieldSpec('return_policy', (xpath(".//div[@class='ux-labels-values__values-content']//text()"),),
+              scope='returns', process=strip),
+    FieldSpec('seller_name', (css('div.x-sellercard-atf__info__about-seller a span.ux-textspans--BOLD::text'),),
+              scope='seller', process=strip),
+    FieldSpec('seller_feedback_count', (css('div.x-sellercard-atf__about-seller-item span.ux-textspans--SECONDARY::text'),),
+              scope='seller', process=lambda text: text.strip('()')),
+    FieldSpec('seller_positive_feedback_percentage',
+              (css('div.x-sellercard-atf__data-item button span.ux-textspans--PSEUDOLINK::text'),),
+              scope='seller', process=strip),
+    FieldSpec('seller_link', (css('div.x-sellercard-atf__info__about-seller a::attr(href)'),), scope='seller'),
+    FieldSpec('top_rated_seller', (css('span.ux-program-badge svg use[href="#icon-top-rated-seller-24"]'),),
+              scope='seller', process=present, default=False),
+    FieldSpec('image_urls', (css('div.ux-image-grid button.ux-image-grid-item img[src*="s-l"]::attr(src)'),
+                             xpath('.//*[@id="PicturePanel"]/div[1]/div/div[1]/div[1]/div[1]/div[3]/div/img/@src')),
+              scope='main', many=True, required=True),
+)
+
+# Evaluated against each search result card (<li class="s-item">)
+SRP_CARD_FIELDS = (
+    FieldSpec('title', (css('.s-item__title span::text'),), process=strip, default=''),
+    FieldSpec('price', (css('.s-item__price ::text'),), many=True, process=join_words, default=''),
+    FieldSpec('condition', (css('.s-item__subtitle .SECONDARY_INFO::text'),), process=strip_or_none),
+    FieldSpec('shipping', (css('.s-item__shipping ::text'),), many=True, process=join_words_or_none),
+    FieldSpec('seller_info', (css('.s-item__seller-info-text::text'),), process=strip_or_none),
+    FieldSpec('thumbnail_url', (css('.s-item__image-wrapper img::attr(src)'),
+                                css('.s-item__image-wrapper img::attr(data-src)')), accept=bool),
+)
@@ -0,0 +1,162 @@
+# Persistent response cache for Scrapy's HttpCacheMiddleware.
+#
+# EndpointCachePolicy decides what is cached: autosuggest, search result,
+# item and description responses with a 200 status, never challenge pages,
+# and Playwright renders only when asked for (HTTPCACHE_CACHE_RENDERS or
+# meta['cache_render']). SqliteCacheStorage keeps the responses in a single
+# SQLite file with compressed bodies, a TTL per endpoint class
+# (HTTPCACHE_ENDPOINT_TTLS) and least-recently-used eviction once the stored
+# size exceeds HTTPCACHE_MAX_BYTES.
+
+import logging
+import os
+import sqlite3
+import time
+import zlib
+
+from scrapy.extensions.httpcache import DummyPolicy
+from scrapy.http import Headers
+from scrapy.responsetypes import responsetypes
+from scrapy.utils.project import data_path
+from w3lib.http import headers_dict_to_raw, headers_raw_to_dict
+
+from EbayScrapper.endpoints import ITEM, classify_url
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+
+def _is_render(request):
+    return bool(request.meta.get('playwright'))
+
+
+class EndpointCachePolicy(DummyPolicy):
+    def __init__(self, settings):
+        super().__init__(settings)
+        self.endpoint_ttls = settings.getdict('HTTPCACHE_ENDPOINT_TTLS')
+        self.cache_renders = settings.getbool('HTTPCACHE_CACHE_RENDERS')
+
+    def should_cache_request(self, request):
+        if not super().should_cache_request(request):
+            return False
+        if _is_render(request) and not request.meta.get('cache_render', self.cache_renders):
+            return False
+        return classify_url(request.url) in self.endpoint_ttls
+
+    def should_cache_response(self, response, request):
+        return response.status == 200 and "splashui/challenge" not in response.url
+
+
+class SqliteCacheStorage:
+    # Entries are keyed by request fingerprint; renders get their own key so a
+    # plain HTTP copy of a product page is never served to a browser request.
+
+    def __init__(self, settings):
+        self.path = data_path(settings.get('HTTPCACHE_DIR'), createdir=True)
+        self.endpoint_ttls = settings.getdict('HTTPCACHE_ENDPOINT_TTLS')
+        self.max_bytes = settings.getint('HTTPCACHE_MAX_BYTES')
+        self.compression = settings.get('HTTPCACHE_COMPRESSION', 'zlib')
+        if self.compression == 'zstd' and zstandard is None:
+            logger.warning("HTTPCACHE_COMPRESSION = 'zstd' needs the zstandard package; using zlib")
+            self.compression = 'zlib'
+        self.conn = None
+        self.total_bytes = 0
+
+    def open_spider(self, spider):
+        self._fingerprinter = spider.crawler.request_fingerprinter
+        self._stats = spider.crawler.stats
+        self.conn = sqlite3.connect(os.path.join(self.path, f"{spider.name}.sqlite"), timeout=30, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            " key TEXT PRIMARY KEY,"
+            " endpoint TEXT NOT NULL,"
+            " url TEXT NOT NULL,"
+            " status INTEGER NOT NULL,"
+            " headers BLOB NOT NULL,"
+            " body BLOB NOT NULL,"
+            " codec TEXT NOT NULL,"
+            " size INTEGER NOT NULL,"
+            " stored_at REAL NOT NULL,"
+            " accessed_at REAL NOT NULL)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS responses_lru ON responses (accessed_at)")
+        self.total_bytes = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        logger.debug(f"Using SQLite cache storage in {self.path} ({self.total_bytes} bytes)", extra={'spider': spider})
+
+    def close_spider(self, spider):
+        self._stats.set_value('httpcache/stored_bytes', self.total_bytes)
+        self.conn.close()
+
+    def _key(self, request):
+        key = self._fingerprinter.fingerprint(request).hex()
+        return f"{key}:render" if _is_render(request) else key
+
+    def _ttl(self, request):
+        endpoint = ITEM if _is_render(request) else classify_url(request.url)
+        return endpoint, self.endpoint_ttls.get(endpoint, 0)
+
+    def retrieve_response(self, spider, request):
+        key = self._key(request)
+        row = self.conn.execute(
+            "SELECT url, status, headers, body, codec, size, stored_at FROM responses WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        url, status, raw_headers, body, codec, size, stored_at = row
+        _, ttl = self._ttl(request)
+        now = time.time()
+        if now - stored_at > ttl:
+            self._delete(key, size)
+            self._stats.inc_value('httpcache/expired')
+            return None
+        self.conn.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+        body = zstandard.ZstdDecompressor().decompress(body) if codec == 'zstd' else zlib.decompress(body)
+        headers = Headers(headers_raw_to_dict(raw_headers))
+        respcls = responsetypes.from_args(headers=headers, url=url, body=body)
+        return respcls(url=url, headers=headers, status=status, body=body)
+
+    def store_response(self, spider, request, response):
+        endpoint, ttl = self._ttl(request)
+        if ttl <= 0:
+            return
+        if self.compression == 'zstd':
+            body = zstandard.ZstdCompressor(level=3).compress(response.body)
+        else:
+            body = zlib.compress(response.body, 6)
+        raw_headers = headers_dict_to_raw(response.headers)
+        size = len(body) + len(raw_headers)
+        key = self._key(request)
+        previous = self.conn.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+        now = time.time()
+        self.conn.execute(
+            "INSERT OR REPLACE INTO responses (key, endpoint, url, status, headers, body, codec, size, stored_at, accessed_at)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (key, endpoint, response.url, response.status, raw_headers, body, self.compression, size, now, now),
+        )
+        self.total_bytes += size - (previous[0] if previous else 0)
+        if self.total_bytes > self.max_bytes:
+            self._evict()
+
+    def _delete(self, key, size):
+        self.conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+        self.total_bytes -= size
+
+    def _evict(self):
+        # Drops least recently used entries until the cache is back under 90% of its budget
+        target = self.max_bytes * 0.9
+        evicted = 0
+        rows = self.conn.execute("SELECT key, size FROM responses ORDER BY accessed_at").fetchall()
+        self.conn.execute("BEGIN")
+        for key, size in rows:
+            if self.total_bytes <= target:
+                break
+            self._delete(key, size)
+            evicted += 1
+        self.conn.execute("COMMIT")
+        self._stats.inc_value('httpcache/evicted', evicted)
@@ -1,3 +1,6 @@
+from dataclasses import dataclass, field
+from typing import List, Optional
+
 from scrapy.item import Item, Field
 
 class EbayscrapperItem(Item):
@@ -6,7 +9,7 @@ class EbayscrapperItem(Item):
     price = Field()
     link = Field()
     description = Field()
-    image_urls = Field()  # For ImagesPipeline: list of image URLs
+    image_urls = Field()  # List of image URLs; archived by ImageArchivePipeline when IMAGES_ARCHIVE_DIR is set
     product_id = Field()  # Unique product identifier
     category = Field()    # Category derived from breadcrumbs or search context
     condition = Field()
@@ -23,4 +26,65 @@ class EbayscrapperItem(Item):
 
     # Meta Search Info
     derived_from_keyword = Field()
-    category_context_from_search = Field() # Category used in search URL
\ No newline at end of file
+    derived_from_keywords = Field() # Every keyword whose search surfaced this listing (duplicates are not re-fetched)
+    category_context_from_search = Field() # Category used in search URL
+
+
+class EbaySearchResultItem(Item):
+    # Listing data shown on a search results card (output_mode "search_only" / "hybrid")
+    product_id = Field()
+    title = Field()
+    price = Field()         # As shown on the card, e.g. "$1,999.99" or "$10.00 to $20.00"
+    condition = Field()
+    shipping = Field()      # e.g. "Free shipping", "+$25.00 shipping"
+    seller_info = Field()   # e.g. "seller123 (1,234) 99.8%"
+    thumbnail_url = Field()
+    link = Field()
+
+    # Meta Search Info
+    derived_from_keyword = Field()
+    category_context_from_search = Field()
+    search_page_number = Field()
+
+
+class ListingChangeItem(Item):
+    # Change-detection output (-a change_store_path=...), see EbayScrapper.changes
+    event = Field()           # "new", "price_changed", "changed", "relisted" or "disappeared"
+    product_id = Field()
+    link = Field()
+    changes = Field()         # Field name -> new value; the full record for "new", empty for "disappeared"
+    previous_price = Field()  # Price before a "price_changed" (or a repriced "relisted"); last price for "disappeared"
+    derived_from_keyword = Field()
+    detected_at = Field()     # ISO 8601, UTC
+
+
+@dataclass(slots=True)
+class ListingRecord:
+    # Typed listing built from an EbayscrapperItem as the spider emits it (or by NormalizationPipeline).
+    # Slotted rather than dict-backed, so large in-flight item queues stay small.
+    product_id: Optional[str] = None
+    title: Optional[str] = None
+    price: Optional[str] = None             # As displayed, e.g. "US $1,999.99"
+    price_amount: Optional[float] = None    # 1999.99
+    price_currency: Optional[str] = None    # "USD"
+    link: Optional[str] = None
+    description: Optional[str] = None
+    image_urls: List[str] = field(default_factory=list)
+    category: Optional[str] = None          # Breadcrumbs joined with " > "
+    category_path: List[str] = field(default_factory=list)
+    condition: Optional[str] = None
+    brand: Optional[str] = None
+    location: Optional[str] = None
+    return_policy: Optional[str] = None
+
+    # Seller information
+    seller_name: Optional[str] = None
+    seller_positive_feedback_percentage: Optional[float] = None  # 99.5
+    seller_feedback_count: Optional[int] = None                  # 12345
+    seller_link: Optional[str] = None
+    top_rated_seller: bool = False
+
+    # Meta Search Info
+    derived_from_keyword: Optional[str] = None
+    derived_from_keywords: List[str] = field(default_factory=list)
+    category_context_from_search: Optional[str] = None
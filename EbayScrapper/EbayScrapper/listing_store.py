@@ -0,0 +1,58 @@
+# On-disk record of previously scraped listings for incremental crawls.
+#
+# Each listing is stored with the title and price shown on the search results
+# page when it was last scraped. On the next run a listing whose SRP data is
+# unchanged and whose record is younger than the TTL does not need another
+# product page render.
+
+import sqlite3
+import time
+
+
+class ListingStore:
+    def __init__(self, path, commit_every=100):
+        self.path = path
+        self.commit_every = commit_every
+        self._pending_writes = 0
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS listings ("
+            " product_id TEXT PRIMARY KEY,"
+            " srp_title TEXT,"
+            " srp_price TEXT,"
+            " scraped_at REAL NOT NULL)"
+        )
+        self.conn.commit()
+
+    def get(self, product_id):
+        # Returns (srp_title, srp_price, scraped_at) or None
+        return self.conn.execute(
+            "SELECT srp_title, srp_price, scraped_at FROM listings WHERE product_id = ?", (product_id,)
+        ).fetchone()
+
+    def is_fresh(self, product_id, srp_title, srp_price, ttl, now=None):
+        # True when the listing was scraped within `ttl` seconds and its SRP title/price are unchanged.
+        row = self.get(product_id)
+        if row is None:
+            return False
+        stored_title, stored_price, scraped_at = row
+        now = time.time() if now is None else now
+        return stored_title == srp_title and stored_price == srp_price and now - scraped_at < ttl
+
+    def record(self, product_id, srp_title, srp_price, scraped_at=None):
+        self.conn.execute(
+            "INSERT INTO listings (product_id, srp_title, srp_price, scraped_at) VALUES (?, ?, ?, ?)"
+            " ON CONFLICT(product_id) DO UPDATE SET"
+            " srp_title = excluded.srp_title, srp_price = excluded.srp_price, scraped_at = excluded.scraped_at",
+            (product_id, srp_title, srp_price, time.time() if scraped_at is None else scraped_at),
+        )
+        self._pending_writes += 1
+        if self._pending_writes >= self.commit_every:
+            self.conn.commit()
+            self._pending_writes = 0
+
+    def close(self):
+        self.conn.commit()
+        self.conn.close()
@@ -0,0 +1,249 @@
+# Per-stage timings and per-endpoint counters for a crawl.
+#
+# MetricsRegistry holds labelled counters and histograms. The spider owns one
+# (spider.metrics) and records the browser stages it alone can see: the
+# challenge wait, the description iframe wait, page.content() and HTML
+# parsing/extraction, plus extraction failures per field and duplicates.
+# MetricsExtension records the rest from Scrapy signals (time spent queued in
+# the scheduler and downloader, download/navigation time, requests, responses
+# and challenges per endpoint), serves the registry as Prometheus text on
+# http://METRICS_HOST:METRICS_PORT/metrics while the crawl runs and copies a
+# summary of every series into the crawl stats under "metrics/..." at close.
+
+import bisect
+import time
+from contextlib import contextmanager
+
+from scrapy import signals
+from scrapy.exceptions import NotConfigured
+from twisted.internet.error import CannotListenError
+from twisted.web import resource, server
+
+from EbayScrapper.endpoints import classify_url
+
+# Seconds; spans a parsed page (milliseconds) up to the 60 s challenge wait
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120)
+
+DESCRIPTIONS = {
+    'ebay_queue_wait_seconds': "Time from scheduling a request until it reaches the downloader",
+    'ebay_download_seconds': "Download time; browser navigation for handler=\"browser\"",
+    'ebay_challenge_wait_seconds': "Time spent waiting for a splashui/challenge page to pass",
+    'ebay_description_wait_seconds': "Time spent waiting for and reading the #desc_ifr description iframe",
+    'ebay_page_content_seconds': "Time taken by page.content() on a rendered product page",
+    'ebay_debug_capture_seconds': "Time spent grabbing HTML and a screenshot of a failed render",
+    'ebay_parse_seconds': "HTML parsing and field extraction time",
+    'ebay_requests_total': "Requests sent to the downloader",
+    'ebay_responses_total': "Responses received, by status",
+    'ebay_cache_hits_total': "Responses served from the HTTP cache",
+    'ebay_challenges_total': "Responses that were a challenge page or a 403/429",
+    'ebay_download_errors_total': "Requests that reached the spider's errback",
+    'ebay_spider_errors_total': "Callbacks that raised",
+    'ebay_extraction_failures_total': "Required fields that came out empty",
+    'ebay_duplicates_total': "Listings or work units dropped as duplicates",
+    'ebay_items_total': "Items scraped",
+}
+
+
+def _label_key(labels):
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+
+def _format_labels(key, extra=()):
+    pairs = [*key, *extra]
+    if not pairs:
+        return ''
+    escaped = (value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+
+class Histogram:
+    __slots__ = ('buckets', 'counts', 'sum', 'count', 'max')
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # the last one is +Inf
+        self.sum = 0.0
+        self.count = 0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+        if value > self.max:
+            self.max = value
+
+    def quantile(self, q):
+        # Upper bound of the bucket holding the q-th observation (the max for +Inf)
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+
+class MetricsRegistry:
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counters = {}    # name -> {label key: value}
+        self.histograms = {}  # name -> {label key: Histogram}
+
+    def inc(self, name, amount=1, **labels):
+        series = self.counters.setdefault(name, {})
+        key = _label_key(labels)
+        series[key] = series.get(key, 0) + amount
+
+    def observe(self, name, seconds, **labels):
+        series = self.histograms.setdefault(name, {})
+        key = _label_key(labels)
+        histogram = series.get(key)
+        if histogram is None:
+            histogram = series[key] = Histogram(self.buckets)
+        histogram.observe(seconds)
+
+    @contextmanager
+    def timer(self, name, **labels):
+        # Records the block's wall time, including time spent awaiting the browser
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def render_prometheus(self):
+        lines = []
+        for name, series in sorted(self.counters.items()):
+            if name in DESCRIPTIONS:
+                lines.append(f"# HELP {name} {DESCRIPTIONS[name]}")
+            lines.append(f"# TYPE {name} counter")
+            for key, value in sorted(series.items()):
+                lines.append(f"{name}{_format_labels(key)} {value}")
+        for name, series in sorted(self.histograms.items()):
+            if name in DESCRIPTIONS:
+                lines.append(f"# HELP {name} {DESCRIPTIONS[name]}")
+            lines.append(f"# TYPE {name} histogram")
+            for key, histogram in sorted(series.items()):
+                cumulative = 0
+                for bound, count in zip((*histogram.buckets, '+Inf'), histogram.counts):
+                    cumulative += count
+                    lines.append(f"{name}_bucket{_format_labels(key, (('le', str(bound)),))} {cumulative}")
+                lines.append(f"{name}_sum{_format_labels(key)} {histogram.sum:.6f}")
+                lines.append(f"{name}_count{_format_labels(key)} {histogram.count}")
+        return '\n'.join(lines) + '\n'
+
+    def to_stats(self, prefix='metrics'):
+        # Flat {stat name: value}: counters as they are, histograms as count/sum/p50/p95/max
+        values = {}
+        for name, series in self.counters.items():
+            for key, value in series.items():
+                values['/'.join((prefix, name, *(value for _, value in key)))] = value
+        for name, series in self.histograms.items():
+            for key, histogram in series.items():
+                base = '/'.join((prefix, name, *(value for _, value in key)))
+                values[f'{base}/count'] = histogram.count
+                values[f'{base}/sum'] = round(histogram.sum, 3)
+                values[f'{base}/p50'] = round(histogram.quantile(0.5), 3)
+                values[f'{base}/p95'] = round(histogram.quantile(0.95), 3)
+                values[f'{base}/max'] = round(histogram.max, 3)
+        return values
+
+
+class _MetricsResource(resource.Resource):
+    isLeaf = True
+
+    def __init__(self, registry):
+        super().__init__()
+        self.registry = registry
+
+    def render_GET(self, request):
+        request.setHeader(b'Content-Type', b'text/plain; version=0.0.4; charset=utf-8')
+        return self.registry.render_prometheus().encode('utf-8')
+
+
+def _endpoint(request):
+    return request.meta.get('ebay_endpoint') or classify_url(request.url)
+
+
+class MetricsExtension:
+    def __init__(self, crawler):
+        settings = crawler.settings
+        if not settings.getbool('METRICS_ENABLED'):
+            raise NotConfigured
+        self.crawler = crawler
+        self.host = settings.get('METRICS_HOST', '127.0.0.1')
+        self.port = settings.getint('METRICS_PORT')
+        # Sharded workers on one host start from the same port and take the next free one
+        self.port_attempts = settings.getint('METRICS_PORT_ATTEMPTS', 16)
+        self.registry = None
+        self.listener = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        ext = cls(crawler)
+        crawler.signals.connect(ext.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(ext.spider_closed, signal=signals.spider_closed)
+        crawler.signals.connect(ext.request_scheduled, signal=signals.request_scheduled)
+        crawler.signals.connect(ext.request_reached_downloader, signal=signals.request_reached_downloader)
+        crawler.signals.connect(ext.response_received, signal=signals.response_received)
+        crawler.signals.connect(ext.item_scraped, signal=signals.item_scraped)
+        crawler.signals.connect(ext.spider_error, signal=signals.spider_error)
+        return ext
+
+    def spider_opened(self, spider):
+        # Shares the spider's registry so its stage timings land on the same endpoint
+        self.registry = getattr(spider, 'metrics', None)
+        if self.registry is None:
+            self.registry = spider.metrics = MetricsRegistry()
+        if self.port:
+            self._listen(spider)
+
+    def _listen(self, spider):
+        from twisted.internet import reactor
+
+        site = server.Site(_MetricsResource(self.registry))
+        for port in range(self.port, self.port + self.port_attempts):
+            try:
+                self.listener = reactor.listenTCP(port, site, interface=self.host)
+            except CannotListenError:
+                continue
+            spider.logger.info(f"Serving Prometheus metrics on http://{self.host}:{port}/metrics")
+            return
+        spider.logger.warning(f"No free port for the metrics endpoint in {self.port}-{port}; not serving metrics")
+
+    def spider_closed(self, spider, reason):
+        stats = self.crawler.stats
+        for name, value in self.registry.to_stats().items():
+            stats.set_value(name, value)
+        if self.listener is not None:
+            return self.listener.stopListening()
+
+    def request_scheduled(self, request, spider):
+        request.meta['metrics_scheduled_at'] = time.monotonic()
+
+    def request_reached_downloader(self, request, spider):
+        endpoint = _endpoint(request)
+        scheduled_at = request.meta.pop('metrics_scheduled_at', None)
+        if scheduled_at is not None:
+            self.registry.observe('ebay_queue_wait_seconds', time.monotonic() - scheduled_at, endpoint=endpoint)
+        self.registry.inc('ebay_requests_total', endpoint=endpoint)
+
+    def response_received(self, response, request, spider):
+        endpoint = _endpoint(request)
+        self.registry.inc('ebay_responses_total', endpoint=endpoint, status=response.status)
+        if 'cached' in response.flags:
+            self.registry.inc('ebay_cache_hits_total', endpoint=endpoint)
+            return
+        latency = request.meta.get('download_latency')
+        if latency is not None:
+            handler = 'browser' if request.meta.get('playwright') else 'http'
+            self.registry.observe('ebay_download_seconds', latency, endpoint=endpoint, handler=handler)
+        if response.status in (403, 429) or "splashui/challenge" in response.url:
+            self.registry.inc('ebay_challenges_total', endpoint=endpoint)
+
+    def item_scraped(self, item, response, spider):
+        self.registry.inc('ebay_items_total', type=type(item).__name__)
+
+    def spider_error(self, failure, response, spider):
+        self.registry.inc('ebay_spider_errors_total', endpoint=classify_url(response.url))
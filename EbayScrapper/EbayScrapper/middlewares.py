@@ -3,10 +3,19 @@
 # See documentation in:
 # https://docs.scrapy.org/en/latest/topics/spider-middleware.html
 
-from scrapy import signals
+from scrapy import Request, signals
+from scrapy.exceptions import IgnoreRequest, NotConfigured
+from w3lib.http import basic_auth_header
 
 # useful for handling different item types with a single interface
+import asyncio
 import random
+import time
+
+from EbayScrapper.browser import browser_context_retired
+from EbayScrapper.endpoints import AUTOSUG, classify_url
+from EbayScrapper.proxies import CHALLENGE, CLOSED, ERROR, EVICTED, OK, ProxyPool, load_proxy_config
+from EbayScrapper.service import JOB_META_KEYS, RUNNING
 
 class EbayscrapperSpiderMiddleware:
     # Not all methods need to be defined. If a method is not defined,
@@ -113,4 +122,446 @@ class UARotatorMiddleware:
 
     def process_request(self, request, spider):
         user_agent = random.choice(self.user_agents)
-        request.headers['User-Agent'] = user_agent
\ No newline at end of file
+        request.headers['User-Agent'] = user_agent
+
+
+class RequestRoutingMiddleware:
+    # Decides which download handler and downloader slot each request uses.
+    #
+    # "split" (default): only requests flagged with meta['playwright'] are
+    #   rendered by the browser; autosuggest and search pages go through
+    #   Scrapy's plain HTTP handler. Browser renders are pinned to their own
+    #   downloader slot so they get a separate concurrency budget (see
+    #   DOWNLOAD_SLOTS in settings.py).
+    # "browser": every HTML page is rendered. Autosuggest JSON is still fetched
+    #   over HTTP. Mostly useful for comparison benchmarks.
+    modes = ("split", "browser")
+
+    def __init__(self, mode, browser_slot):
+        if mode not in self.modes:
+            raise NotConfigured(f"Unknown EBAY_REQUEST_ROUTING mode: {mode!r}")
+        self.mode = mode
+        self.browser_slot = browser_slot
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls(
+            crawler.settings.get('EBAY_REQUEST_ROUTING', 'split'),
+            crawler.settings.get('PLAYWRIGHT_DOWNLOAD_SLOT', 'playwright'),
+        )
+
+    def process_request(self, request, spider):
+        if self.mode == "browser" and classify_url(request.url) != AUTOSUG:
+            request.meta.setdefault('playwright', True)
+        if request.meta.get('playwright'):
+            request.meta.setdefault('download_slot', self.browser_slot)
+        return None
+
+
+class EndpointThrottle:
+    # AIMD controller for one endpoint class: one step up after a healthy window
+    # of responses, an immediate halving (and doubled delay) on a challenge.
+
+    def __init__(self, endpoint, min_concurrency, max_concurrency, target_latency,
+                 challenge_threshold, window, min_delay, max_delay, cooldown):
+        self.endpoint = endpoint
+        self.min_concurrency = min_concurrency
+        self.max_concurrency = max_concurrency
+        self.target_latency = target_latency
+        self.challenge_threshold = challenge_threshold
+        self.window = window
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.cooldown = cooldown
+        self.concurrency = None  # adopted from the first downloader slot seen
+        self.delay = None
+        self.latency_ewma = None
+        self.slots = set()
+        self.responses = 0
+        self.challenges = 0
+        self.errors = 0
+        self._window_responses = 0
+        self._window_challenges = 0
+        self._window_errors = 0
+        self._last_decrease = 0.0
+
+    def adopt(self, slot):
+        if self.concurrency is None:
+            self.concurrency = min(max(slot.concurrency, self.min_concurrency), self.max_concurrency)
+            self.delay = min(max(slot.delay, self.min_delay), self.max_delay)
+
+    def observe(self, latency, challenged, now):
+        # Returns True when the limits changed.
+        self.responses += 1
+        self._window_responses += 1
+        if latency is not None:
+            self.latency_ewma = latency if self.latency_ewma is None else 0.8 * self.latency_ewma + 0.2 * latency
+        if challenged:
+            self.challenges += 1
+            self._window_challenges += 1
+            if now - self._last_decrease >= self.cooldown:
+                return self._decrease(now)
+        if self._window_responses >= self.window:
+            return self._close_window()
+        return False
+
+    def observe_error(self):
+        self.errors += 1
+        self._window_errors += 1
+
+    def _close_window(self):
+        challenge_rate = self._window_challenges / self._window_responses
+        healthy = (
+            challenge_rate <= self.challenge_threshold
+            and self._window_errors == 0
+            and (self.latency_ewma is None or self.latency_ewma <= self.target_latency)
+        )
+        self._window_responses = self._window_challenges = self._window_errors = 0
+        if not healthy or self.concurrency is None:
+            return False
+        changed = self.concurrency < self.max_concurrency or self.delay > self.min_delay
+        self.concurrency = min(self.concurrency + 1, self.max_concurrency)
+        self.delay = max(self.delay * 0.75, self.min_delay)
+        return changed
+
+    def _decrease(self, now):
+        if self.concurrency is None:
+            return False
+        self._last_decrease = now
+        self._window_responses = self._window_challenges = self._window_errors = 0
+        self.concurrency = max(self.concurrency // 2, self.min_concurrency)
+        self.delay = min(max(self.delay * 2, 1.0), self.max_delay)
+        return True
+
+
+class AdaptiveConcurrencyMiddleware:
+    # Raises and lowers downloader slot concurrency/delay per endpoint class
+    # (autosug, srp, item, description) from observed latency and challenge
+    # rate. Requests without an explicit download_slot get one per endpoint
+    # class so search and product traffic on www.ebay.com are throttled
+    # independently. Current limits and counters are published in the crawl
+    # stats under "adaptive/<endpoint>/..." and logged whenever they change.
+
+    def __init__(self, crawler):
+        settings = crawler.settings
+        if not settings.getbool('ADAPTIVE_CONCURRENCY_ENABLED'):
+            raise NotConfigured
+        self.crawler = crawler
+        self.stats = crawler.stats
+        self.limits = settings.getdict('ADAPTIVE_CONCURRENCY_LIMITS')
+        self.target_latency = settings.getdict('ADAPTIVE_TARGET_LATENCY')
+        self.challenge_threshold = settings.getfloat('ADAPTIVE_CHALLENGE_THRESHOLD', 0.02)
+        self.window = settings.getint('ADAPTIVE_WINDOW', 20)
+        self.min_delay = settings.getfloat('ADAPTIVE_MIN_DELAY', 0.0)
+        self.max_delay = settings.getfloat('ADAPTIVE_MAX_DELAY', 30.0)
+        self.cooldown = settings.getfloat('ADAPTIVE_BACKOFF_COOLDOWN', 10.0)
+        self.throttles = {}
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls(crawler)
+
+    def _throttle(self, endpoint):
+        throttle = self.throttles.get(endpoint)
+        if throttle is None:
+            min_conc, max_conc = self.limits.get(endpoint, self.limits.get('other', (1, 8)))
+            throttle = EndpointThrottle(
+                endpoint, int(min_conc), int(max_conc),
+                float(self.target_latency.get(endpoint, self.target_latency.get('other', 5.0))),
+                self.challenge_threshold, self.window, self.min_delay, self.max_delay, self.cooldown,
+            )
+            self.throttles[endpoint] = throttle
+        return throttle
+
+    def _apply(self, throttle, spider):
+        for key in throttle.slots:
+            slot = self.crawler.engine.downloader.slots.get(key)
+            if slot is not None:
+                slot.concurrency = throttle.concurrency
+                slot.delay = throttle.delay
+        prefix = f'adaptive/{throttle.endpoint}'
+        self.stats.set_value(f'{prefix}/concurrency', throttle.concurrency)
+        self.stats.set_value(f'{prefix}/delay', round(throttle.delay, 3))
+        if throttle.latency_ewma is not None:
+            self.stats.set_value(f'{prefix}/latency_ewma', round(throttle.latency_ewma, 3))
+
+    def process_request(self, request, spider):
+        endpoint = request.meta.setdefault('ebay_endpoint', classify_url(request.url))
+        request.meta.setdefault('download_slot', f'ebay-{endpoint}')
+        return None
+
+    def process_response(self, request, response, spider):
+        if 'cached' in response.flags:
+            # Served by the HTTP cache; says nothing about the endpoint's health
+            return response
+        endpoint = request.meta.get('ebay_endpoint') or classify_url(request.url)
+        throttle = self._throttle(endpoint)
+        slot_key = request.meta.get('download_slot')
+        # Proxy slots keep the limits of their proxy (see ProxyPoolMiddleware)
+        slot = None if request.meta.get('proxy_name') else self.crawler.engine.downloader.slots.get(slot_key)
+        if slot is not None:
+            throttle.slots.add(slot_key)
+            throttle.adopt(slot)
+
+        challenged = response.status in (403, 429) or "splashui/challenge" in response.url
+        before = (throttle.concurrency, throttle.delay)
+        changed = throttle.observe(request.meta.get('download_latency'), challenged, time.time())
+        prefix = f'adaptive/{endpoint}'
+        self.stats.inc_value(f'{prefix}/responses')
+        if challenged:
+            self.stats.inc_value(f'{prefix}/challenges')
+        if changed or slot is not None and (slot.concurrency, slot.delay) != (throttle.concurrency, throttle.delay):
+            self._apply(throttle, spider)
+        if changed:
+            spider.logger.info(
+                f"Adaptive concurrency for {endpoint}: {before[0]} -> {throttle.concurrency} "
+                f"(delay {before[1]:.2f}s -> {throttle.delay:.2f}s, latency {throttle.latency_ewma or 0:.2f}s, "
+                f"challenges {throttle.challenges}/{throttle.responses})"
+            )
+        return response
+
+    def process_exception(self, request, exception, spider):
+        endpoint = request.meta.get('ebay_endpoint') or classify_url(request.url)
+        self._throttle(endpoint).observe_error()
+        self.stats.inc_value(f'adaptive/{endpoint}/errors')
+        return None
+
+
+class WorkUnitMiddleware:
+    # Spider middleware for sharded and checkpointed crawls (MainSpider.work_queue,
+    # MainSpider.checkpoint). Once the callback for a work unit has produced all
+    # of its output, the unit is marked done in the shared queue or checkpoint,
+    # unless that output hands it on (a description or browser fallback request
+    # carrying the same work_unit).
+    # A callback that raises puts its unit back for another attempt. In sharded
+    # mode every settled unit frees a prefetch slot, which is refilled from the queue.
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls()
+
+    def _settle(self, key, handed_off, spider):
+        if handed_off:
+            return []
+        spider.complete_work_unit(key)
+        return spider.claim_work()
+
+    def process_spider_output(self, response, result, spider):
+        key = response.meta.get('work_unit')
+        if not key:
+            yield from result
+            return
+        handed_off = False
+        for output in result:
+            handed_off = handed_off or isinstance(output, Request) and output.meta.get('work_unit') == key
+            yield output
+        yield from self._settle(key, handed_off, spider)
+
+    async def process_spider_output_async(self, response, result, spider):
+        key = response.meta.get('work_unit')
+        if not key:
+            async for output in result:
+                yield output
+            return
+        handed_off = False
+        async for output in result:
+            handed_off = handed_off or isinstance(output, Request) and output.meta.get('work_unit') == key
+            yield output
+        for request in self._settle(key, handed_off, spider):
+            yield request
+
+    def process_spider_exception(self, response, exception, spider):
+        key = response.meta.get('work_unit')
+        if key:
+            spider.fail_work_unit(key)
+        return None
+
+
+class JobMiddleware:
+    # Spider middleware for the crawl service (see EbayScrapper.service). Requests
+    # produced from a job's response inherit its job_id and per-job limits, so
+    # the whole crawl tree of a job is scheduled, filtered and counted as that
+    # job. Output of a job that was cancelled or has finished is dropped.
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls()
+
+    def _job_meta(self, response, spider):
+        job_meta = {key: response.meta[key] for key in JOB_META_KEYS if key in response.meta}
+        if not job_meta:
+            return None, True
+        job = spider.jobs.get(job_meta.get('job_id'))
+        return job_meta, job is not None and job.state == RUNNING
+
+    def _tag(self, output, job_meta):
+        if isinstance(output, Request):
+            for key, value in job_meta.items():
+                output.meta.setdefault(key, value)
+        return output
+
+    def process_spider_output(self, response, result, spider):
+        job_meta, running = self._job_meta(response, spider)
+        for output in result:
+            if not running:
+                spider.crawler.stats.inc_value('service/dropped_output')
+                continue
+            yield self._tag(output, job_meta) if job_meta else output
+
+    async def process_spider_output_async(self, response, result, spider):
+        job_meta, running = self._job_meta(response, spider)
+        async for output in result:
+            if not running:
+                spider.crawler.stats.inc_value('service/dropped_output')
+                continue
+            yield self._tag(output, job_meta) if job_meta else output
+
+
+class ProxyPoolMiddleware:
+    # Spreads downloads across the exits in PROXY_POOL / PROXY_POOL_FILE (see
+    # EbayScrapper.proxies). It sits after Scrapy's retry, redirect, proxy and
+    # cache middlewares, so every download attempt gets an exit (a retry may
+    # get another one) and every raw response or error is scored before it is
+    # retried or followed. Each proxy has its own downloader slot carrying its
+    # concurrency and delay. Browser renders run in a Playwright context pinned
+    # to their proxy, for as many proxies at a time as PLAYWRIGHT_MAX_CONTEXTS
+    # leaves room for next to the contexts in PLAYWRIGHT_CONTEXTS.
+    # Requests with their own meta['proxy'] (use_tor) or meta['dont_proxy']
+    # are left alone. Per-proxy counters and breaker states are published in
+    # the crawl stats under "proxies/<name>/...".
+
+    def __init__(self, crawler):
+        settings = crawler.settings
+        proxies = load_proxy_config(settings)
+        self.crawler = crawler
+        self.stats = crawler.stats
+        self.pool = ProxyPool(
+            proxies,
+            window=settings.getint('PROXY_BREAKER_WINDOW', 20),
+            min_samples=settings.getint('PROXY_BREAKER_MIN_SAMPLES', 5),
+            failure_threshold=settings.getfloat('PROXY_BREAKER_FAILURE_RATE', 0.5),
+            cooldown=settings.getfloat('PROXY_BREAKER_COOLDOWN', 60.0),
+            max_cooldown=settings.getfloat('PROXY_BREAKER_MAX_COOLDOWN', 900.0),
+            max_trips=settings.getint('PROXY_BREAKER_MAX_TRIPS', 5),
+        )
+        # Contexts from PLAYWRIGHT_CONTEXTS count against PLAYWRIGHT_MAX_CONTEXTS too;
+        # a proxy context beyond the limit would wait for a free one forever
+        max_contexts = settings.getint('PLAYWRIGHT_MAX_CONTEXTS')
+        if max_contexts:
+            self.browser_limit = max_contexts - len(settings.getdict('PLAYWRIGHT_CONTEXTS'))
+            if self.browser_limit < 1:
+                raise ValueError("PLAYWRIGHT_CONTEXTS leaves no room under PLAYWRIGHT_MAX_CONTEXTS for proxy contexts")
+        else:
+            self.browser_limit = len(proxies)
+        self.browser_proxies = set()  # proxies that have a Playwright context
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        mw = cls(crawler)
+        crawler.signals.connect(mw.spider_opened, signal=signals.spider_opened)
+        return mw
+
+    def spider_opened(self, spider):
+        per_slot_settings = self.crawler.engine.downloader.per_slot_settings
+        for proxy in self.pool.proxies.values():
+            per_slot_settings[self._slot(proxy)] = {'concurrency': proxy.config.concurrency, 'delay': proxy.config.delay}
+        spider.logger.info(f"Proxy pool: {', '.join(self.pool.proxies)}")
+
+    def _slot(self, proxy):
+        return f'proxy-{proxy.name}'
+
+    def _choose(self, render):
+        if not render:
+            return self.pool.choose()
+        # New proxies only get a browser context while there is room for one
+        names = self.browser_proxies if len(self.browser_proxies) >= self.browser_limit else None
+        proxy = self.pool.choose(names)
+        if proxy is not None:
+            self.browser_proxies.add(proxy.name)
+        return proxy
+
+    async def process_request(self, request, spider):
+        meta = request.meta
+        if meta.get('dont_proxy') or ('proxy' in meta and 'proxy_name' not in meta):
+            return None
+        render = bool(meta.get('playwright'))
+        proxy = self._choose(render)
+        while proxy is None:
+            if self.pool.exhausted():
+                self.crawler.engine.close_spider(spider, 'proxy_pool_exhausted')
+                raise IgnoreRequest("Every proxy in the pool has been evicted")
+            # Every candidate is cooling down; wait for the first trial slot
+            await asyncio.sleep(self.pool.retry_in(self.browser_proxies if render else None))
+            proxy = self._choose(render)
+
+        self.pool.acquire(proxy)
+        meta['proxy_name'] = proxy.name
+        meta['proxy_in_flight'] = True
+        meta['download_slot'] = self._slot(proxy)
+        credentials = proxy.config.credentials
+        if render:
+            context_proxy = {'server': proxy.config.server}
+            if credentials:
+                context_proxy['username'], context_proxy['password'] = credentials
+            meta['playwright_context'] = f'proxy-{proxy.name}'
+            meta['playwright_context_kwargs'] = {'proxy': context_proxy}
+            meta.pop('proxy', None)
+        else:
+            meta['proxy'] = proxy.config.server
+            if credentials:
+                request.headers['Proxy-Authorization'] = basic_auth_header(*credentials)
+            else:
+                request.headers.pop('Proxy-Authorization', None)
+        return None
+
+    def _settle(self, request):
+        # The proxy that served this download attempt, once per attempt
+        if not request.meta.pop('proxy_in_flight', False):
+            return None
+        return self.pool.proxies.get(request.meta.get('proxy_name'))
+
+    def process_response(self, request, response, spider):
+        proxy = self._settle(request)
+        if proxy is None:
+            return response
+        location = response.headers.get('Location', b'')
+        if response.status in (403, 429) or "splashui/challenge" in response.url or b"splashui/challenge" in location:
+            outcome = CHALLENGE
+        elif response.status in (407, 502, 503, 504):
+            outcome = ERROR  # the proxy itself failed or refused us
+        else:
+            outcome = OK
+        self._record(proxy, outcome, request.meta.get('download_latency'), spider)
+        return response
+
+    def process_exception(self, request, exception, spider):
+        proxy = self._settle(request)
+        if proxy is not None:
+            self._record(proxy, ERROR, None, spider)
+        return None
+
+    def _record(self, proxy, outcome, latency, spider):
+        changed = self.pool.record(proxy, outcome, latency)
+        prefix = f'proxies/{proxy.name}'
+        self.stats.inc_value(f'{prefix}/requests')
+        if outcome != OK:
+            self.stats.inc_value(f'{prefix}/{outcome}s')  # errors / challenges
+        if proxy.latency_ewma is not None:
+            self.stats.set_value(f'{prefix}/latency_ewma', round(proxy.latency_ewma, 3))
+        if changed is None:
+            return
+        self.stats.set_value(f'{prefix}/state', changed)
+        if changed == EVICTED:
+            self.stats.inc_value('proxies/evicted')
+            spider.logger.warning(f"Proxy {proxy.name} evicted after {proxy.trips} consecutive breaker trips")
+            if proxy.name in self.browser_proxies:
+                self.browser_proxies.discard(proxy.name)
+                self.crawler.signals.send_catch_log(browser_context_retired, name=f'proxy-{proxy.name}')
+        elif changed == CLOSED:
+            spider.logger.info(f"Proxy {proxy.name} recovered")
+        else:
+            self.stats.inc_value(f'{prefix}/trips')
+            spider.logger.warning(
+                f"Proxy {proxy.name} circuit opened (trip {proxy.trips}, {proxy.errors} errors, "
+                f"{proxy.challenges} challenges of {proxy.requests} requests)"
+            )
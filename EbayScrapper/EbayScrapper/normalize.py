@@ -0,0 +1,116 @@
+# Parsers that turn the display strings scraped from eBay into typed values.
+#
+# NormalizationPipeline runs them once per listing so consumers get numbers and
+# lists instead of re-parsing "US $1,999.99" or "99.5% Positive feedback".
+
+import re
+
+from EbayScrapper.items import ListingRecord
+
+CURRENCY_SYMBOLS = {"US $": "USD", "$": "USD", "C $": "CAD", "AU $": "AUD", "£": "GBP", "€": "EUR"}
+PRICE_RE = re.compile(r'(?P<symbol>[A-Z]{1,2} ?\$|[$£€]|[A-Z]{3})?\s*(?P<amount>\d(?:[\d.,]*\d)?)')
+COUNT_RE = re.compile(r'(?P<number>\d[\d,]*(?:\.\d+)?)\s*(?P<suffix>[KkMm])?')
+PERCENT_RE = re.compile(r'(\d+(?:\.\d+)?)\s*%')
+IMAGE_SIZE_RE = re.compile(r'/s-l\d+\.\w+$')
+
+
+def parse_amount(text):
+    # "1,999.99" -> 1999.99 and, on European sites, "1.999,99" -> 1999.99.
+    # Whichever separator comes last is the decimal point when both appear;
+    # a lone comma is one only if at most two digits follow it ("12,00").
+    if "," in text and "." in text:
+        thousands, decimal = (",", ".") if text.rfind(".") > text.rfind(",") else (".", ",")
+        return float(text.replace(thousands, "").replace(decimal, "."))
+    if "," in text:
+        whole, _, fraction = text.rpartition(",")
+        if text.count(",") == 1 and len(fraction) <= 2:
+            return float(f"{whole}.{fraction}")
+        return float(text.replace(",", ""))
+    if text.count(".") > 1:
+        return float(text.replace(".", ""))
+    return float(text)
+
+
+def parse_price(text):
+    # "US $1,999.99" -> (1999.99, "USD"), "EUR 12,00" -> (12.0, "EUR").
+    # Ranges ("$10.00 to $20.00") use the lower bound.
+    if not text:
+        return None, None
+    match = PRICE_RE.search(text.replace("\xa0", " "))
+    if not match:
+        return None, None
+    symbol = (match.group('symbol') or "").strip()
+    currency = CURRENCY_SYMBOLS.get(symbol, symbol if len(symbol) == 3 and symbol.isalpha() else None)
+    return parse_amount(match.group('amount')), currency
+
+
+def parse_count(text):
+    # "(12,345)" -> 12345, "1.2K" -> 1200
+    if text is None:
+        return None
+    if isinstance(text, int):
+        return text
+    match = COUNT_RE.search(text)
+    if not match:
+        return None
+    number = float(match.group('number').replace(",", ""))
+    suffix = (match.group('suffix') or "").upper()
+    return int(number * {"K": 1_000, "M": 1_000_000}.get(suffix, 1))
+
+
+def parse_percentage(text):
+    # "99.5% Positive feedback" -> 99.5
+    if text is None:
+        return None
+    if isinstance(text, (int, float)):
+        return float(text)
+    match = PERCENT_RE.search(text)
+    return float(match.group(1)) if match else None
+
+
+def parse_breadcrumbs(text):
+    # "Computers/Tablets > Graphics Cards" -> ["Computers/Tablets", "Graphics Cards"].
+    # A bare category ID (the fallback when no breadcrumbs were found) yields [].
+    if not text or text.isdigit() or text == "N/A":
+        return []
+    return [part.strip() for part in text.split(" > ") if part.strip()]
+
+
+def canonical_image_url(url, size=1600):
+    # eBay serves every gallery image in many sizes and formats:
+    # ".../thumbs/images/g/AbC/s-l140.webp?x=1" -> ".../images/g/AbC/s-l1600.jpg".
+    # Other URLs are returned unchanged.
+    base = url.split("?", 1)[0]
+    if not IMAGE_SIZE_RE.search(base):
+        return url
+    base = base.replace("/thumbs/images/", "/images/")
+    return IMAGE_SIZE_RE.sub(f"/s-l{size}.jpg", base)
+
+
+def normalize_listing(item):
+    # EbayscrapperItem -> ListingRecord
+    price_amount, price_currency = parse_price(item.get('price'))
+    return ListingRecord(
+        product_id=item.get('product_id'),
+        title=item.get('title'),
+        price=item.get('price'),
+        price_amount=price_amount,
+        price_currency=price_currency,
+        link=item.get('link'),
+        description=item.get('description'),
+        image_urls=item.get('image_urls') or [],
+        category=item.get('category'),
+        category_path=parse_breadcrumbs(item.get('category')),
+        condition=item.get('condition'),
+        brand=item.get('brand'),
+        location=item.get('location'),
+        return_policy=item.get('return_policy'),
+        seller_name=item.get('seller_name'),
+        seller_positive_feedback_percentage=parse_percentage(item.get('seller_positive_feedback_percentage')),
+        seller_feedback_count=parse_count(item.get('seller_feedback_count')),
+        seller_link=item.get('seller_link'),
+        top_rated_seller=bool(item.get('top_rated_seller')),
+        derived_from_keyword=item.get('derived_from_keyword'),
+        derived_from_keywords=item.get('derived_from_keywords') or [],
+        category_context_from_search=item.get('category_context_from_search'),
+    )
@@ -3,11 +3,467 @@
 # Don't forget to add your pipeline to the ITEM_PIPELINES setting
 # See: https://docs.scrapy.org/en/latest/topics/item-pipeline.html
 
+import gzip
+import hashlib
+import io
+import json
+import logging
+import os
+import time
+import uuid
+from collections import deque
+from urllib.parse import urlsplit
+
+from scrapy import Request, signals
+from scrapy.exceptions import DontCloseSpider, NotConfigured
+from twisted.internet.threads import deferToThread
 
 # useful for handling different item types with a single interface
 from itemadapter import ItemAdapter
 
+from EbayScrapper.items import EbayscrapperItem, EbaySearchResultItem, ListingChangeItem, ListingRecord
+from EbayScrapper.normalize import canonical_image_url, normalize_listing, parse_price
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+logger = logging.getLogger(__name__)
+
 
 class EbayscrapperPipeline:
     def process_item(self, item, spider):
-        return item
\ No newline at end of file
+        return item
+
+
+class NormalizationPipeline:
+    # Converts each EbayscrapperItem into a typed ListingRecord: price amount and
+    # currency, int feedback count, float feedback percentage and the breadcrumb
+    # path as a list. MainSpider already emits ListingRecords (normalize_items);
+    # this stage covers raw items from other spiders. Runs first so later stages
+    # work on the compact record.
+
+    def process_item(self, item, spider):
+        if isinstance(item, EbayscrapperItem) and getattr(spider, 'normalize_items', True):
+            return normalize_listing(item)
+        return item
+
+
+# Column name -> type for each output stream. Keeping the schema explicit means
+# every part file has the same columns and types, whatever the batch contains.
+EXPORT_SCHEMAS = {
+    "listings": [
+        ("product_id", "string"),
+        ("title", "string"),
+        ("price", "string"),
+        ("price_amount", "float64"),
+        ("price_currency", "string"),
+        ("link", "string"),
+        ("description", "string"),
+        ("image_urls", "list<string>"),
+        ("category", "string"),
+        ("category_path", "list<string>"),
+        ("condition", "string"),
+        ("brand", "string"),
+        ("location", "string"),
+        ("return_policy", "string"),
+        ("seller_name", "string"),
+        ("seller_positive_feedback_percentage", "float64"),
+        ("seller_feedback_count", "int64"),
+        ("seller_link", "string"),
+        ("top_rated_seller", "bool"),
+        ("derived_from_keyword", "string"),
+        ("derived_from_keywords", "list<string>"),
+        ("category_context_from_search", "string"),
+    ],
+    "search_results": [
+        ("product_id", "string"),
+        ("title", "string"),
+        ("price", "string"),
+        ("price_amount", "float64"),
+        ("price_currency", "string"),
+        ("condition", "string"),
+        ("shipping", "string"),
+        ("seller_info", "string"),
+        ("thumbnail_url", "string"),
+        ("link", "string"),
+        ("derived_from_keyword", "string"),
+        ("category_context_from_search", "string"),
+        ("search_page_number", "int64"),
+    ],
+    "listing_changes": [
+        ("event", "string"),
+        ("product_id", "string"),
+        ("link", "string"),
+        ("changes", "json"),
+        ("previous_price", "string"),
+        ("derived_from_keyword", "string"),
+        ("detected_at", "string"),
+    ],
+}
+
+STREAMS_BY_ITEM_TYPE = {
+    EbayscrapperItem: "listings",
+    ListingRecord: "listings",
+    EbaySearchResultItem: "search_results",
+    ListingChangeItem: "listing_changes",
+}
+
+
+def _coerce(value, column_type):
+    if value is None:
+        return None
+    if column_type == "string":
+        return str(value)
+    if column_type == "float64":
+        return float(value) if isinstance(value, (int, float)) else None
+    if column_type == "int64":
+        return int(value) if isinstance(value, (int, float)) else None
+    if column_type == "bool":
+        return bool(value)
+    if column_type == "list<string>":
+        return [str(v) for v in value] if isinstance(value, (list, tuple)) else [str(value)]
+    if column_type == "json":
+        return json.dumps(value, ensure_ascii=False, default=str)
+    raise ValueError(f"Unknown column type: {column_type}")
+
+
+def to_row(item, columns):
+    adapter = ItemAdapter(item)
+    values = adapter.asdict()
+    if values.get("price_amount") is None:
+        # Not normalized (NormalizationPipeline disabled, or a search result card)
+        values["price_amount"], values["price_currency"] = parse_price(values.get("price"))
+    return {name: _coerce(values.get(name), column_type) for name, column_type in columns}
+
+
+class JsonlSink:
+    # Appends rows to gzip- or zstd-compressed JSON lines part files.
+
+    def __init__(self, path_template, compression, rotate_rows, rotate_bytes):
+        if compression == "zst" and zstandard is None:
+            raise NotConfigured("jsonl.zst export requires the zstandard package")
+        self.path_template = path_template
+        self.compression = compression
+        self.rotate_rows = rotate_rows
+        self.rotate_bytes = rotate_bytes
+        self.part = 0
+        self.rows = 0
+        self._raw = None
+        self._stream = None
+        self._text = None
+
+    def _open(self):
+        path = self.path_template.format(part=self.part, ext=f"jsonl.{self.compression}")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._raw = open(path, "wb")
+        if self.compression == "zst":
+            self._stream = zstandard.ZstdCompressor(level=3).stream_writer(self._raw, closefd=False)
+        else:
+            self._stream = gzip.GzipFile(fileobj=self._raw, mode="wb", compresslevel=6)
+        self._text = io.TextIOWrapper(self._stream, encoding="utf-8")
+
+    def write(self, rows, columns):
+        if self._raw is None:
+            self._open()
+        for row in rows:
+            self._text.write(json.dumps(row, ensure_ascii=False))
+            self._text.write("\n")
+        self._text.flush()
+        self.rows += len(rows)
+        if self.rows >= self.rotate_rows or self._raw.tell() >= self.rotate_bytes:
+            self.close()
+            self.part += 1
+            self.rows = 0
+
+    def close(self):
+        if self._raw is not None:
+            self._text.close()  # closes the compressor, which leaves the raw file open
+            self._raw.close()
+            self._raw = self._stream = self._text = None
+
+
+class ParquetSink:
+    # Writes each batch as a row group of the current Parquet part file.
+
+    ARROW_TYPES = {
+        "string": lambda: pyarrow.string(),
+        "float64": lambda: pyarrow.float64(),
+        "int64": lambda: pyarrow.int64(),
+        "bool": lambda: pyarrow.bool_(),
+        "list<string>": lambda: pyarrow.list_(pyarrow.string()),
+        "json": lambda: pyarrow.string(),
+    }
+
+    def __init__(self, path_template, rotate_rows, rotate_bytes):
+        if pyarrow is None:
+            raise NotConfigured("parquet export requires the pyarrow package")
+        self.path_template = path_template
+        self.rotate_rows = rotate_rows
+        self.rotate_bytes = rotate_bytes
+        self.part = 0
+        self.rows = 0
+        self._path = None
+        self._writer = None
+        self._schema = None
+
+    def write(self, rows, columns):
+        if self._schema is None:
+            self._schema = pyarrow.schema([(name, self.ARROW_TYPES[column_type]()) for name, column_type in columns])
+        if self._writer is None:
+            self._path = self.path_template.format(part=self.part, ext="parquet")
+            os.makedirs(os.path.dirname(self._path), exist_ok=True)
+            self._writer = pyarrow.parquet.ParquetWriter(self._path, self._schema, compression="zstd")
+        self._writer.write_table(pyarrow.Table.from_pylist(rows, schema=self._schema))
+        self.rows += len(rows)
+        if self.rows >= self.rotate_rows or os.path.getsize(self._path) >= self.rotate_bytes:
+            self.close()
+            self.part += 1
+            self.rows = 0
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+
+class BatchedExportPipeline:
+    # Buffers items into fixed-size batches and appends each batch to rotating
+    # part files, one directory per stream
+    # ("listings", "search_results", "listing_changes"):
+    #   BATCH_EXPORT_DIR/<stream>/dt=<YYYY-MM-DD>/part-<run>-<n>.<ext>
+    # Items are passed on unchanged, so regular feed exports keep working.
+
+    def __init__(self, directory, formats, batch_size, rotate_rows, rotate_bytes):
+        self.directory = directory
+        self.formats = formats
+        self.batch_size = batch_size
+        self.rotate_rows = rotate_rows
+        self.rotate_bytes = rotate_bytes
+        self.buffers = {}
+        self.sinks = {}
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        directory = settings.get('BATCH_EXPORT_DIR')
+        if not directory:
+            raise NotConfigured
+        formats = settings.getlist('BATCH_EXPORT_FORMATS', ['jsonl.gz'])
+        unknown = set(formats) - {'parquet', 'jsonl.gz', 'jsonl.zst'}
+        if unknown:
+            raise NotConfigured(f"Unknown BATCH_EXPORT_FORMATS: {sorted(unknown)}")
+        return cls(
+            directory,
+            formats,
+            settings.getint('BATCH_EXPORT_BATCH_SIZE', 1000),
+            settings.getint('BATCH_EXPORT_ROTATE_ROWS', 1_000_000),
+            settings.getint('BATCH_EXPORT_ROTATE_BYTES', 512 * 1024 * 1024),
+        )
+
+    def open_spider(self, spider):
+        run_id = time.strftime("%Y%m%dT%H%M%S")
+        if getattr(spider, 'worker_id', None):
+            # Sharded workers write into the same directories
+            run_id = f"{run_id}-{spider.worker_id}"
+        date = time.strftime("%Y-%m-%d")
+        for stream in EXPORT_SCHEMAS:
+            template = os.path.join(self.directory, stream, f"dt={date}", f"part-{run_id}-{{part:05d}}.{{ext}}")
+            sinks = []
+            for fmt in self.formats:
+                if fmt == 'parquet':
+                    sinks.append(ParquetSink(template, self.rotate_rows, self.rotate_bytes))
+                else:
+                    sinks.append(JsonlSink(template, fmt.split('.')[-1], self.rotate_rows, self.rotate_bytes))
+            self.sinks[stream] = sinks
+            self.buffers[stream] = []
+
+    def process_item(self, item, spider):
+        stream = STREAMS_BY_ITEM_TYPE.get(type(item))
+        if stream is None:
+            return item
+        buffer = self.buffers[stream]
+        buffer.append(to_row(item, EXPORT_SCHEMAS[stream]))
+        if len(buffer) >= self.batch_size:
+            self._flush(stream)
+        return item
+
+    def _flush(self, stream):
+        rows = self.buffers[stream]
+        if not rows:
+            return
+        for sink in self.sinks[stream]:
+            sink.write(rows, EXPORT_SCHEMAS[stream])
+        self.buffers[stream] = []
+
+    def close_spider(self, spider):
+        for stream in self.sinks:
+            self._flush(stream)
+            for sink in self.sinks[stream]:
+                sink.close()
+
+
+class ImageArchivePipeline:
+    # Downloads listing images into a content-addressed archive:
+    #   IMAGES_ARCHIVE_DIR/full/<sha256[:2]>/<sha256>.jpg
+    #   IMAGES_ARCHIVE_DIR/thumbs/<size>/<sha256[:2]>/<sha256>.jpg  (IMAGES_THUMBNAIL_SIZE, needs Pillow)
+    #   IMAGES_ARCHIVE_DIR/manifest.jsonl  one line per downloaded URL: url, sha256, path, bytes
+    # `image_urls` is rewritten to canonical, de-duplicated URLs (one `s-lNNN`
+    # size) and the item is passed on at once. Downloads run in the background
+    # on their own downloader slot, at most IMAGES_CONCURRENCY at a time, and
+    # the spider stays open until they are done. URLs already in the manifest,
+    # from this run or an earlier one, are not downloaded again, and identical
+    # bytes behind different URLs are stored once.
+
+    def __init__(self, crawler, directory, size, concurrency, slot, thumbnail_size):
+        self.crawler = crawler
+        self.stats = crawler.stats
+        self.directory = directory
+        self.size = size
+        self.concurrency = concurrency
+        self.slot = slot
+        self.thumbnail_size = thumbnail_size
+        self.known = {}      # canonical URL -> sha256
+        self.queued = set()  # canonical URLs waiting or downloading
+        self.pending = deque()
+        self.in_flight = 0
+        self.manifest = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        directory = settings.get('IMAGES_ARCHIVE_DIR')
+        if not directory:
+            raise NotConfigured
+        thumbnail_size = settings.getint('IMAGES_THUMBNAIL_SIZE')
+        if thumbnail_size and Image is None:
+            raise NotConfigured("IMAGES_THUMBNAIL_SIZE requires the Pillow package")
+        pipeline = cls(
+            crawler,
+            directory,
+            settings.getint('IMAGES_CANONICAL_SIZE', 1600),
+            settings.getint('IMAGES_CONCURRENCY', 8),
+            settings.get('IMAGES_DOWNLOAD_SLOT', 'images'),
+            thumbnail_size,
+        )
+        crawler.signals.connect(pipeline.spider_idle, signal=signals.spider_idle)
+        return pipeline
+
+    def open_spider(self, spider):
+        os.makedirs(self.directory, exist_ok=True)
+        manifest_path = os.path.join(self.directory, "manifest.jsonl")
+        if os.path.exists(manifest_path):
+            with open(manifest_path, encoding="utf-8") as manifest:
+                for line in manifest:
+                    entry = json.loads(line)
+                    self.known[entry['url']] = entry['sha256']
+        self.manifest = open(manifest_path, "a", encoding="utf-8")
+
+    def process_item(self, item, spider):
+        adapter = ItemAdapter(item)
+        if not adapter.get('image_urls'):
+            return item
+        urls = list(dict.fromkeys(canonical_image_url(url, self.size) for url in adapter['image_urls']))
+        adapter['image_urls'] = urls
+        for url in urls:
+            if url in self.known or url in self.queued:
+                self.stats.inc_value('images/duplicate_url')
+                continue
+            self.queued.add(url)
+            self.pending.append(url)
+        self._pump()
+        return item
+
+    def _pump(self):
+        while self.pending and self.in_flight < self.concurrency:
+            url = self.pending.popleft()
+            self.in_flight += 1
+            # Own slot, never rendered, never cached
+            request = Request(url, meta={'download_slot': self.slot, 'playwright': False, 'dont_cache': True,
+                                         'dont_proxy': True})  # CDN downloads go direct, in their own slot
+            dfd = self.crawler.engine.download(request)
+            dfd.addCallback(self._downloaded, url)
+            dfd.addErrback(self._failed, url)
+            dfd.addBoth(self._done, url)
+
+    def _downloaded(self, response, url):
+        if response.status != 200:
+            self.stats.inc_value(f'images/failed/{response.status}')
+            return None
+        dfd = deferToThread(self._store, url, response.body)
+        dfd.addCallback(self._record)
+        return dfd
+
+    def _store(self, url, body):
+        # Runs in a thread pool: hashing, file writes and thumbnailing stay off the reactor
+        sha256 = hashlib.sha256(body).hexdigest()
+        ext = os.path.splitext(urlsplit(url).path)[1] or ".jpg"
+        path = os.path.join("full", sha256[:2], f"{sha256}{ext}")
+        new_content = self._write(path, body)
+        if self.thumbnail_size and new_content:
+            image = Image.open(io.BytesIO(body))
+            image.thumbnail((self.thumbnail_size, self.thumbnail_size))
+            thumb = io.BytesIO()
+            image.convert("RGB").save(thumb, "JPEG", quality=85)
+            self._write(os.path.join("thumbs", str(self.thumbnail_size), sha256[:2], f"{sha256}.jpg"), thumb.getvalue())
+        return {'url': url, 'sha256': sha256, 'path': path, 'bytes': len(body)}, new_content
+
+    def _write(self, path, data):
+        # Returns False when the content-addressed file already exists. Each write
+        # gets its own tmp file: two threads may store the same bytes at once.
+        full_path = os.path.join(self.directory, path)
+        if os.path.exists(full_path):
+            return False
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+        tmp_path = f"{full_path}.{uuid.uuid4().hex}.tmp"
+        try:
+            with open(tmp_path, "xb") as f:
+                f.write(data)
+            os.replace(tmp_path, full_path)
+        except OSError:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            if os.path.exists(full_path):
+                return False  # stored by a concurrent write of the same content
+            raise
+        return True
+
+    def _record(self, result):
+        entry, new_content = result
+        self.known[entry['url']] = entry['sha256']
+        self.manifest.write(json.dumps(entry) + "\n")
+        self.stats.inc_value('images/downloaded')
+        if new_content:
+            self.stats.inc_value('images/stored_bytes', entry['bytes'])
+        else:
+            self.stats.inc_value('images/duplicate_content')
+
+    def _failed(self, failure, url):
+        self.stats.inc_value('images/failed/error')
+        logger.warning(f"Image download failed for {url}: {failure.value}")
+
+    def _done(self, _, url):
+        self.in_flight -= 1
+        self.queued.discard(url)
+        self._pump()
+
+    def spider_idle(self, spider):
+        if self.pending or self.in_flight:
+            raise DontCloseSpider
+
+    def close_spider(self, spider):
+        if self.pending or self.in_flight:
+            logger.warning(f"Spider closed with {len(self.pending) + self.in_flight} image downloads unfinished")
+        self.manifest.close()
@@ -0,0 +1,96 @@
+# Search depth and request priorities.
+#
+# SearchPolicy decides how deep each keyword/category is paginated and in
+# which order requests are served, so the browser budget goes where new
+# listings are:
+#
+#   * Depth: a keyword/category is followed up to the pages its total_results
+#     fill at _ipg listings per page (capped by max_pages), and only while the
+#     share of listings on a page that this run has not seen yet (the yield,
+#     smoothed across pages) stays above min_page_yield.
+#   * Priorities: product renders for listings already discovered come before
+#     any search page, earlier pages' listings first. Search pages are ranked
+#     by expected yield and pushed back the deeper they are.
+#   * Suggestions: autosuggest completions are ranked by expected yield and
+#     capped at max_suggestions. Completions rank lower the further down the
+#     list they are and the more they overlap with completions already picked;
+#     a refinement of a picked completion mostly finds the same listings, so
+#     refinements are only searched when the cap leaves room for them.
+
+import math
+
+PRODUCT_PRIORITY = 100
+DEFERRED_PRODUCT_PRIORITY = -100  # fresh, unchanged listings (incremental_policy = "defer")
+REFINEMENT_YIELD = 0.1            # expected yield of a completion that narrows one already picked
+YIELD_SMOOTHING = 0.5             # weight of the latest page in the smoothed yield
+
+
+def _tokens(keyword):
+    return frozenset(keyword.lower().split())
+
+
+class SearchPolicy:
+    def __init__(self, items_per_page=240, max_pages=10, min_page_yield=0.15, max_suggestions=6):
+        self.items_per_page = items_per_page
+        self.max_pages = max_pages
+        self.min_page_yield = min_page_yield
+        self.max_suggestions = max_suggestions
+
+    def planned_pages(self, total_results, max_pages=None):
+        return min(max_pages or self.max_pages, max(1, math.ceil(total_results / self.items_per_page)))
+
+    def page_yield(self, previous, new_listings, listings):
+        # Smoothed share of new listings; `previous` is None on a keyword's first page
+        # unless suggestion ranking supplied an estimate
+        latest = new_listings / listings if listings else 0.0
+        if previous is None:
+            return latest
+        return YIELD_SMOOTHING * latest + (1 - YIELD_SMOOTHING) * previous
+
+    def stop_reason(self, page, total_results, expected_yield, max_pages=None):
+        # None when the next page should be fetched; max_pages overrides the policy's cap (per service job)
+        max_pages = max_pages or self.max_pages
+        planned = self.planned_pages(total_results, max_pages)
+        if page >= planned:
+            if planned == max_pages:
+                return f"reached max_search_pages_per_keyword ({max_pages})"
+            return f"{total_results} results fit in {planned} page(s) of {self.items_per_page}"
+        if expected_yield < self.min_page_yield:
+            return f"new-listing yield {expected_yield:.2f} is below {self.min_page_yield}"
+        return None
+
+    def search_priority(self, page, expected_yield=1.0):
+        return round(expected_yield * 10) - page
+
+    def product_priority(self, page):
+        return PRODUCT_PRIORITY - page
+
+    def rank_suggestions(self, keywords):
+        # keywords: completions in the order autosuggest returned them.
+        # Returns up to max_suggestions (keyword, expected yield) pairs, best first.
+        candidates = []
+        seen = set()
+        for position, keyword in enumerate(keywords):
+            tokens = _tokens(keyword or '')
+            if tokens and tokens not in seen:
+                seen.add(tokens)
+                candidates.append((position, keyword, tokens))
+        ranked = []
+        picked = []
+        while candidates and len(ranked) < self.max_suggestions:
+            scored = [(self._expected_yield(position, tokens, picked), index)
+                      for index, (position, _, tokens) in enumerate(candidates)]
+            expected, index = max(scored, key=lambda pair: (pair[0], -pair[1]))
+            _, keyword, tokens = candidates.pop(index)
+            ranked.append((keyword, round(expected, 3)))
+            picked.append(tokens)
+        return ranked
+
+    def _expected_yield(self, position, tokens, picked):
+        weight = 1 / (1 + 0.25 * position)  # autosuggest lists the most searched completions first
+        overlap = 0.0
+        for other in picked:
+            if other <= tokens:
+                return weight * REFINEMENT_YIELD
+            overlap = max(overlap, len(tokens & other) / len(tokens | other))
+        return weight * (1 - overlap / 2)
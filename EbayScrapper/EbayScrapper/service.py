@@ -0,0 +1,469 @@
+# Long-running crawl service: one warm Scrapy process that takes crawl jobs
+# over a local HTTP API.
+#
+#   scrapy crawl service -s SERVICE_PORT=8790
+#   curl -X POST localhost:8790/jobs -d '{"keywords": ["rtx 5090"], "max_pages": 2}'
+#
+# The service spider (EbayScrapper.spiders.service) never closes on its own.
+# The reactor, the Playwright browser and its contexts, the HTTP cache and
+# the DNS cache stay up between jobs, so a small job starts downloading right
+# after it is accepted.
+#
+# Every request of a job carries meta['job_id'] (seeded by the service and
+# passed on to follow-up requests by JobMiddleware). FairShareScheduler keeps
+# one priority queue per job and serves them by stride scheduling, so
+# concurrent jobs split the downloader in proportion to their `weight`
+# whatever their size. Within a job the usual request priorities apply.
+# Duplicate filtering is per job, so two jobs may fetch the same search page.
+#
+# JobService serves the API and keeps per-job stats. A job is finished once
+# the scheduler holds none of its requests and none are downloading or being
+# parsed. Its items are written as JSON lines to the job's `output` file
+# (SERVICE_OUTPUT_DIR/<job id>.jsonl by default; any other name is taken
+# relative to SERVICE_OUTPUT_DIR and may not leave it) as well as to the
+# regular feeds and pipelines.
+#
+#   POST   /jobs        {"keywords": [...], "categories": ["0"], "max_pages": 3,
+#                        "use_suggestions": false, "output": "out.jsonl", "weight": 1}
+#   GET    /jobs        every job the service remembers, newest first
+#   GET    /jobs/<id>   one job with its stats
+#   DELETE /jobs/<id>   cancel: drops its queued requests and any further output
+#   GET    /health
+
+import heapq
+import itertools
+import json
+import os
+import re
+import time
+import uuid
+from collections import OrderedDict
+
+from scrapy import signals
+from scrapy.exceptions import NotConfigured
+from scrapy.exporters import JsonLinesItemExporter
+from scrapy.utils.misc import load_object
+from twisted.internet import task
+from twisted.internet.error import CannotListenError
+from twisted.web import resource, server
+
+from EbayScrapper.dedup import ListingDeduplicator
+
+# Meta a job's requests pass on to the requests their responses produce
+JOB_META_KEYS = ('job_id', 'max_search_pages')
+
+JOB_ID_PATTERN = re.compile(r'[A-Za-z0-9_-]{1,64}')
+
+RUNNING = "running"
+FINISHED = "finished"
+CANCELLED = "cancelled"
+
+
+def job_output_path(output_dir, output):
+    # A job's output file, relative to SERVICE_OUTPUT_DIR; the API must not be
+    # able to write anywhere else
+    if not isinstance(output, str):
+        raise ValueError("'output' must be a file name")
+    root = os.path.realpath(output_dir)
+    path = os.path.realpath(os.path.join(root, output))
+    if path == root or os.path.commonpath([root, path]) != root:
+        raise ValueError(f"'output' must be a file inside {output_dir}")
+    return path
+
+
+class Job:
+    def __init__(self, job_id, keywords, categories, max_pages=None, use_suggestions=False, output=None, weight=1.0):
+        self.job_id = job_id
+        self.keywords = keywords
+        self.categories = categories
+        self.max_pages = max_pages
+        self.use_suggestions = use_suggestions
+        self.output = output
+        self.weight = weight
+        self.state = RUNNING  # jobs start as soon as they are accepted
+        self.created_at = time.time()
+        self.started_at = None
+        self.first_item_at = None
+        self.finished_at = None
+        self.stats = {'requests': 0, 'responses': 0, 'cache_hits': 0, 'challenges': 0, 'items': 0,
+                      'download_errors': 0, 'spider_errors': 0, 'filtered': 0}
+        self.listing_dedup = None
+        self.exporter = None
+        self.idle_checks = 0
+
+    @classmethod
+    def from_payload(cls, payload, spider, output_dir):
+        # Raises ValueError for anything a client could have got wrong
+        if not isinstance(payload, dict):
+            raise ValueError("expected a JSON object")
+        keywords = payload.get('keywords')
+        if isinstance(keywords, str):
+            keywords = [keywords]
+        if not keywords or not all(isinstance(keyword, str) and keyword.strip() for keyword in keywords):
+            raise ValueError("'keywords' must be a non-empty list of strings")
+        categories = payload.get('categories') or list(spider.allowed_categories)
+        if isinstance(categories, (str, int)):
+            categories = [categories]
+        max_pages = payload.get('max_pages')
+        if max_pages is not None and (not isinstance(max_pages, int) or max_pages < 1):
+            raise ValueError("'max_pages' must be a positive integer")
+        weight = payload.get('weight', 1)
+        if not isinstance(weight, (int, float)) or weight <= 0:
+            raise ValueError("'weight' must be a positive number")
+        job_id = str(payload.get('job_id') or uuid.uuid4().hex[:12])
+        if not JOB_ID_PATTERN.fullmatch(job_id):
+            raise ValueError("'job_id' may only contain letters, digits, '_' and '-'")
+        output = job_output_path(output_dir, payload.get('output') or f"{job_id}.jsonl")
+        return cls(job_id, [keyword.strip() for keyword in keywords], [str(category) for category in categories],
+                   max_pages, bool(payload.get('use_suggestions', False)), output, float(weight))
+
+    def to_dict(self):
+        end = self.finished_at or time.time()
+        return {
+            'job_id': self.job_id,
+            'state': self.state,
+            'keywords': self.keywords,
+            'categories': self.categories,
+            'max_pages': self.max_pages,
+            'use_suggestions': self.use_suggestions,
+            'output': self.output,
+            'weight': self.weight,
+            'created_at': self.created_at,
+            'finished_at': self.finished_at,
+            # From submission; shows how quickly a warm service gets going
+            'first_request_after': round(self.started_at - self.created_at, 3) if self.started_at else None,
+            'first_item_after': round(self.first_item_at - self.created_at, 3) if self.first_item_at else None,
+            'elapsed': round(end - self.created_at, 3),
+            'stats': dict(self.stats),
+        }
+
+
+class _JobQueue:
+    __slots__ = ('weight', 'heap', 'pass_')
+
+    def __init__(self, weight, pass_):
+        self.weight = weight
+        self.heap = []
+        self.pass_ = pass_
+
+
+class FairShareScheduler:
+    # In-memory scheduler with one queue per job (requests without a job_id
+    # share one more queue). The next request comes from the queue with the
+    # lowest pass value, which grows by 1/weight per request served: stride
+    # scheduling, so every job with queued requests advances in proportion to
+    # its weight. Attached to the spider as `job_scheduler`.
+
+    def __init__(self, crawler, dupefilter):
+        self.crawler = crawler
+        self.stats = crawler.stats
+        self.df = dupefilter
+        self.fingerprinter = crawler.request_fingerprinter
+        self.queues = {}        # job_id (None for requests outside any job) -> _JobQueue
+        self.seen = {}          # job_id -> request fingerprints, the per-job dupefilter
+        self.weights = {}       # job_id -> weight
+        self._clock = 0.0       # pass value of the last request served
+        self._order = itertools.count()
+        self.spider = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        dupefilter_cls = load_object(crawler.settings['DUPEFILTER_CLASS'])
+        return cls(crawler, dupefilter_cls.from_crawler(crawler))
+
+    def open(self, spider):
+        self.spider = spider
+        spider.job_scheduler = self
+        return self.df.open()
+
+    def close(self, reason):
+        return self.df.close(reason)
+
+    def add_job(self, job_id, weight=1.0):
+        self.weights[job_id] = weight
+        self.seen[job_id] = set()
+
+    def remove_job(self, job_id):
+        # Forgets the job and drops whatever it still had queued; returns how many
+        self.weights.pop(job_id, None)
+        self.seen.pop(job_id, None)
+        queue = self.queues.pop(job_id, None)
+        return len(queue.heap) if queue else 0
+
+    def pending(self, job_id):
+        queue = self.queues.get(job_id)
+        return len(queue.heap) if queue else 0
+
+    def _is_duplicate(self, request, job_id):
+        if request.dont_filter:
+            return False
+        if job_id is None:
+            if self.df.request_seen(request):
+                self.df.log(request, self.spider)
+                return True
+            return False
+        seen = self.seen.get(job_id)
+        if seen is None:
+            return True  # the job is gone (cancelled or finished)
+        fingerprint = self.fingerprinter.fingerprint(request)
+        if fingerprint in seen:
+            self.stats.inc_value('dupefilter/filtered')
+            return True
+        seen.add(fingerprint)
+        return False
+
+    def enqueue_request(self, request):
+        job_id = request.meta.get('job_id')
+        if self._is_duplicate(request, job_id):
+            return False
+        queue = self.queues.get(job_id)
+        if queue is None:
+            queue = self.queues[job_id] = _JobQueue(self.weights.get(job_id, 1.0), self._clock)
+        elif not queue.heap:
+            queue.pass_ = max(queue.pass_, self._clock)  # no credit banked while the job had nothing queued
+        heapq.heappush(queue.heap, (-request.priority, next(self._order), request))
+        self.stats.inc_value('scheduler/enqueued/memory')
+        self.stats.inc_value('scheduler/enqueued')
+        return True
+
+    def next_request(self):
+        waiting = [queue for queue in self.queues.values() if queue.heap]
+        if not waiting:
+            return None
+        queue = min(waiting, key=lambda queue: queue.pass_)
+        self._clock = queue.pass_
+        queue.pass_ += 1 / queue.weight
+        _, _, request = heapq.heappop(queue.heap)
+        self.stats.inc_value('scheduler/dequeued/memory')
+        self.stats.inc_value('scheduler/dequeued')
+        return request
+
+    def has_pending_requests(self):
+        return len(self) > 0
+
+    def __len__(self):
+        return sum(len(queue.heap) for queue in self.queues.values())
+
+
+class _JobsResource(resource.Resource):
+    isLeaf = True
+
+    def __init__(self, service):
+        super().__init__()
+        self.service = service
+
+    def _reply(self, request, status, body):
+        request.setResponseCode(status)
+        request.setHeader(b'Content-Type', b'application/json')
+        return json.dumps(body, ensure_ascii=False).encode('utf-8')
+
+    def _job_id(self, request):
+        parts = [part for part in request.path.decode('utf-8').split('/') if part]
+        if parts[:1] != ['jobs'] or len(parts) > 2:
+            return False, None
+        return True, parts[1] if len(parts) == 2 else None
+
+    def render_GET(self, request):
+        if request.path.rstrip(b'/') == b'/health':
+            return self._reply(request, 200, self.service.health())
+        valid, job_id = self._job_id(request)
+        if not valid:
+            return self._reply(request, 404, {'error': 'not found'})
+        if job_id is None:
+            return self._reply(request, 200, [job.to_dict() for job in reversed(self.service.jobs.values())])
+        job = self.service.jobs.get(job_id)
+        if job is None:
+            return self._reply(request, 404, {'error': f'no job {job_id}'})
+        return self._reply(request, 200, job.to_dict())
+
+    def render_POST(self, request):
+        valid, job_id = self._job_id(request)
+        if not valid or job_id is not None:
+            return self._reply(request, 404, {'error': 'not found'})
+        try:
+            job = self.service.submit(json.loads(request.content.read() or b'{}'))
+        except ValueError as e:  # includes malformed JSON
+            return self._reply(request, 400, {'error': str(e)})
+        return self._reply(request, 201, job.to_dict())
+
+    def render_DELETE(self, request):
+        valid, job_id = self._job_id(request)
+        if not valid or job_id is None:
+            return self._reply(request, 404, {'error': 'not found'})
+        job = self.service.cancel(job_id)
+        if job is None:
+            return self._reply(request, 404, {'error': f'no job {job_id}'})
+        return self._reply(request, 200, job.to_dict())
+
+
+class JobService:
+    # Extension for the service spider: serves the job API on SERVICE_HOST:SERVICE_PORT,
+    # seeds jobs, tracks per-job stats and output, and finishes jobs that have drained.
+
+    def __init__(self, crawler):
+        settings = crawler.settings
+        if not settings.getint('SERVICE_PORT'):
+            raise NotConfigured("SERVICE_PORT is not set")
+        self.crawler = crawler
+        self.host = settings.get('SERVICE_HOST', '127.0.0.1')
+        self.port = settings.getint('SERVICE_PORT')
+        self.output_dir = settings.get('SERVICE_OUTPUT_DIR', 'jobs')
+        self.poll_interval = settings.getfloat('SERVICE_POLL_INTERVAL', 0.2)
+        self.history = settings.getint('SERVICE_JOB_HISTORY', 200)
+        self.jobs = OrderedDict()  # job_id -> Job, oldest first
+        self.spider = None
+        self.listener = None
+        self.poller = None
+        self.started_at = time.time()
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        ext = cls(crawler)
+        crawler.signals.connect(ext.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(ext.spider_closed, signal=signals.spider_closed)
+        crawler.signals.connect(ext.request_reached_downloader, signal=signals.request_reached_downloader)
+        crawler.signals.connect(ext.response_received, signal=signals.response_received)
+        crawler.signals.connect(ext.request_dropped, signal=signals.request_dropped)
+        crawler.signals.connect(ext.item_scraped, signal=signals.item_scraped)
+        crawler.signals.connect(ext.spider_error, signal=signals.spider_error)
+        return ext
+
+    def spider_opened(self, spider):
+        from twisted.internet import reactor
+
+        if not hasattr(spider, 'job_scheduler'):
+            raise RuntimeError("JobService needs SCHEDULER = 'EbayScrapper.service.FairShareScheduler'")
+        self.spider = spider
+        spider.jobs = self.jobs
+        try:
+            self.listener = reactor.listenTCP(self.port, server.Site(_JobsResource(self)), interface=self.host)
+        except CannotListenError as e:
+            spider.logger.error(f"Cannot serve the job API on {self.host}:{self.port}: {e}")
+            self.crawler.engine.close_spider(spider, 'service_port_unavailable')
+            return
+        self.poller = task.LoopingCall(self._check_jobs)
+        self.poller.start(self.poll_interval, now=False)
+        spider.logger.info(f"Crawl service accepting jobs on http://{self.host}:{self.port}/jobs")
+
+    def spider_closed(self, spider, reason):
+        if self.poller is not None and self.poller.running:
+            self.poller.stop()
+        for job in self.jobs.values():
+            if job.state == RUNNING:
+                self._finish(job, CANCELLED)
+        if self.listener is not None:
+            return self.listener.stopListening()
+
+    def health(self):
+        running = sum(1 for job in self.jobs.values() if job.state == RUNNING)
+        return {'uptime': round(time.time() - self.started_at, 3), 'jobs_running': running,
+                'jobs_known': len(self.jobs), 'scheduled_requests': len(self.spider.job_scheduler)}
+
+    def submit(self, payload):
+        job = Job.from_payload(payload, self.spider, self.output_dir)
+        if job.job_id in self.jobs:
+            raise ValueError(f"job {job.job_id} already exists")
+        if self.spider.listing_dedup is not None:
+            job.listing_dedup = ListingDeduplicator(self.spider.dedup_backend, int(self.spider.dedup_max_entries))
+        output_dir = os.path.dirname(job.output)
+        if output_dir:
+            os.makedirs(output_dir, exist_ok=True)
+        job.exporter = JsonLinesItemExporter(open(job.output, 'ab'))
+        job.exporter.start_exporting()
+        self.jobs[job.job_id] = job
+        self._forget_old_jobs()
+        self.spider.job_scheduler.add_job(job.job_id, job.weight)
+        extra_meta = {'job_id': job.job_id}
+        if job.max_pages:
+            extra_meta['max_search_pages'] = job.max_pages
+        for request in self.spider._seed_requests(job.keywords, job.categories, job.use_suggestions, extra_meta):
+            self.crawler.engine.crawl(request)
+        self.crawler.stats.inc_value('service/jobs_submitted')
+        self.spider.logger.info(f"Job {job.job_id} accepted: {job.keywords} in categories {job.categories}")
+        return job
+
+    def cancel(self, job_id):
+        job = self.jobs.get(job_id)
+        if job is not None and job.state == RUNNING:
+            self._finish(job, CANCELLED)
+        return job
+
+    def _forget_old_jobs(self):
+        done = [job_id for job_id, job in self.jobs.items() if job.state in (FINISHED, CANCELLED)]
+        for job_id in done[:max(0, len(self.jobs) - self.history)]:
+            del self.jobs[job_id]
+
+    def _in_flight_jobs(self):
+        engine = self.crawler.engine
+        active = itertools.chain(engine.downloader.active, engine.scraper.slot.active if engine.scraper.slot else ())
+        return {request.meta.get('job_id') for request in active}
+
+    def _check_jobs(self):
+        # A job has drained when none of its requests are queued, downloading or
+        # being parsed on two polls in a row (a request can be between stages for
+        # a moment)
+        busy = self._in_flight_jobs()
+        scheduler = self.spider.job_scheduler
+        for job in list(self.jobs.values()):
+            if job.state != RUNNING:
+                continue
+            if scheduler.pending(job.job_id) or job.job_id in busy:
+                job.idle_checks = 0
+                continue
+            job.idle_checks += 1
+            if job.idle_checks >= 2:
+                self._finish(job, FINISHED)
+
+    def _finish(self, job, state):
+        job.state = state
+        job.finished_at = time.time()
+        job.stats['dropped'] = self.spider.job_scheduler.remove_job(job.job_id)
+        job.listing_dedup = None
+        if job.exporter is not None:
+            job.exporter.finish_exporting()
+            job.exporter.file.close()
+            job.exporter = None
+        self.crawler.stats.inc_value(f'service/jobs_{state}')
+        self.spider.logger.info(f"Job {job.job_id} {state}: {json.dumps(job.to_dict()['stats'])}")
+
+    def _job(self, request):
+        job = self.jobs.get(request.meta.get('job_id')) if request is not None else None
+        return job if job is not None and job.state == RUNNING else None
+
+    def request_reached_downloader(self, request, spider):
+        job = self._job(request)
+        if job is not None:
+            job.stats['requests'] += 1
+            if job.started_at is None:
+                job.started_at = time.time()
+
+    def response_received(self, response, request, spider):
+        job = self._job(request)
+        if job is None:
+            return
+        job.stats['responses'] += 1
+        if 'cached' in response.flags:
+            job.stats['cache_hits'] += 1
+        if response.status in (403, 429) or "splashui/challenge" in response.url:
+            job.stats['challenges'] += 1
+
+    def request_dropped(self, request, spider):
+        # Duplicates within the job, or requests of a job that has ended
+        job = self._job(request)
+        if job is not None:
+            job.stats['filtered'] += 1
+
+    def item_scraped(self, item, response, spider):
+        # `response` is the Failure for items produced by an errback; both carry the request
+        job = self._job(getattr(response, 'request', None))
+        if job is None:
+            return
+        job.stats['items'] += 1
+        if job.first_item_at is None:
+            job.first_item_at = time.time()
+        job.exporter.export_item(item)
+
+    def spider_error(self, failure, response, spider):
+        job = self._job(response.request)
+        if job is not None:
+            job.stats['spider_errors'] += 1
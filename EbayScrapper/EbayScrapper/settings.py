@@ -1,20 +1,225 @@
+import os
+
+from EbayScrapper.browser import ResourceBlocker
+
 # Global Settings
 BOT_NAME = "EbayScrapper"
 SPIDER_MODULES = ["EbayScrapper.spiders"]
 NEWSPIDER_MODULE = "EbayScrapper.spiders"
 ROBOTSTXT_OBEY = False
 
+# Run profile: "dev" opens a visible browser window, "production" runs headless
+# with more contexts for a Linux server. Select with EBAY_SCRAPPER_PROFILE=production.
+SCRAPER_PROFILE = os.environ.get("EBAY_SCRAPPER_PROFILE", "dev")
+PRODUCTION = SCRAPER_PROFILE == "production"
+
 # Playwright Integration
 DOWNLOAD_HANDLERS = {
-    "http": "scrapy_playwright.handler.ScrapyPlaywrightDownloadHandler",
-    "https": "scrapy_playwright.handler.ScrapyPlaywrightDownloadHandler",
+    "http": "EbayScrapper.browser.PooledPlaywrightDownloadHandler",
+    "https": "EbayScrapper.browser.PooledPlaywrightDownloadHandler",
 }
 PLAYWRIGHT_BROWSER_TYPE = "chromium"
 PLAYWRIGHT_LAUNCH_OPTIONS = {
-    "headless": False,
+    "headless": PRODUCTION,
     "timeout": 30 * 1000,  # 30 seconds
 }
+if PRODUCTION:
+    PLAYWRIGHT_LAUNCH_OPTIONS["args"] = [
+        "--disable-dev-shm-usage",  # /dev/shm is tiny in containers
+        "--disable-gpu",
+        "--disable-extensions",
+        "--disable-background-networking",
+        "--mute-audio",
+        "--no-first-run",
+    ]
+PLAYWRIGHT_MAX_CONTEXTS = 4 if PRODUCTION else 2
+PLAYWRIGHT_MAX_PAGES_PER_CONTEXT = 4 if PRODUCTION else 2
+
+# Product pages are recycled across listings instead of opened and closed per
+# listing. A page is closed after PLAYWRIGHT_PAGE_POOL_MAX_USES renders.
+PLAYWRIGHT_PAGE_POOL_SIZE = PLAYWRIGHT_MAX_PAGES_PER_CONTEXT  # idle pages kept per context
+PLAYWRIGHT_PAGE_POOL_MAX_USES = 50
+
+# Browser sub-requests the extractor never reads are aborted at the route level.
+PLAYWRIGHT_BLOCKED_RESOURCE_TYPES = ["image", "media", "font"]
+PLAYWRIGHT_BLOCKED_HOSTS = [
+    "doubleclick.net",
+    "googlesyndication.com",
+    "googletagmanager.com",
+    "google-analytics.com",
+    "googleadservices.com",
+    "scorecardresearch.com",
+    "facebook.net",
+    "criteo.com",
+    "criteo.net",
+    "adnxs.com",
+    "ebayadservices.com",
+    "rover.ebay.com",
+    "pulsar.ebay.com",
+]
+PLAYWRIGHT_ABORT_REQUEST = ResourceBlocker(PLAYWRIGHT_BLOCKED_RESOURCE_TYPES, PLAYWRIGHT_BLOCKED_HOSTS)
+
+# Request routing: the Playwright handler above falls back to Scrapy's HTTP
+# handler for requests without meta['playwright']. "split" keeps it that way and
+# gives browser renders their own downloader slot; "browser" renders every page.
+EBAY_REQUEST_ROUTING = "split"
+PLAYWRIGHT_DOWNLOAD_SLOT = "playwright"
+
+# Concurrency: the browser slot is matched to the Playwright page limits, plain
+# HTTP requests (search / autosuggest) use per-domain slots.
+CONCURRENT_REQUESTS = 32 if PRODUCTION else 8
+CONCURRENT_REQUESTS_PER_DOMAIN = 4
+DOWNLOAD_DELAY = 0.5
+DOWNLOAD_SLOTS = {
+    PLAYWRIGHT_DOWNLOAD_SLOT: {
+        "concurrency": PLAYWRIGHT_MAX_CONTEXTS * PLAYWRIGHT_MAX_PAGES_PER_CONTEXT,
+        "delay": 1,
+    },
+}
+
+# Adaptive concurrency: per endpoint class (autosug, srp, item, description),
+# concurrency grows by one after each healthy window of ADAPTIVE_WINDOW
+# responses and is halved (with the delay doubled) as soon as challenge pages
+# or 403/429 responses show up. Limits are [min, max] concurrency.
+ADAPTIVE_CONCURRENCY_ENABLED = True
+ADAPTIVE_CONCURRENCY_LIMITS = {
+    "autosug": [1, 8],
+    "srp": [1, 8],
+    "item": [1, PLAYWRIGHT_MAX_CONTEXTS * PLAYWRIGHT_MAX_PAGES_PER_CONTEXT],
+    "description": [1, 16],
+    "other": [1, 8],
+}
+ADAPTIVE_TARGET_LATENCY = {  # seconds; slower responses stop further increases
+    "autosug": 1.0,
+    "srp": 3.0,
+    "item": 15.0,
+    "description": 2.0,
+    "other": 5.0,
+}
+ADAPTIVE_CHALLENGE_THRESHOLD = 0.02  # challenge rate per window tolerated before backing off
+ADAPTIVE_WINDOW = 20
+ADAPTIVE_MIN_DELAY = 0.0
+ADAPTIVE_MAX_DELAY = 30.0
+ADAPTIVE_BACKOFF_COOLDOWN = 10.0     # seconds between two consecutive decreases
+
+DOWNLOADER_MIDDLEWARES = {
+    "EbayScrapper.middlewares.RequestRoutingMiddleware": 50,
+    "EbayScrapper.middlewares.AdaptiveConcurrencyMiddleware": 60,
+    "EbayScrapper.middlewares.ProxyPoolMiddleware": 950,
+}
+
+SPIDER_MIDDLEWARES = {
+    "EbayScrapper.middlewares.WorkUnitMiddleware": 950,
+}
+
+ITEM_PIPELINES = {
+    "EbayScrapper.pipelines.NormalizationPipeline": 100,
+    "EbayScrapper.pipelines.ImageArchivePipeline": 200,
+    "EbayScrapper.pipelines.BatchedExportPipeline": 800,
+}
+
+# Response cache (EbayScrapper.httpcache), off by default so scheduled runs see
+# live listings: enable with -s HTTPCACHE_ENABLED=True for development and
+# debugging sessions. Autosuggest, search, item and description responses are
+# then kept in .scrapy/httpcache/<spider>.sqlite for the TTL of their endpoint
+# class. Playwright renders are cached only with HTTPCACHE_CACHE_RENDERS = True
+# or meta['cache_render']; bypass for one request with meta['dont_cache'].
+HTTPCACHE_ENABLED = False
+HTTPCACHE_DIR = "httpcache"
+HTTPCACHE_POLICY = "EbayScrapper.httpcache.EndpointCachePolicy"
+HTTPCACHE_STORAGE = "EbayScrapper.httpcache.SqliteCacheStorage"
+HTTPCACHE_ENDPOINT_TTLS = {  # seconds; endpoint classes not listed are never cached
+    "autosug": 3600,
+    "srp": 3600,
+    "item": 900,
+    "description": 24 * 3600,
+}
+HTTPCACHE_CACHE_RENDERS = False
+HTTPCACHE_MAX_BYTES = 1024 * 1024 * 1024  # compressed size; least recently used entries are evicted beyond it
+HTTPCACHE_COMPRESSION = "zlib"  # or "zstd" (needs zstandard)
+
+# Image archive: set IMAGES_ARCHIVE_DIR (e.g. -s IMAGES_ARCHIVE_DIR=images) to
+# download listing images in the background into content-addressed files.
+IMAGES_ARCHIVE_DIR = None
+IMAGES_CANONICAL_SIZE = 1600  # every s-lNNN variant is fetched at this size
+IMAGES_CONCURRENCY = 8
+IMAGES_DOWNLOAD_SLOT = "images"
+IMAGES_THUMBNAIL_SIZE = 0  # e.g. 256 for 256px JPEG thumbnails (needs Pillow)
+DOWNLOAD_SLOTS[IMAGES_DOWNLOAD_SLOT] = {"concurrency": IMAGES_CONCURRENCY, "delay": 0}
+
+# Stage metrics: timings (queueing, download/navigation, challenge and
+# description waits, parsing) and per-endpoint counters, copied into the crawl
+# stats at close. Set METRICS_PORT (e.g. -s METRICS_PORT=9410) to also serve them
+# as Prometheus text on http://METRICS_HOST:METRICS_PORT/metrics during the crawl.
+EXTENSIONS = {
+    "EbayScrapper.metrics.MetricsExtension": 500,
+    "EbayScrapper.debug.DebugCaptureExtension": 510,
+}
+METRICS_ENABLED = True
+METRICS_HOST = "127.0.0.1"
+METRICS_PORT = 0  # 0 = don't serve; sharded workers take the next free port after it
+METRICS_PORT_ATTEMPTS = 16
+
+# Debug captures: HTML (gzipped) and a JPEG screenshot of failed product renders,
+# written in the background under DEBUG_CAPTURE_DIR/<failure type>/. Sampled and
+# rate limited per failure type; the oldest files go beyond DEBUG_CAPTURE_MAX_BYTES.
+DEBUG_CAPTURE_ENABLED = True
+DEBUG_CAPTURE_DIR = "debug"
+DEBUG_CAPTURE_SAMPLE_RATE = 1.0
+DEBUG_CAPTURE_PER_MINUTE = 6
+DEBUG_CAPTURE_QUEUE_SIZE = 8
+DEBUG_CAPTURE_MAX_BYTES = 200 * 1024 * 1024
+DEBUG_CAPTURE_SCREENSHOTS = True
+
+# Event log: the spider's per-request, per-page and per-listing events are
+# written as JSON lines to EVENT_LOG_FILE (stderr when None) from a background
+# thread. EVENT_LOG_SAMPLE_RATES writes only that share of an event type; what
+# was held back is summarized every EVENT_LOG_SUMMARY_INTERVAL seconds.
+EVENT_LOG_FILE = None
+EVENT_LOG_LEVEL = "INFO"
+EVENT_LOG_QUEUE_SIZE = 10000
+EVENT_LOG_SAMPLE_RATES = {
+    "request": 0.01,
+    "product_parsed": 0.1,
+    "field_missing": 0.1,
+    "description_missing": 0.1,
+}
+EVENT_LOG_SUMMARY_INTERVAL = 60
+
+# Crawl service (scrapy crawl service): job API address, default job output
+# directory, and whether the browser is launched before the first job.
+SERVICE_HOST = "127.0.0.1"
+SERVICE_PORT = 8790
+SERVICE_OUTPUT_DIR = "jobs"
+SERVICE_WARM_BROWSER = True
+SERVICE_POLL_INTERVAL = 0.2   # seconds between checks for drained jobs
+SERVICE_JOB_HISTORY = 200     # finished jobs kept for GET /jobs
+
+# Proxy pool: set PROXY_POOL (proxy URLs, http://[user:pass@]host:port) or
+# PROXY_POOL_FILE (one URL per line, or a .json list of URLs or
+# {"url", "name", "concurrency", "delay"} objects) to spread downloads across
+# exits. Each proxy gets its own downloader slot, and a circuit breaker that
+# rests it for PROXY_BREAKER_COOLDOWN seconds (doubling per consecutive trip)
+# once PROXY_BREAKER_FAILURE_RATE of its recent outcomes are errors or
+# challenges. An empty pool disables ProxyPoolMiddleware.
+PROXY_POOL = []
+PROXY_POOL_FILE = None
+PROXY_CONCURRENCY = 2
+PROXY_DELAY = 1.0
+PROXY_BREAKER_WINDOW = 20
+PROXY_BREAKER_MIN_SAMPLES = 5
+PROXY_BREAKER_FAILURE_RATE = 0.5
+PROXY_BREAKER_COOLDOWN = 60
+PROXY_BREAKER_MAX_COOLDOWN = 900
+PROXY_BREAKER_MAX_TRIPS = 5
 
+# Batched output: set BATCH_EXPORT_DIR (e.g. -s BATCH_EXPORT_DIR=output) to write
+# items in batches to rotating part files next to the regular feed exports.
+BATCH_EXPORT_DIR = None
+BATCH_EXPORT_FORMATS = ["jsonl.gz"]  # any of "parquet" (needs pyarrow), "jsonl.gz", "jsonl.zst" (needs zstandard)
+BATCH_EXPORT_BATCH_SIZE = 1000
+BATCH_EXPORT_ROTATE_ROWS = 1_000_000  # start a new part file after this many rows...
+BATCH_EXPORT_ROTATE_BYTES = 512 * 1024 * 1024  # ...or once it reaches this size (checked after each batch)
 
 # Future-proof Defaults
 REQUEST_FINGERPRINTER_IMPLEMENTATION = "2.7"
@@ -0,0 +1,55 @@
+# Launches sharded crawl workers on this host.
+#
+#   python -m EbayScrapper.shard --workers 4 --queue sqlite:///work.db -- -o "items-%(worker_id)s.jsonl"
+#
+# Each worker is its own `scrapy crawl` process, with its own Playwright
+# browser, pulling keyword/category/page and product units from the shared
+# queue (see EbayScrapper.workqueue). Run the same command on several hosts
+# with a redis:// queue to spread one crawl across machines. Anything after
+# "--" is passed to every worker. Run it from the directory containing
+# scrapy.cfg.
+
+import argparse
+import os
+import signal
+import socket
+import subprocess
+import sys
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run sharded crawl workers against a shared work queue.")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="worker processes on this host")
+    parser.add_argument("--queue", required=True, help="sqlite:///work.db, or redis://host:6379/0 for several hosts")
+    parser.add_argument("--spider", default="main")
+    parser.add_argument("--name", default=socket.gethostname(),
+                        help="worker id prefix; must be unique per host (default: hostname)")
+    parser.add_argument("scrapy_args", nargs=argparse.REMAINDER, help="arguments passed to every `scrapy crawl`")
+    args = parser.parse_args(argv)
+    extra = args.scrapy_args[1:] if args.scrapy_args[:1] == ["--"] else args.scrapy_args
+
+    workers = []
+    for index in range(args.workers):
+        command = [
+            sys.executable, "-m", "scrapy", "crawl", args.spider,
+            "-a", f"work_queue={args.queue}",
+            "-a", f"worker_id={args.name}-{index}",
+            *extra,
+        ]
+        # Own session, so Ctrl+C reaches the workers once (forwarded below) and
+        # not a second time, which Scrapy would take as a forced shutdown
+        workers.append(subprocess.Popen(command, start_new_session=True))
+
+    def forward(signum, frame):
+        for worker in workers:
+            if worker.poll() is None:
+                worker.send_signal(signum)
+
+    signal.signal(signal.SIGINT, forward)
+    signal.signal(signal.SIGTERM, forward)
+    codes = [worker.wait() for worker in workers]
+    return next((code for code in codes if code), 0)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,11 +1,35 @@
 import json
+import logging
+import os
 import scrapy
 import random
-from scrapy.exceptions import CloseSpider
+import socket
+import time
+from datetime import datetime, timezone
+from scrapy import signals
+from scrapy.exceptions import CloseSpider, DontCloseSpider
 import re
-from EbayScrapper.items import EbayscrapperItem
+from EbayScrapper.items import EbayscrapperItem, EbaySearchResultItem, ListingChangeItem
+from EbayScrapper.changes import ChangeStore
+from EbayScrapper.checkpoint import CrawlCheckpoint
+from EbayScrapper.dedup import ListingDeduplicator
+from EbayScrapper.endpoints import classify_url
+from EbayScrapper.eventlog import EventLog
+from EbayScrapper.extraction import PRODUCT_FIELDS, PRODUCT_SCOPES, SRP_CARD_FIELDS, FieldExtractor
+from EbayScrapper.listing_store import ListingStore
+from EbayScrapper.metrics import MetricsRegistry
+from EbayScrapper.normalize import normalize_listing, parse_price
+from EbayScrapper.scheduling import DEFERRED_PRODUCT_PRIORITY, SearchPolicy
+from EbayScrapper.workqueue import open_work_queue
 from scrapy_playwright.page import PageMethod
 
+
+def _to_bool(value):
+    # Spider arguments passed with -a arrive as strings
+    if isinstance(value, str):
+        return value.strip().lower() in ("1", "true", "yes", "on")
+    return bool(value)
+
 class MainSpider(scrapy.Spider):
     name = "main"
     search_keywords = ["rtx 5090 founder edition"]
@@ -33,17 +57,47 @@ class MainSpider(scrapy.Spider):
         "_ipg": "240",
         "_sop": "12"
     }
-    search_base_url_template = "https://www.ebay.com/sch/i.html?_nkw={_nkw}&_from={_from}&rt={rt}&_sacat={_sacat}&_ipg={_ipg}&_sop={_sop}"
+    search_base_url_template = "https://www.ebay.com/sch/i.html?_nkw={_nkw}&_from={_from}&rt={rt}&_sacat={_sacat}&_ipg={_ipg}&_sop={_sop}&_pgn={_pgn}"
     allowed_categories = ["0"]  # Default category ID for all items
     use_tor = False
-    tor_proxy_address = "http://127.0.0.1:9080",
-    max_search_pages_per_keyword = 3
-    custom_settings = {
-        'PLAYWRIGHT_MAX_CONTEXTS': 2,         # Limit to 2 concurrent browser contexts
-        'PLAYWRIGHT_MAX_PAGES_PER_CONTEXT': 2, # Only 1 page per context
-        'CONCURRENT_REQUESTS': 2,             # Match concurrency to Playwright limits
-        'DOWNLOAD_DELAY': 1,                  # Add a 1-second delay between requests
-    }
+    tor_proxy_address = "http://127.0.0.1:9080"  # Used as meta['proxy']; requests with it bypass the proxy pool
+    max_search_pages_per_keyword = 10  # Hard cap; the depth crawled follows total_results and the new-listing yield
+    min_page_yield = 0.15           # Stop paginating a keyword/category once fewer than this share of a page's listings are new
+    max_suggestions_per_keyword = 6  # Suggestions searched per keyword, best expected yield first
+    product_page_mode = "browser"  # "browser": render with Playwright, "static": plain HTML + description iframe request
+    dedup_listings = True           # Fetch each listing once per run, however many searches surface it
+    dedup_backend = "set"           # "set": exact with keyword provenance, "bloom": constant memory for very large crawls
+    dedup_max_entries = 1_000_000   # Listings remembered by the set backend / capacity of the bloom filter
+    incremental_store_path = None   # SQLite file of previously scraped listings; None disables incremental crawling
+    incremental_ttl = 24 * 3600     # Seconds a scraped listing stays fresh when its SRP title and price are unchanged
+    incremental_policy = "skip"     # Fresh unchanged listings: "skip" them, or "defer" them behind new/changed ones
+    change_store_path = None        # SQLite file of listing fingerprints; set to emit change events instead of full records
+    change_disappear_after = 2      # Completed runs a listing must be missing from its keyword's results to be reported as disappeared
+    normalize_items = True          # Emit listings as typed ListingRecords (see EbayScrapper.normalize); False emits raw EbayscrapperItems
+    output_mode = "full"            # "full": product pages only, "search_only": SRP cards only, "hybrid": SRP cards + matching product pages
+    # Product pages fetched in hybrid mode; keys: min_price, max_price, conditions, title_contains, title_excludes
+    hybrid_filters = {}
+    work_queue = None               # Shared queue for sharded crawls: "sqlite:///work.db" or "redis://host:6379/0"; None crawls in-process
+    worker_id = None                # This worker's name in the shared queue; defaults to <hostname>-<pid>
+    work_queue_namespace = "ebay"   # Key prefix on a shared Redis server
+    work_queue_prefetch = 64        # Work units this worker holds at once
+    work_queue_lease = 900          # Seconds before a claimed unit is handed to another worker
+    work_queue_max_attempts = 3     # Claims per unit before it is given up as failed
+    checkpoint = None               # JSON file the crawl frontier is checkpointed to; None disables checkpointing
+    resume = False                  # Continue from the checkpoint instead of starting over
+    checkpoint_interval = 15        # Seconds between checkpoint writes (and once more at close)
+    # Field tables (see EbayScrapper.extraction), compiled once when the spider starts
+    product_fields = PRODUCT_FIELDS
+    product_scopes = PRODUCT_SCOPES
+    card_fields = SRP_CARD_FIELDS
+    # Meta carried from a search result to its product request (and to a browser fallback)
+    product_meta_keys = ('source_keyword', 'current_keyword', 'category_id', 'search_page_number',
+                         'search_url', 'product_id_from_link', 'total_results', 'srp_title', 'srp_price', 'work_unit')
+    # Meta carried from a search page to the next one
+    search_meta_keys = ('source_keyword', 'current_keyword', 'category_id', 'search_page_number', 'search_url_template',
+                        'search_yield')
+    # Concurrency and Playwright limits depend on the run profile and live in settings.py
+    custom_settings = {}
     USER_AGENTS = [
     'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/108.0.0.0 Safari/537.36',
     'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/108.0.0.0 Safari/537.36',
@@ -53,7 +107,81 @@ class MainSpider(scrapy.Spider):
     'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
     ]
 
-    def _make_request(self, url, callback, meta=None, method='GET', body=None, headers=None):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.listing_dedup = None
+        if _to_bool(self.dedup_listings):
+            self.listing_dedup = ListingDeduplicator(self.dedup_backend, int(self.dedup_max_entries))
+        self.normalize_items = _to_bool(self.normalize_items)
+        if self.output_mode not in ("full", "search_only", "hybrid"):
+            raise ValueError(f"Unknown output_mode: {self.output_mode!r}")
+        if isinstance(self.hybrid_filters, str):
+            self.hybrid_filters = json.loads(self.hybrid_filters)
+        self.listing_store = None
+        if self.incremental_store_path:
+            if self.incremental_policy not in ("skip", "defer"):
+                raise ValueError(f"Unknown incremental_policy: {self.incremental_policy!r}")
+            self.incremental_ttl = float(self.incremental_ttl)
+            self.listing_store = ListingStore(self.incremental_store_path)
+        self.change_store = None
+        if self.change_store_path:
+            self.change_store = ChangeStore(self.change_store_path, int(self.change_disappear_after))
+        self._changes_swept = False
+        self.search_policy = SearchPolicy(
+            items_per_page=int(self.search_base_params['_ipg']),
+            max_pages=int(self.max_search_pages_per_keyword),
+            min_page_yield=float(self.min_page_yield),
+            max_suggestions=int(self.max_suggestions_per_keyword),
+        )
+        self._claimed_units = set()
+        self.metrics = MetricsRegistry()  # stage timings, see EbayScrapper.metrics
+        self.events = EventLog(f'{self.name}.events')  # hot-path logging, see EbayScrapper.eventlog
+        self.product_extractor = FieldExtractor(self.product_fields, self.product_scopes)
+        self.card_extractor = FieldExtractor(self.card_fields)
+        if self.work_queue:
+            self.worker_id = self.worker_id or f"{socket.gethostname()}-{os.getpid()}"
+            self.work_queue_prefetch = int(self.work_queue_prefetch)
+            self.work_queue = open_work_queue(self.work_queue, float(self.work_queue_lease),
+                                              int(self.work_queue_max_attempts), self.work_queue_namespace)
+        self.resume = _to_bool(self.resume)
+        self.resumed = False
+        if self.checkpoint and self.work_queue:
+            # The shared queue already survives crashed workers
+            self.logger.warning("checkpoint is ignored in sharded mode; the work queue keeps the crawl state")
+            self.checkpoint = None
+        elif self.checkpoint:
+            self.checkpoint = CrawlCheckpoint(self.checkpoint, float(self.checkpoint_interval))
+            if self.resume:
+                self.resumed = self.checkpoint.load()
+                if not self.resumed:
+                    self.logger.warning(f"No checkpoint at {self.checkpoint.path}; starting a new crawl")
+        elif self.resume:
+            raise ValueError("resume needs a checkpoint file (-a checkpoint=...)")
+
+
+    @classmethod
+    def from_crawler(cls, crawler, *args, **kwargs):
+        spider = super().from_crawler(crawler, *args, **kwargs)
+        crawler.signals.connect(spider.spider_idle, signal=signals.spider_idle)
+        spider.events.open(crawler.settings)
+        return spider
+
+
+    def closed(self, reason):
+        if self.listing_store:
+            self.listing_store.close()
+        if self.change_store:
+            self.change_store.close()
+        if self.work_queue:
+            self.logger.info(f"Work queue state at shutdown of worker {self.worker_id}: {self.work_queue.counts()}")
+            self.work_queue.close()
+        if self.checkpoint:
+            self.checkpoint.save()
+            self.logger.info(f"Checkpoint saved to {self.checkpoint.path}: {self.checkpoint.counts()}")
+        self.events.close()
+
+
+    def _make_request(self, url, callback, meta=None, method='GET', body=None, headers=None, errback=None, dont_filter=False, priority=0):
         if not headers:
             headers = {
                 'User-Agent': random.choice(self.USER_AGENTS)
@@ -63,24 +191,172 @@ class MainSpider(scrapy.Spider):
         if self.use_tor and self.tor_proxy_address:
             meta['proxy'] = self.tor_proxy_address
             
-        self.logger.info(f"Making request to {url} with method {method} and headers {headers}")
-        return scrapy.Request(url, callback=callback, meta=meta, method=method, body=body, headers=headers, errback=self.error_handler)
+        self.events.event('request', url=url, method=method, priority=priority)
+        return scrapy.Request(url, callback=callback, meta=meta, method=method, body=body, headers=headers,
+                              errback=errback or self.error_handler, dont_filter=dont_filter, priority=priority)
 
 
     def error_handler(self, failure):
         self.logger.error(f"Request failed: {failure.request.url}")
         self.logger.error(f"Failure reason: {failure.value}")
+        self.metrics.inc('ebay_download_errors_total', endpoint=failure.request.meta.get('ebay_endpoint') or classify_url(failure.request.url))
+        if failure.request.meta.get('work_unit'):
+            self.fail_work_unit(failure.request.meta['work_unit'])
+
+
+    async def product_error_handler(self, failure):
+        # Browser requests that fail after the page was opened still own it.
+        self.error_handler(failure)
+        page = failure.request.meta.get('playwright_page')
+        if page:
+            await self._release_page(page, failure.request.meta, reusable=False)
+
+
+    async def _release_page(self, page, meta, reusable=True):
+        # Hands the page back to the pool (see EbayScrapper.browser) or closes it.
+        pool = getattr(self, 'page_pool', None)
+        if pool is None:
+            await page.close()
+        elif reusable:
+            await pool.release(page, meta.get('playwright_context', 'default'))
+        else:
+            await pool.discard(page)
+
+
+    async def save_debug_info(self, page, product_id, reason, html=None):
+        # Grabs the page for EbayScrapper.debug, which writes it in the background.
+        # Sampled and rate limited per failure type, so failing renders stay cheap.
+        capture = getattr(self, 'debug_capture', None)
+        if capture is None or not capture.admit(reason):
+            return
+        try:
+            with self.metrics.timer('ebay_debug_capture_seconds', reason=reason):
+                if html is None:
+                    html = await page.content()
+                screenshot = None
+                if capture.screenshots:
+                    screenshot = await page.screenshot(type='jpeg', quality=50, timeout=5000)
+        except Exception as e:
+            self.logger.warning(f"Could not capture debug info for {product_id}: {e}")
+            return
+        if capture.submit(reason, product_id, page.url, html, screenshot):
+            self.events.event('debug_capture', reason=reason, product_id=product_id)
+
+
+    def _dispatch(self, kind, key, url, meta, priority=0):
+        # In sharded mode the unit goes to the shared queue, once per key across all
+        # workers, and is requested by whichever worker claims it. Otherwise it is
+        # requested right here, once per key across resumed runs when checkpointing.
+        if self.work_queue is None:
+            if self.checkpoint:
+                if not self.checkpoint.add(kind, key, url, meta, priority):
+                    self.crawler.stats.inc_value('checkpoint/skipped')
+                    return
+                meta = {**meta, 'work_unit': key}
+            yield self._request_for_unit(kind, url, meta, priority)
+        elif self.work_queue.push(kind, key, {'url': url, 'meta': meta, 'priority': priority}, priority):
+            self.crawler.stats.inc_value(f'workqueue/pushed/{kind}')
+        else:
+            self.metrics.inc('ebay_duplicates_total', kind=f'work_unit_{kind}')
+
+
+    def _request_for_unit(self, kind, url, meta, priority=0):
+        if kind == 'product':
+            return self._product_request(url, meta, priority=priority)
+        callback = self.parse_suggestions if kind == 'suggest' else self.parse_search_results
+        return self._make_request(url, callback=callback, meta=meta, priority=priority)
+
+
+    def claim_work(self):
+        # Tops this worker up to work_queue_prefetch claimed units and returns their requests
+        if self.work_queue is None:
+            return []
+        units = self.work_queue.claim(self.worker_id, self.work_queue_prefetch - len(self._claimed_units))
+        requests = []
+        for unit in units:
+            self._claimed_units.add(unit.key)
+            meta = {**unit.payload['meta'], 'work_unit': unit.key}
+            requests.append(self._request_for_unit(unit.kind, unit.payload['url'], meta, unit.payload['priority']))
+        if units:
+            self.crawler.stats.inc_value('workqueue/claimed', len(units))
+        return requests
+
+
+    def complete_work_unit(self, key):
+        # True only for the worker that finishes the unit first
+        if self.work_queue is None:
+            # Checkpointed run: True the first time the unit is settled
+            return self.checkpoint.complete(key)
+        if key not in self._claimed_units:
+            return False
+        self._claimed_units.discard(key)
+        first = self.work_queue.complete(key)
+        self.crawler.stats.inc_value('workqueue/completed' if first else 'workqueue/completed_elsewhere')
+        return first
+
+
+    def fail_work_unit(self, key):
+        if self.work_queue is None:
+            retried = self.checkpoint.fail(key)
+            if retried is not None:  # not for units already completed, e.g. by description_error_handler
+                self.crawler.stats.inc_value('checkpoint/retry_on_resume' if retried else 'checkpoint/failed')
+            return
+        if key not in self._claimed_units:
+            return
+        self._claimed_units.discard(key)
+        requeued = self.work_queue.fail(key)
+        self.crawler.stats.inc_value('workqueue/requeued' if requeued else 'workqueue/failed')
+
+
+    def spider_idle(self):
+        # Sharded mode: pull more work, and keep the worker alive while units are
+        # still queued or being worked on by other workers.
+        if self.work_queue is None:
+            self._sweep_changes()
+            return
+        # Nothing is in flight when the spider is idle, so units still marked as
+        # claimed never produced a response (e.g. dropped by the dupefilter).
+        for key in list(self._claimed_units):
+            self.fail_work_unit(key)
+        requests = self.claim_work()
+        for request in requests:
+            self.crawler.engine.crawl(request)
+        if requests or self.work_queue.open_units():
+            raise DontCloseSpider
 
 
     async def start(self):
-        for kwd in self.search_keywords:
-            if self.use_suggestions and self.suggestion_url_template:
+        if self.resumed:
+            # Units that were requested but never finished before the last checkpoint
+            pending = list(self.checkpoint.pending.items())
+            self.logger.info(f"Resuming from {self.checkpoint.path}: {self.checkpoint.counts()}")
+            self.crawler.stats.set_value('checkpoint/replayed', len(pending))
+            for key, unit in pending:
+                meta = {**unit['meta'], 'work_unit': key}
+                yield self._request_for_unit(unit['kind'], unit['url'], meta, unit['priority'])
+        for request in self._seed_requests(self.search_keywords, self.allowed_categories, self.use_suggestions):
+            yield request
+        if self.work_queue is not None:
+            # Every worker seeds the same units; the queue keeps one of each
+            for request in self.claim_work():
+                yield request
+
+
+    def _seed_requests(self, keywords, categories, use_suggestions, extra_meta=None):
+        # First requests for each keyword: its autosuggest call, or page 1 of each category.
+        # extra_meta is added to every seed (e.g. a service job's job_id).
+        extra_meta = extra_meta or {}
+        for kwd in keywords:
+            if use_suggestions and self.suggestion_url_template:
                 params = {**self.suggestion_base_params, 'kwd': kwd}
                 suggestion_url = self.suggestion_url_template.format(**params)
                 self.logger.info(f"Fetching suggestions for '{kwd}' from: {suggestion_url}")
-                yield self._make_request(suggestion_url, callback=self.parse_suggestions,meta={'original_keyword': kwd})
+                request_meta = {**extra_meta, 'original_keyword': kwd}
+                if list(categories) != list(self.allowed_categories):
+                    request_meta['categories'] = list(categories)
+                yield from self._dispatch('suggest', f'suggest:{kwd}', suggestion_url, request_meta)
             else:
-                for cat in self.allowed_categories:
+                for cat in categories:
                     self.logger.info(f"Using category ID: {cat} for keyword: '{kwd}'")
                     search_params = self.search_base_params.copy()
                     search_params['_nkw'] = kwd
@@ -88,13 +364,19 @@ class MainSpider(scrapy.Spider):
                     search_params['_pgn'] = 1
                     full_search_url = self.search_base_url_template.format(**search_params)
                     request_meta = {
+                        **extra_meta,
                         'source_keyword': kwd,
                         'current_keyword': kwd,
                         'category_id': cat,
                         'search_page_number': 1,
                         'search_url_template': self.search_base_url_template
                     }
-                    yield self._make_request(full_search_url, callback=self.parse_search_results, meta=request_meta)
+                    yield from self._dispatch('search', f'search:{cat}:{kwd}:1', full_search_url, request_meta)
+
+
+    def _listing_dedup_for(self, meta):
+        # The deduplicator a search page's listings are checked against
+        return self.listing_dedup
 
 
     def parse_suggestions(self, response):
@@ -104,27 +386,34 @@ class MainSpider(scrapy.Spider):
 
             # Process the JSON response
             sug_list = data.get("richRes", {}).get("sug", [])
-            print(sug_list)
-            for cat_id in self.allowed_categories:
+            original_keyword = response.meta.get('original_keyword', '')
+            ranked = []
+            if sug_list and isinstance(sug_list, list):
+                # Capped and ranked by expected yield (see EbayScrapper.scheduling)
+                ranked = self.search_policy.rank_suggestions([sug_item.get("kwd") for sug_item in sug_list if isinstance(sug_item, dict)])
+                if len(ranked) < len(sug_list):
+                    self.crawler.stats.inc_value('scheduling/suggestions_dropped', len(sug_list) - len(ranked))
+                self.events.event('suggestions', keyword=original_keyword, received=len(sug_list), searched=ranked)
+            for cat_id in response.meta.get('categories', self.allowed_categories):
                 search_params = self.search_base_params.copy()
                 search_params['_sacat'] = cat_id
                 search_params['_pgn'] = 1
-                if sug_list and isinstance(sug_list, list):
-                    for sug_item in sug_list:
-                        kwd = sug_item.get("kwd")
+                if ranked:
+                    for kwd, expected_yield in ranked:
                         search_params['_nkw'] = kwd
-                        self.logger.info(f" Suggested keyword: '{sug_item}', Category ID: '{cat_id}'")
                         sug_url = self.search_base_url_template.format(**search_params)
                         request_meta = {
-                            'source_keyword': response.meta.get('original_keyword', ''),
+                            'source_keyword': original_keyword,
                             'current_keyword': kwd,
                             'category_id': cat_id,
                             'search_page_number': 1,
-                            'search_url_template': self.search_base_url_template
+                            'search_url_template': self.search_base_url_template,
+                            'search_yield': expected_yield,
                         }
-                        yield self._make_request(sug_url, callback=self.parse_search_results, meta=request_meta)
+                        yield from self._dispatch('search', f'search:{cat_id}:{kwd}:1', sug_url, request_meta,
+                                                  self.search_policy.search_priority(1, expected_yield))
                 else:
-                    self.logger.warning(f"No valid suggestions for '{kwd}'. Using original keyword.")
+                    self.logger.warning(f"No valid suggestions for '{original_keyword}'. Using original keyword.")
                     search_params['_nkw'] = response.meta.get('original_keyword', '')
                     full_search_url = self.search_base_url_template.format(**search_params)
                     request_meta = {
@@ -134,7 +423,7 @@ class MainSpider(scrapy.Spider):
                         'search_page_number': 1,
                         'search_url_template': self.search_base_url_template
                     }
-                    yield self._make_request(full_search_url, callback=self.parse_search_results, meta=request_meta)
+                    yield from self._dispatch('search', f"search:{cat_id}:{search_params['_nkw']}:1", full_search_url, request_meta)
         except json.JSONDecodeError:
             self.logger.error(f"Failed to decode JSON from suggestion response for '{response.url}'. Body: {response.text[:300]}")
             return
@@ -145,101 +434,296 @@ class MainSpider(scrapy.Spider):
 
 
     def parse_search_results(self, response):
+        parse_started = time.perf_counter()
         source_keyword = response.meta['source_keyword']
         current_keyword = response.meta['current_keyword']
         category_id = response.meta['category_id']
         current_page_num = response.meta['search_page_number']
         search_url_template = response.meta['search_url_template']
 
-        if source_keyword != current_keyword:
-            display_keyword_log = f"{current_keyword} (source: {source_keyword})"
-        else:
-            display_keyword_log = current_keyword
-        
-        self.logger.info(f"Parsing search results for '{display_keyword_log}', Category: '{category_id}', Page: {current_page_num} from {response.url}")
+        # One srp_page event per page, emitted on the way out
+        page_event = {'keyword': current_keyword, 'source_keyword': source_keyword, 'category': category_id,
+                      'page': current_page_num, 'url': response.url}
 
         # Extract total results
         total_results_text = response.css('div.srp-controls__count h1.srp-controls__count-heading span.BOLD:first-child::text').get()
-        total_results = int(total_results_text.strip()) if total_results_text else 0
-        self.logger.info(f"Total results reported: {total_results}")
-
+        total_results = int(re.sub(r'\D', '', total_results_text) or 0) if total_results_text else 0  # e.g. "1,234+"
+        page_event['total_results'] = total_results
 
         if total_results == 0:
-            self.logger.info(f"No results found for '{display_keyword_log}' in category '{category_id}' on page {current_page_num}.")
+            self.events.event('srp_page', **page_event, outcome='no_results')
             return
         
-        # Extract product links
+        # Extract product cards
         separator_xpath = "//li[contains(@class, 'srp-river-answer srp-river-answer--REWRITE_START')]"
-        link_path_within_item = "/div[contains(@class, 's-item__wrapper')]/div[contains(@class, 's-item__info')]/a[contains(@class, 's-item__link')]/@href"
+        link_path_within_item = "./div[contains(@class, 's-item__wrapper')]/div[contains(@class, 's-item__info')]/a[contains(@class, 's-item__link')]/@href"
 
         # Check if the separator exists
         separator_node = response.xpath(separator_xpath).get()
-        product_links = []
+        product_cards = []
         if separator_node:
-            self.logger.info(f"Separator found in {search_url_template}. Fetching items listed above it.")
-            items_above_separator_xpath = f"{separator_xpath}/preceding-sibling::li[contains(@class, 's-item')]{link_path_within_item}"
-            product_links = response.xpath(items_above_separator_xpath).getall()
+            # Listings below the separator are rewrites of the query; only the ones above it are fetched
+            page_event['layout'] = 'separator'
+            product_cards = response.xpath(f"{separator_xpath}/preceding-sibling::li[contains(@class, 's-item')]")
+            product_cards = [card for card in product_cards if card.xpath(link_path_within_item)]
         else:
-            self.logger.info("Separator not found. Fetching all items on the page.")
-            all_items_xpath = f"//li[contains(@class, 's-item')]{link_path_within_item}"
-            product_links = response.xpath(all_items_xpath).getall()
-            # ignore the first two links which are not product links
-            product_links = product_links[2:] if len(product_links) >= 2 else None
-
-        if not product_links:
-            self.logger.info(f"No product links found for '{display_keyword_log}' in category '{category_id}' on page {current_page_num}.")
+            page_event['layout'] = 'full'
+            product_cards = response.xpath("//li[contains(@class, 's-item')]")
+            product_cards = [card for card in product_cards if card.xpath(link_path_within_item)]
+            # ignore the first two cards which are not product links
+            product_cards = product_cards[2:] if len(product_cards) >= 2 else None
+
+        if not product_cards:
+            self.events.event('srp_page', **page_event, outcome='no_listings')
             return
         
-        self.logger.info(f"Found {len(product_links)} product links for '{display_keyword_log}' in category '{category_id}' on page {current_page_num}.")
+        self.metrics.observe('ebay_parse_seconds', time.perf_counter() - parse_started, kind='srp')
+        if self.change_store:
+            self.change_store.scopes.add(current_keyword)
         product_count_on_page = 0
-        for link in product_links:
+        duplicate_count_on_page = 0
+        unchanged_count_on_page = 0
+        new_count_on_page = 0
+        missing_id_count_on_page = 0
+        for card in product_cards:
+            link = card.xpath(link_path_within_item).get()
             product_id_match = re.search(r'/itm/(\d+)', link)
             if not product_id_match:
-                self.logger.warning(f"Could not extract product ID from link: {link}")
+                missing_id_count_on_page += 1
+                continue
+            product_id = product_id_match.group(1)
+            if self.change_store:
+                self.change_store.sighted(product_id, current_keyword)
+            listing_dedup = self._listing_dedup_for(response.meta)
+            if listing_dedup is not None and not listing_dedup.first_sighting(product_id, current_keyword):
+                # Already scheduled by another keyword/category/page; only its provenance is recorded
+                duplicate_count_on_page += 1
                 continue
+            new_count_on_page += 1
+            card_fields = self._extract_card_fields(card)
             meta = {
                 'source_keyword': source_keyword,
                 'current_keyword': current_keyword,
                 'category_id': category_id,
                 'search_page_number': current_page_num,
                 'search_url': response.url,
-                'product_id_from_link': product_id_match.group(1),
+                'product_id_from_link': product_id,
                 'total_results': total_results,
-                'playwright': True,
-                "playwright_include_page": True, # to take screenshots if needed
+                'srp_title': card_fields['title'],
+                'srp_price': card_fields['price'],
             }
-            yield self._make_request(url=link, callback=self.parse_product_page,meta=meta)
+            if self.output_mode != "full":
+                yield self._search_result_item(card_fields, link, meta)
+                if self.output_mode == "search_only" or not self._matches_hybrid_filters(card_fields):
+                    continue
+            # Listings already discovered are rendered before further search pages
+            priority = self.search_policy.product_priority(current_page_num)
+            if self.listing_store and self.listing_store.is_fresh(product_id, meta['srp_title'], meta['srp_price'], self.incremental_ttl):
+                unchanged_count_on_page += 1
+                if self.incremental_policy == "skip":
+                    continue
+                priority = DEFERRED_PRODUCT_PRIORITY  # Rendered only once new and changed listings are done
+            yield from self._dispatch('product', f'product:{product_id}', link, meta, priority)
             product_count_on_page += 1
 
-        self.logger.info(f"Total products processed on page {current_page_num} for '{display_keyword_log}': {product_count_on_page}")
+        page_event.update(cards=len(product_cards), products=product_count_on_page, duplicates=duplicate_count_on_page,
+                          unchanged=unchanged_count_on_page, missing_ids=missing_id_count_on_page)
+        if missing_id_count_on_page:
+            self.crawler.stats.inc_value('srp/links_without_id', missing_id_count_on_page)
+        if duplicate_count_on_page:
+            self.crawler.stats.inc_value('dedup/duplicate_listings', duplicate_count_on_page)
+            self.metrics.inc('ebay_duplicates_total', duplicate_count_on_page, kind='listing')
+        if unchanged_count_on_page:
+            self.crawler.stats.inc_value(f'incremental/unchanged_{self.incremental_policy}', unchanged_count_on_page)
         
         # check if we need to fetch more pages (Appear only if products spread on many pages)
         ebay_current_search_page_num = response.xpath(
             '//h2[contains(@class, "clipped") and contains(text(), "Results Pagination")]/text()'
         ).re_first(r'Page (\d+)')
+        # Depth follows total_results and the share of new listings so far (see EbayScrapper.scheduling)
+        expected_yield = self.search_policy.page_yield(response.meta.get('search_yield'), new_count_on_page, len(product_cards))
+        stop_reason = self.search_policy.stop_reason(current_page_num, total_results, expected_yield,
+                                                     response.meta.get('max_search_pages'))
+        page_event['yield'] = round(expected_yield, 3)
         if ebay_current_search_page_num is None:
-            self.logger.warning(f"Could not extract current search page number from response for '{display_keyword_log}' in category '{category_id}'. Assuming page 1.")
+            self.logger.warning(f"Could not extract current search page number from {response.url}; not paginating '{current_keyword}' in category '{category_id}'")
+            self.events.event('srp_page', **page_event, outcome='no_pagination')
             return
-        elif current_page_num < self.max_search_pages_per_keyword and int(ebay_current_search_page_num) == current_page_num:
+        elif stop_reason is None and int(ebay_current_search_page_num) == current_page_num:
             next_page_num = current_page_num + 1
-            self.logger.info(f"Preparing to fetch next page {next_page_num} for '{display_keyword_log}' in category '{category_id}'.")
-            meta = response.meta.copy()
+            self.events.event('srp_page', **page_event, outcome='next_page')
+            meta = {key: response.meta[key] for key in self.search_meta_keys if key in response.meta}
             meta['search_page_number'] += 1
+            meta['search_yield'] = round(expected_yield, 3)
             search_params = self.search_base_params.copy()
             search_params['_pgn'] = next_page_num
             search_params['_nkw'] = current_keyword
-            yield self._make_request(
+            search_params['_sacat'] = category_id
+            yield from self._dispatch(
+                'search',
+                f'search:{category_id}:{current_keyword}:{next_page_num}',
                 search_url_template.format(**search_params),
-                callback=self.parse_search_results,
-                meta=meta
+                meta,
+                self.search_policy.search_priority(next_page_num, expected_yield)
             )
         else:
-            self.logger.info(f"Reached maximum search pages for '{display_keyword_log}' in category '{category_id}' or no more pages available.")
+            if stop_reason:
+                self.crawler.stats.inc_value('scheduling/pagination_stopped')
+            self.events.event('srp_page', **page_event, outcome='last_page', stop_reason=stop_reason or 'no more pages available')
+
+
+    def _extract_card_fields(self, card):
+        # Everything an SRP card shows about a listing (card_fields)
+        with self.metrics.timer('ebay_parse_seconds', kind='srp_card'):
+            card_fields, _ = self.card_extractor.extract(card.root)
+        return card_fields
+
+
+    def _search_result_item(self, card_fields, link, meta):
+        item = EbaySearchResultItem(card_fields)
+        item['product_id'] = meta['product_id_from_link']
+        item['link'] = link
+        item['derived_from_keyword'] = meta['current_keyword']
+        item['category_context_from_search'] = meta['category_id']
+        item['search_page_number'] = meta['search_page_number']
+        return item
+
+
+    def _matches_hybrid_filters(self, card_fields):
+        filters = self.hybrid_filters
+        if 'min_price' in filters or 'max_price' in filters:
+            # "$1,234.56" or a range like "$10.00 to $20.00" (the lower bound is used)
+            price, _ = parse_price(card_fields['price'])
+            if price is None:
+                return False
+            if price < float(filters.get('min_price', price)) or price > float(filters.get('max_price', price)):
+                return False
+        if filters.get('conditions') and (card_fields['condition'] or '').lower() not in [c.lower() for c in filters['conditions']]:
+            return False
+        title = card_fields['title'].lower()
+        if filters.get('title_contains') and not any(term.lower() in title for term in filters['title_contains']):
+            return False
+        if any(term.lower() in title for term in filters.get('title_excludes', [])):
+            return False
+        return True
+
+
+    def _product_request(self, link, meta, priority=0):
+        # Product pages are rendered by Playwright unless static extraction is enabled.
+        if self.product_page_mode == "static":
+            return self._make_request(url=link, callback=self.parse_product_page_static, meta=meta, priority=priority)
+        meta = {**meta, 'playwright': True, "playwright_include_page": True}  # to take screenshots if needed
+        return self._make_request(url=link, callback=self.parse_product_page, meta=meta, priority=priority,
+                                  errback=self.product_error_handler)
+
+
+    def _browser_fallback(self, response, reason):
+        # Re-request a product page through Playwright after a static attempt failed.
+        meta = {key: response.meta[key] for key in self.product_meta_keys if key in response.meta}
+        meta['playwright'] = True
+        meta['playwright_include_page'] = True
+        meta['dont_cache'] = True  # the response being replaced may itself have come from the cache
+        url = response.meta.get('redirect_urls', [response.url])[0]
+        self.events.event('browser_fallback', url=url, reason=reason)
+        return self._make_request(url=url, callback=self.parse_product_page, meta=meta, dont_filter=True,
+                                  errback=self.product_error_handler)
+
+
+    def _finalize_item(self, item, meta):
+        # Attaches every keyword that surfaced the listing, including duplicate sightings,
+        # records the listing for the next incremental run and returns what is emitted for it.
+        # In sharded or checkpointed runs only the first completion of a listing emits
+        # it; later ones get None, which Scrapy ignores.
+        if meta.get('work_unit') and not self.complete_work_unit(meta['work_unit']):
+            self.events.event('work_unit_dropped', unit=meta['work_unit'], reason='already completed')
+            return None
+        if self.listing_store and item.get('product_id'):
+            self.listing_store.record(item['product_id'], meta.get('srp_title'), meta.get('srp_price'))
+        listing_dedup = self._listing_dedup_for(meta)
+        keywords = listing_dedup.keywords_for(item.get('product_id')) if listing_dedup is not None else []
+        if not keywords and item.get('derived_from_keyword'):
+            keywords = [item['derived_from_keyword']]
+        item['derived_from_keywords'] = keywords
+        if self.change_store:
+            return self._change_event(item)
+        if self.normalize_items:
+            # Converted before the item enters the scraper queue, so queued and
+            # in-pipeline listings are slotted records rather than dict-backed items
+            return normalize_listing(item)
+        return item
+
+
+    def _change_event(self, item):
+        # Change-detection output: the listing as a ListingChangeItem, or None when unchanged
+        diff = self.change_store.diff(item, item.get('derived_from_keyword'))
+        if diff is None:
+            self.crawler.stats.inc_value('changes/unchanged')
+            return None
+        event, changed, previous_price = diff
+        self.crawler.stats.inc_value(f'changes/{event}')
+        return ListingChangeItem(
+            event=event,
+            product_id=item.get('product_id'),
+            link=item.get('link'),
+            changes={name: item.get(name) for name in changed},
+            previous_price=previous_price,
+            derived_from_keyword=item.get('derived_from_keyword'),
+            detected_at=datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        )
+
+
+    def _sweep_changes(self):
+        # Once the crawl is done, reports listings missing from their keyword's results.
+        # Sharded workers only see part of the results and never sweep.
+        if self.change_store is None or self._changes_swept:
+            return
+        self._changes_swept = True
+        detected_at = datetime.now(timezone.utc).isoformat(timespec='seconds')
+        gone = self.change_store.sweep()
+        for product_id, link, keyword, price in gone:
+            event = ListingChangeItem(event='disappeared', product_id=product_id, link=link, changes={},
+                                      previous_price=price, derived_from_keyword=keyword, detected_at=detected_at)
+            self.crawler.engine.scraper.start_itemproc(event, response=None)
+        if gone:
+            self.crawler.stats.inc_value('changes/disappeared', len(gone))
+            raise DontCloseSpider  # let the events clear the pipelines before closing
+
+
+    def _extract_product_fields(self, root, item, url, meta):
+        # Populates every field except the description from the parsed page (an lxml
+        # root, see product_fields). Returns False when a required field is missing.
+        extraction_successful = True
+
+        # Populate meta fields
+        item['derived_from_keyword'] = meta.get('current_keyword')
+        item['category_context_from_search'] = meta.get('category_id')
+        item['link'] = url
+        item['product_id'] = meta.get('product_id_from_link', 'unknown')
+
+        if not item['product_id']:
+            self.logger.warning(f"Product ID not found in response meta for {url}.")
+            extraction_successful = False
+
+        values, missing = self.product_extractor.extract(root)
+        for name, value in values.items():
+            item[name] = value
+        if not item.get('category'):
+            item['category'] = meta.get('category_id', "N/A")
+        for name in missing:
+            self.events.event('field_missing', logging.WARNING, field=name, url=url)
+            self.metrics.inc('ebay_extraction_failures_total', field=name)
+            extraction_successful = False
+
+        return extraction_successful
 
 
     async def parse_product_page(self, response):
-        self.logger.info(f"Parsing product page: {response.url}")
-        page = response.meta['playwright_page']  # Get the Playwright page object
+        page = response.meta.get('playwright_page')  # Get the Playwright page object
+        if page is None:
+            # A render served from the HTTP cache has no live page; its HTML is parsed like a static page
+            for output in self.parse_product_page_static(response):
+                yield output
+            return
 
         extraction_successful = True
         item = EbayscrapperItem()
@@ -247,112 +731,30 @@ class MainSpider(scrapy.Spider):
         try:
             # Handle challenge page if necessary
             if "splashui/challenge" in page.url:
-                self.logger.info(f"Challenge page detected for {response.url}")
+                challenge_started = time.perf_counter()
                 try:
-                    await page.wait_for_url(lambda url: "/itm/" in url, timeout=60000)
-                    self.logger.info(f"Navigated to product page: {page.url}")
+                    with self.metrics.timer('ebay_challenge_wait_seconds'):
+                        await page.wait_for_url(lambda url: "/itm/" in url, timeout=60000)
+                    self.events.event('challenge', url=response.url, passed=True,
+                                      seconds=round(time.perf_counter() - challenge_started, 3))
                 except Exception as e:
-                    self.logger.error(f"Failed to wait for product page navigation: {e}")
+                    self.events.event('challenge', logging.WARNING, url=response.url, passed=False, error=str(e))
                     extraction_successful = False
-                    await self.save_debug_info(page, response.meta.get('product_id_from_link', 'unknown'))
+                    await self.save_debug_info(page, response.meta.get('product_id_from_link', 'unknown'), 'challenge_timeout')
                     return
 
             # Get the updated HTML content after navigation
-            html = await page.content()
-            selector = scrapy.Selector(text=html)
-
-            # Populate meta fields
-            item['derived_from_keyword'] = response.meta.get('current_keyword')
-            item['category_context_from_search'] = response.meta.get('category_id')
-            item['link'] = page.url
-            item['product_id'] = response.meta.get('product_id_from_link', 'unknown')
-            
-            if not item['product_id']:
-                self.logger.warning(f"Product ID not found in response meta for {page.url}.")
-                extraction_successful = False
-
-            # --- Product Information ---
-            # Title
-            item['title'] = selector.css('h1.x-item-title__mainTitle span.ux-textspans--BOLD::text').get()
-            if item['title']:
-                item['title'] = item['title'].strip()
-            else:
-                self.logger.warning(f"Could not extract title for {page.url}")
-                extraction_successful = False
-
-            # Price
-            item['price'] = None
-            approx_price_selector = 'div[data-testid="x-price-approx"] span.x-price-approx__price span.ux-textspans::text'
-            approx_price_text = selector.css(approx_price_selector).get()
-            if approx_price_text and "US $" in approx_price_text:
-                item['price'] = approx_price_text.strip()
-            if not item['price']:
-                primary_price_selector = 'div[data-testid="x-price-primary"] span.ux-textspans::text'
-                primary_price_text = selector.css(primary_price_selector).get()
-                if primary_price_text and "US $" in primary_price_text:
-                    item['price'] = primary_price_text.strip()
-            if not item['price']:
-                self.logger.warning(f"Could not extract US price for {page.url}")
-                extraction_successful = False
-
-            # Category
-            breadcrumbs_texts = selector.css('nav.breadcrumbs ul li a span::text').getall()
-            if not breadcrumbs_texts:
-                breadcrumbs_texts = selector.xpath("//nav[contains(@aria-label, 'breadcrumb')]//li//a/descendant-or-self::*/text()").getall()
-            item['category'] = " > ".join([b.strip() for b in breadcrumbs_texts if b.strip()]) if breadcrumbs_texts else response.meta.get('category_id', "N/A")
-
-            # Condition
-            item['condition'] = selector.css('div.x-item-condition-text span.ux-textspans::text').get()
-            if item['condition']:
-                item['condition'] = item['condition'].strip()
-
-            # Brand
-            brand_selector_xpath = "//dl[contains(@class, 'ux-labels-values--brand')]/dd//span[@class='ux-textspans']/text()"
-            item['brand'] = selector.xpath(brand_selector_xpath).get()
-            if item['brand']:
-                item['brand'] = item['brand'].strip()
-
-            # Location
-            raw_loc = selector.xpath("//span[contains(@class, 'ux-textspans--SECONDARY') and starts-with(normalize-space(.), 'Located in:')]/text()").get()
-            if raw_loc:
-                item['location'] = raw_loc.replace('Located in:', '').strip()
-
-            # Return Policy
-            raw_returns = selector.xpath("//div[contains(@class, 'ux-labels-values--returns')]//div[@class='ux-labels-values__values-content']//text()").get()
-            if raw_returns:
-                item['return_policy'] = raw_returns.strip()
-
-            # --- Seller Information ---
-            # Seller Name
-            item['seller_name'] = selector.css('div.x-sellercard-atf__info__about-seller a span.ux-textspans--BOLD::text').get()
-            if item['seller_name']:
-                item['seller_name'] = item['seller_name'].strip()
-
-            # Seller Feedback Count
-            seller_feedback_count_text = selector.css('div.x-sellercard-atf__about-seller-item span.ux-textspans--SECONDARY::text').get()
-            if seller_feedback_count_text:
-                item['seller_feedback_count'] = seller_feedback_count_text.strip('()')
-
-            # Seller Rating Percentage
-            seller_rating_percentage = selector.css('div.x-sellercard-atf__data-item button span.ux-textspans--PSEUDOLINK::text').get()
-            if seller_rating_percentage:
-                item['seller_positive_feedback_percentage'] = seller_rating_percentage.strip()
-
-            # Seller Link
-            item['seller_link'] = selector.css('div.x-sellercard-atf__info__about-seller a::attr(href)').get()
-
-            # Top Rated Seller Status
-            item['top_rated_seller'] = bool(selector.css('span.ux-program-badge svg use[href="#icon-top-rated-seller-24"]').get())
-
-            # Image URLs
-            image_urls = selector.css('div.ux-image-grid button.ux-image-grid-item img[src*="s-l"]::attr(src)').getall()
-            item['image_urls'] = image_urls if image_urls else selector.xpath('//*[@id="PicturePanel"]/div[1]/div/div[1]/div[1]/div[1]/div[3]/div/img/@src').getall()
-            if not item['image_urls']:
-                self.logger.warning(f"No images found for {page.url}")
-                extraction_successful = False
+            with self.metrics.timer('ebay_page_content_seconds'):
+                html = await page.content()
+            with self.metrics.timer('ebay_parse_seconds', kind='product'):
+                root = scrapy.Selector(text=html).root
+                extraction_successful = self._extract_product_fields(root, item, page.url, response.meta)
+            if not extraction_successful:
+                await self.save_debug_info(page, item.get('product_id'), 'missing_fields', html=html)
 
             # Extract description from iframe
             # --- Extract description from <iframe id="desc_ifr"> ---
+            description_started = time.perf_counter()
             try:
                 # 1. Wait for the iframe element to appear
                 await page.wait_for_selector('#desc_ifr', timeout=30000)
@@ -377,19 +779,72 @@ class MainSpider(scrapy.Spider):
                 else:
                     item['description'] = "Description not found."
             except Exception as e:
-                self.logger.warning(f"Could not extract description from iframe: {e}")
+                self.events.event('description_missing', logging.WARNING, url=page.url, error=str(e))
                 item['description'] = "Description not found."
+            self.metrics.observe('ebay_description_wait_seconds', time.perf_counter() - description_started,
+                                 found=item['description'] != "Description not found.")
 
         except Exception as e:
             self.logger.error(f"Unexpected error during parsing of product page {page.url}: {e}", exc_info=True)
             extraction_successful = False
-            await self.save_debug_info(page, response.meta.get('product_id_from_link', 'unknown'))
+            await self.save_debug_info(page, response.meta.get('product_id_from_link', 'unknown'), 'parse_error')
 
         finally:
-            await page.close()
+            # Pages that hit an error are closed rather than recycled
+            await self._release_page(page, response.meta, reusable=extraction_successful)
 
         if extraction_successful:
-            self.logger.info(f"Successfully parsed product: {item.get('title', 'N/A')[:60]}... from {page.url}")
-            yield item
+            self.events.event('product_parsed', product_id=item.get('product_id'), url=page.url, mode='browser')
+            yield self._finalize_item(item, response.meta)
         else:
-            self.logger.warning(f"Extraction failed for {page.url}. Debug info saved.")
\ No newline at end of file
+            self.logger.warning(f"Extraction failed for {page.url}")
+
+
+    def parse_product_page_static(self, response):
+        # Browserless extraction: same selectors on the downloaded HTML, description fetched from the iframe src.
+        if "splashui/challenge" in response.url:
+            yield self._browser_fallback(response, "challenge redirect")
+            return
+
+        item = EbayscrapperItem()
+        with self.metrics.timer('ebay_parse_seconds', kind='product_static'):
+            extracted = self._extract_product_fields(response.selector.root, item, response.url, response.meta)
+        if not extracted:
+            yield self._browser_fallback(response, "required fields missing")
+            return
+
+        description_src = response.css('iframe#desc_ifr::attr(src)').get()
+        if not description_src:
+            self.events.event('description_missing', logging.WARNING, url=response.url, error='no iframe')
+            item['description'] = "Description not found."
+            yield self._finalize_item(item, response.meta)
+            return
+
+        meta = {key: response.meta[key] for key in self.product_meta_keys if key in response.meta}
+        meta['item'] = item
+        yield self._make_request(
+            response.urljoin(description_src),
+            callback=self.parse_description,
+            meta=meta,
+            errback=self.description_error_handler,
+        )
+
+
+    def parse_description(self, response):
+        item = response.meta['item']
+        # Approximates document.body.innerText: visible text nodes only
+        texts = response.xpath('//body//text()[not(ancestor::script) and not(ancestor::style) and not(ancestor::noscript)]').getall()
+        clean_desc = re.sub(r'\s+', ' ', " ".join(texts)).strip()
+        item['description'] = clean_desc or "Description not found."
+        self.events.event('product_parsed', product_id=item.get('product_id'), url=item['link'], mode='static')
+        yield self._finalize_item(item, response.meta)
+
+
+    def description_error_handler(self, failure):
+        # The product fields are already extracted; emit the item without a description.
+        # Finalized first so the work unit is settled rather than put back by error_handler.
+        item = failure.request.meta['item']
+        item['description'] = "Description not found."
+        item = self._finalize_item(item, failure.request.meta)
+        self.error_handler(failure)
+        yield item
@@ -0,0 +1,43 @@
+from scrapy.exceptions import DontCloseSpider
+
+from EbayScrapper.spiders.main import MainSpider
+
+
+class ServiceSpider(MainSpider):
+    # Daemon mode: stays open and crawls the jobs submitted to the job API
+    # instead of search_keywords (see EbayScrapper.service).
+    #   scrapy crawl service -s SERVICE_PORT=8790
+    name = "service"
+    search_keywords = []
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        if self.work_queue or self.checkpoint:
+            raise ValueError("the crawl service does not support work_queue or checkpoint")
+        self.jobs = {}  # job_id -> Job, shared with JobService
+
+    @classmethod
+    def update_settings(cls, settings):
+        super().update_settings(settings)
+        settings.set('SCHEDULER', 'EbayScrapper.service.FairShareScheduler', priority='spider')
+        settings['EXTENSIONS'].update({'EbayScrapper.service.JobService': 520}, priority='spider')
+        settings['SPIDER_MIDDLEWARES'].update({'EbayScrapper.middlewares.JobMiddleware': 940}, priority='spider')
+        proxied = settings.getlist('PROXY_POOL') or settings.get('PROXY_POOL_FILE')
+        if settings.getbool('SERVICE_WARM_BROWSER') and not settings.getdict('PLAYWRIGHT_CONTEXTS') and not proxied:
+            # Launches the browser and a default context when the engine starts, not with the first job.
+            # With a proxy pool every render uses its proxy's context, so a default one would sit idle.
+            settings.set('PLAYWRIGHT_CONTEXTS', {'default': {}}, priority='spider')
+
+    def spider_idle(self):
+        raise DontCloseSpider
+
+    def error_handler(self, failure):
+        super().error_handler(failure)
+        job = self.jobs.get(failure.request.meta.get('job_id'))
+        if job is not None:
+            job.stats['download_errors'] += 1
+
+    def _listing_dedup_for(self, meta):
+        # Listings are deduplicated within a job; the next job may fetch them again
+        job = self.jobs.get(meta.get('job_id'))
+        return job.listing_dedup if job is not None else self.listing_dedup
@@ -0,0 +1,271 @@
+# Shared work queue for sharded crawls.
+#
+# Search pages, suggestion lookups and product listings become keyed work
+# units. Any number of worker processes (on one host or many) push units into
+# the same queue and claim batches from it:
+#
+#   * push() is idempotent per key, so a listing surfaced by several workers
+#     is queued once and every worker may seed the same keywords.
+#   * claim() leases units to a worker; a unit whose lease expires (crashed
+#     or stuck worker) becomes claimable again.
+#   * complete() succeeds for exactly one caller per key, which is what makes
+#     product output exactly-once even when a unit was processed twice.
+#   * fail() puts the unit back until it has used up its attempts.
+#
+# Backends: a SQLite file for workers on one host, or a Redis-compatible
+# server (Redis, Valkey, KeyDB, Dragonfly, ...) for workers on several hosts.
+# RedisWorkQueue also takes a ready client, so an in-process stand-in such as
+# fakeredis (with Lua support) can replace the server; the tests run it that way.
+
+import json
+import sqlite3
+import time
+from dataclasses import dataclass
+from urllib.parse import urlsplit
+
+from scrapy.exceptions import NotConfigured
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+
+# Seconds a SQLite call waits for another worker's write lock. Every write is a
+# single statement or one claim batch, so locks are held for milliseconds; the
+# wait blocks the reactor, so it is kept short.
+SQLITE_BUSY_TIMEOUT = 2.0
+
+
+@dataclass(slots=True)
+class WorkUnit:
+    key: str
+    kind: str
+    payload: dict
+
+
+class SqliteWorkQueue:
+    def __init__(self, path, lease_seconds=900, max_attempts=3):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        # Autocommit mode; claim() opens its own write transaction
+        self.conn = sqlite3.connect(path, timeout=SQLITE_BUSY_TIMEOUT, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS work_units ("
+            " seq INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " key TEXT NOT NULL UNIQUE,"
+            " kind TEXT NOT NULL,"
+            " payload TEXT NOT NULL,"
+            " priority INTEGER NOT NULL DEFAULT 0,"
+            " state TEXT NOT NULL DEFAULT 'pending',"  # pending | leased | done | failed
+            " worker TEXT,"
+            " lease_expires REAL,"
+            " attempts INTEGER NOT NULL DEFAULT 0)"
+        )
+        self.conn.execute(
+            "CREATE INDEX IF NOT EXISTS work_units_claim ON work_units (state, priority DESC, seq)"
+        )
+
+    def push(self, kind, key, payload, priority=0):
+        # Returns False when the key was already queued (by this or another worker)
+        cursor = self.conn.execute(
+            "INSERT OR IGNORE INTO work_units (key, kind, payload, priority) VALUES (?, ?, ?, ?)",
+            (key, kind, json.dumps(payload), priority),
+        )
+        return cursor.rowcount == 1
+
+    def claim(self, worker_id, limit):
+        if limit <= 0:
+            return []
+        now = time.time()
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            # Expired leases that have used up their attempts are not handed out again
+            self.conn.execute(
+                "UPDATE work_units SET state = 'failed' WHERE state = 'leased' AND lease_expires < ? AND attempts >= ?",
+                (now, self.max_attempts),
+            )
+            rows = self.conn.execute(
+                "SELECT key, kind, payload FROM work_units"
+                " WHERE state = 'pending' OR (state = 'leased' AND lease_expires < ?)"
+                " ORDER BY priority DESC, seq LIMIT ?",
+                (now, limit),
+            ).fetchall()
+            self.conn.executemany(
+                "UPDATE work_units SET state = 'leased', worker = ?, lease_expires = ?, attempts = attempts + 1"
+                " WHERE key = ?",
+                [(worker_id, now + self.lease_seconds, key) for key, _, _ in rows],
+            )
+            self.conn.execute("COMMIT")
+        except BaseException:
+            self.conn.execute("ROLLBACK")
+            raise
+        return [WorkUnit(key, kind, json.loads(payload)) for key, kind, payload in rows]
+
+    def complete(self, key):
+        cursor = self.conn.execute(
+            "UPDATE work_units SET state = 'done', lease_expires = NULL WHERE key = ? AND state != 'done'", (key,)
+        )
+        return cursor.rowcount == 1
+
+    def fail(self, key):
+        # Returns True when the unit was put back for another attempt
+        cursor = self.conn.execute(
+            "UPDATE work_units SET worker = NULL, lease_expires = NULL,"
+            " state = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END"
+            " WHERE key = ? AND state = 'leased'",
+            (self.max_attempts, key),
+        )
+        if cursor.rowcount != 1:
+            return False
+        return self.conn.execute("SELECT state FROM work_units WHERE key = ?", (key,)).fetchone()[0] == 'pending'
+
+    def open_units(self):
+        # Units that are queued or being worked on somewhere
+        return self.conn.execute(
+            "SELECT COUNT(*) FROM work_units WHERE state IN ('pending', 'leased')"
+        ).fetchone()[0]
+
+    def counts(self):
+        return dict(self.conn.execute("SELECT state, COUNT(*) FROM work_units GROUP BY state").fetchall())
+
+    def close(self):
+        self.conn.close()
+
+
+# Queues a unit unless its key is already known. One script, so a worker that
+# dies mid-push leaves either nothing or a complete, claimable unit behind.
+# KEYS: units (hash), priorities (hash), pending (zset); ARGV: key, unit, priority
+_REDIS_PUSH = """
+if redis.call('HSETNX', KEYS[1], ARGV[1], ARGV[2]) == 0 then
+    return 0
+end
+redis.call('HSET', KEYS[2], ARGV[1], ARGV[3])
+redis.call('ZADD', KEYS[3], -tonumber(ARGV[3]), ARGV[1])
+return 1
+"""
+
+# Requeues expired leases, then moves up to ARGV[3] units from pending to leased.
+# KEYS: pending (zset), leases (zset), done (set), attempts (hash), priorities (hash), failed (set)
+# ARGV: now, lease expiry, limit, max attempts
+_REDIS_CLAIM = """
+local expired = redis.call('ZRANGEBYSCORE', KEYS[2], '-inf', ARGV[1])
+for _, key in ipairs(expired) do
+    redis.call('ZREM', KEYS[2], key)
+    if redis.call('SISMEMBER', KEYS[3], key) == 0 then
+        if tonumber(redis.call('HGET', KEYS[4], key) or '0') >= tonumber(ARGV[4]) then
+            redis.call('SADD', KEYS[6], key)
+        else
+            redis.call('ZADD', KEYS[1], -tonumber(redis.call('HGET', KEYS[5], key) or '0'), key)
+        end
+    end
+end
+local popped = redis.call('ZPOPMIN', KEYS[1], ARGV[3])
+local claimed = {}
+for i = 1, #popped, 2 do
+    local key = popped[i]
+    redis.call('ZADD', KEYS[2], ARGV[2], key)
+    redis.call('HINCRBY', KEYS[4], key, 1)
+    table.insert(claimed, key)
+end
+return claimed
+"""
+
+# Puts a leased unit back, or marks it failed once its attempts are used up.
+# KEYS: pending, leases, done, attempts, priorities, failed; ARGV: key, max attempts
+_REDIS_FAIL = """
+if redis.call('ZREM', KEYS[2], ARGV[1]) == 0 or redis.call('SISMEMBER', KEYS[3], ARGV[1]) == 1 then
+    return 0
+end
+if tonumber(redis.call('HGET', KEYS[4], ARGV[1]) or '0') >= tonumber(ARGV[2]) then
+    redis.call('SADD', KEYS[6], ARGV[1])
+    return 0
+end
+redis.call('ZADD', KEYS[1], -tonumber(redis.call('HGET', KEYS[5], ARGV[1]) or '0'), ARGV[1])
+return 1
+"""
+
+
+class RedisWorkQueue:
+    # Same interface as SqliteWorkQueue. Pushes, claims and failures run as Lua
+    # scripts so a unit is never lost or handed out twice between two round trips.
+    # Pending units with equal priority are claimed in key order.
+
+    def __init__(self, url, lease_seconds=900, max_attempts=3, namespace="ebay", client=None):
+        # `client`: a connected client (decode_responses=True) to use instead of `url`
+        if client is None:
+            if redis is None:
+                raise NotConfigured("redis:// work queues require the redis package")
+            client = redis.Redis.from_url(url, decode_responses=True)
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.client = client
+        prefix = f"{namespace}:work"
+        self.keys = [f"{prefix}:{name}" for name in ("pending", "leases", "done", "attempts", "priorities", "failed")]
+        self.units_key = f"{prefix}:units"
+        self._push = self.client.register_script(_REDIS_PUSH)
+        self._claim = self.client.register_script(_REDIS_CLAIM)
+        self._fail = self.client.register_script(_REDIS_FAIL)
+
+    def push(self, kind, key, payload, priority=0):
+        pending, _, _, _, priorities, _ = self.keys
+        unit = json.dumps({'kind': kind, 'payload': payload})
+        return self._push(keys=[self.units_key, priorities, pending], args=[key, unit, priority]) == 1
+
+    def claim(self, worker_id, limit):
+        if limit <= 0:
+            return []
+        now = time.time()
+        claimed = self._claim(keys=self.keys, args=[now, now + self.lease_seconds, limit, self.max_attempts])
+        if not claimed:
+            return []
+        units = []
+        for key, raw in zip(claimed, self.client.hmget(self.units_key, claimed)):
+            data = json.loads(raw)
+            units.append(WorkUnit(key, data['kind'], data['payload']))
+        return units
+
+    def complete(self, key):
+        pending, leases, done, _, _, _ = self.keys
+        with self.client.pipeline() as pipe:
+            pipe.sadd(done, key)
+            pipe.zrem(leases, key)
+            pipe.zrem(pending, key)  # requeued after its lease expired, but finished by the original worker
+            added, _, _ = pipe.execute()
+        return added == 1
+
+    def fail(self, key):
+        return self._fail(keys=self.keys, args=[key, self.max_attempts]) == 1
+
+    def open_units(self):
+        pending, leases, _, _, _, _ = self.keys
+        with self.client.pipeline() as pipe:
+            pipe.zcard(pending)
+            pipe.zcard(leases)
+            return sum(pipe.execute())
+
+    def counts(self):
+        pending, leases, done, _, _, failed = self.keys
+        with self.client.pipeline() as pipe:
+            pipe.zcard(pending)
+            pipe.zcard(leases)
+            pipe.scard(done)
+            pipe.scard(failed)
+            return dict(zip(('pending', 'leased', 'done', 'failed'), pipe.execute()))
+
+    def close(self):
+        self.client.close()
+
+
+def open_work_queue(url, lease_seconds=900, max_attempts=3, namespace="ebay"):
+    # "redis://host:6379/0" / "rediss://..." for a server; "sqlite:///work.db" (relative),
+    # "sqlite:////var/lib/ebay/work.db" (absolute) or a plain path for a file
+    scheme = urlsplit(url).scheme
+    if scheme in ("redis", "rediss", "unix"):
+        return RedisWorkQueue(url, lease_seconds, max_attempts, namespace)
+    if scheme == "sqlite":
+        url = url[len("sqlite:///"):]
+    return SqliteWorkQueue(url, lease_seconds, max_attempts)
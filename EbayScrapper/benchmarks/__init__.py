@@ -0,0 +1,4 @@
+# Offline benchmarks for the EbayScrapper spider.
+#
+# Run them from the directory containing scrapy.cfg, e.g.:
+#   python -m benchmarks.bench_routing
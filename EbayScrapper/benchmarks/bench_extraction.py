@@ -0,0 +1,307 @@
+# Offline benchmark and regression check for the spider callbacks.
+#
+# Replays the saved fixtures in benchmarks/fixtures through MainSpider without
+# network access or a browser:
+#   srp             parse_search_results on srp_page1.html (hybrid output mode,
+#                   so both SRP items and product requests are produced)
+#   autosug         parse_suggestions on autosug.json
+#   product_browser parse_product_page with a stub Playwright page
+#   product_static  parse_product_page_static + parse_description
+#
+# Reports pages/s, items/s, peak traced memory per page and per-field
+# extraction success rates. --check compares the callback output with
+# fixtures/expected/snapshot.json and exits with status 1 on any difference;
+# --update-expected rewrites that file after an intended change.
+#
+# Usage (from the directory containing scrapy.cfg):
+#   python -m benchmarks.bench_extraction --iterations 50 --check
+
+import argparse
+import asyncio
+import json
+import sys
+import time
+import tracemalloc
+
+from scrapy.utils.reactor import install_reactor
+
+install_reactor("twisted.internet.asyncioreactor.AsyncioSelectorReactor")
+
+import scrapy  # noqa: E402
+from itemadapter import ItemAdapter  # noqa: E402
+from scrapy.http import HtmlResponse, TextResponse  # noqa: E402
+from scrapy.utils.project import get_project_settings  # noqa: E402
+from scrapy.utils.test import get_crawler  # noqa: E402
+
+from benchmarks.fixtures import FIXTURES_DIR, load_fixture  # noqa: E402
+from EbayScrapper.spiders.main import MainSpider  # noqa: E402
+
+EXPECTED_PATH = FIXTURES_DIR / "expected" / "snapshot.json"
+SRP_URL = "https://www.ebay.com/sch/i.html?_nkw=rtx+5090+founder+edition&_sacat=0&_ipg=240&_pgn=1"
+AUTOSUG_URL = "https://autosug.ebaystatic.com/autosug?kwd=rtx+5090"
+ITEM_URL = "https://www.ebay.com/itm/356000000000"
+DESCRIPTION_URL = "https://vi.vipr.ebaydesc.com/ws/eBayISAPI.dll?ViewItemDescV4&item=356000000000&t=0&category=27386&seller=gpu_outlet"
+SEARCH_META = {
+    'source_keyword': "rtx 5090 founder edition",
+    'current_keyword': "rtx 5090 founder edition",
+    'category_id': "0",
+    'search_page_number': 1,
+    'search_url_template': MainSpider.search_base_url_template,
+}
+PRODUCT_META = {
+    'source_keyword': "rtx 5090 founder edition",
+    'current_keyword': "rtx 5090 founder edition",
+    'category_id': "0",
+    'search_page_number': 1,
+    'search_url': SRP_URL,
+    'product_id_from_link': "356000000000",
+    'total_results': 482,
+}
+MISSING = (None, "", [], "Description not found.")
+
+
+class StubFrame:
+    def __init__(self, text):
+        self.text = text
+
+    async def evaluate(self, expression):
+        return self.text
+
+
+class StubElement:
+    def __init__(self, frame):
+        self.frame = frame
+
+    async def content_frame(self):
+        return self.frame
+
+
+class StubPage:
+    # Stands in for a Playwright page that has finished loading a product page.
+
+    def __init__(self, url, html, description_text):
+        self.url = url
+        self.html = html
+        self.iframe = StubElement(StubFrame(description_text))
+        self.closed = False
+
+    async def content(self):
+        return self.html
+
+    async def wait_for_url(self, predicate, timeout=None):
+        return None
+
+    async def wait_for_selector(self, selector, timeout=None):
+        return self.iframe if selector == '#desc_ifr' else None
+
+    async def query_selector(self, selector):
+        return self.iframe if selector == '#desc_ifr' else None
+
+    async def goto(self, url):
+        self.url = url
+
+    async def close(self):
+        self.closed = True
+
+    def is_closed(self):
+        return self.closed
+
+
+def make_spider(**attrs):
+    # Project settings, so events are sampled as in a crawl (EVENT_LOG_SAMPLE_RATES)
+    crawler = get_crawler(MainSpider, get_project_settings().copy_to_dict())
+    # Every iteration replays the same listings, so run-wide dedup is off.
+    spider = MainSpider.from_crawler(crawler, dedup_listings=False, **attrs)
+    crawler.spider = spider
+    return spider
+
+
+def description_text():
+    # What document.body.innerText returns for the description fixture
+    selector = scrapy.Selector(text=load_fixture("item_description.html").decode("utf-8"))
+    return " ".join(selector.xpath('//body//text()[not(ancestor::script) and not(ancestor::style) and not(ancestor::noscript)]').getall())
+
+
+def as_dict(item):
+    return dict(sorted(ItemAdapter(item).asdict().items()))
+
+
+class Bench:
+    def __init__(self):
+        self.srp_body = load_fixture("srp_page1.html")
+        self.autosug_body = load_fixture("autosug.json")
+        self.item_body = load_fixture("item_page.html")
+        self.item_html = self.item_body.decode("utf-8")
+        self.description_body = load_fixture("item_description.html")
+        self.description_text = description_text()
+        self.srp_spider = make_spider(output_mode="hybrid")
+        self.product_spider = make_spider()
+        self.static_spider = make_spider(product_page_mode="static")
+
+    def close(self):
+        for spider in (self.srp_spider, self.product_spider, self.static_spider):
+            spider.closed('finished')
+
+    def srp(self):
+        request = scrapy.Request(SRP_URL, meta=dict(SEARCH_META))
+        response = HtmlResponse(SRP_URL, body=self.srp_body, encoding="utf-8", request=request)
+        return list(self.srp_spider.parse_search_results(response))
+
+    def autosug(self):
+        request = scrapy.Request(AUTOSUG_URL, meta={'original_keyword': "rtx 5090"})
+        response = TextResponse(AUTOSUG_URL, body=self.autosug_body, encoding="utf-8", request=request)
+        return list(self.product_spider.parse_suggestions(response))
+
+    def product_browser(self):
+        page = StubPage(ITEM_URL, self.item_html, self.description_text)
+        request = scrapy.Request(ITEM_URL, meta={**PRODUCT_META, 'playwright': True, 'playwright_page': page})
+        response = HtmlResponse(ITEM_URL, body=self.item_body, encoding="utf-8", request=request)
+
+        async def collect():
+            return [result async for result in self.product_spider.parse_product_page(response)]
+
+        return asyncio.run(collect())
+
+    def product_static(self):
+        request = scrapy.Request(ITEM_URL, meta=dict(PRODUCT_META))
+        response = HtmlResponse(ITEM_URL, body=self.item_body, encoding="utf-8", request=request)
+        results = []
+        for result in self.static_spider.parse_product_page_static(response):
+            if isinstance(result, scrapy.Request) and result.callback == self.static_spider.parse_description:
+                description = HtmlResponse(result.url, body=self.description_body, encoding="utf-8", request=result)
+                results.extend(self.static_spider.parse_description(description))
+            else:
+                results.append(result)
+        return results
+
+
+def split_results(results):
+    items = [r for r in results if not isinstance(r, scrapy.Request)]
+    requests = [r for r in results if isinstance(r, scrapy.Request)]
+    return items, requests
+
+
+def field_success(items):
+    # Share of items in which each field holds a usable value
+    counts = {}
+    for item in items:
+        for name, value in ItemAdapter(item).asdict().items():
+            hit, total = counts.get(name, (0, 0))
+            counts[name] = (hit + (value not in MISSING), total + 1)
+    return {name: hit / total for name, (hit, total) in sorted(counts.items())}
+
+
+def snapshot(bench):
+    srp_items, srp_requests = split_results(bench.srp())
+    _, autosug_requests = split_results(bench.autosug())
+    browser_items, _ = split_results(bench.product_browser())
+    static_items, _ = split_results(bench.product_static())
+    return {
+        'srp': {
+            'items': len(srp_items),
+            'product_requests': sum(1 for r in srp_requests if '/itm/' in r.url),
+            'first_item': as_dict(srp_items[0]) if srp_items else None,
+            'last_item': as_dict(srp_items[-1]) if srp_items else None,
+            'next_page': [r.url for r in srp_requests if '/sch/' in r.url],
+        },
+        'autosug': [r.url for r in autosug_requests],
+        'product_browser': [as_dict(item) for item in browser_items],
+        'product_static': [as_dict(item) for item in static_items],
+    }
+
+
+def run_benchmarks(bench, iterations):
+    rows = []
+    for name in ('srp', 'autosug', 'product_browser', 'product_static'):
+        callback = getattr(bench, name)
+        callback()  # warm-up
+
+        started = time.perf_counter()
+        produced = 0
+        items = []
+        for _ in range(iterations):
+            results = callback()
+            produced += len(results)
+            items = split_results(results)[0] or items
+        elapsed = time.perf_counter() - started
+
+        tracemalloc.start()
+        callback()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        rows.append({
+            'callback': name,
+            'pages': iterations,
+            'outputs': produced,
+            'pages_per_second': iterations / elapsed,
+            'outputs_per_second': produced / elapsed,
+            'peak_kib_per_page': peak / 1024,
+            'field_success': field_success(items),
+        })
+    return rows
+
+
+def print_report(rows):
+    print(f"{'callback':<17}{'pages':>7}{'outputs':>9}{'pages/s':>11}{'outputs/s':>12}{'peak KiB/page':>15}")
+    for row in rows:
+        print(f"{row['callback']:<17}{row['pages']:>7}{row['outputs']:>9}{row['pages_per_second']:>11.1f}"
+              f"{row['outputs_per_second']:>12.1f}{row['peak_kib_per_page']:>15.1f}")
+    for row in rows:
+        if not row['field_success']:
+            continue
+        print(f"\nField extraction success ({row['callback']}):")
+        for name, rate in row['field_success'].items():
+            print(f"  {name:<38}{rate:>7.1%}")
+
+
+def compare(expected, actual, path=""):
+    # Yields human-readable differences between two snapshots
+    if isinstance(expected, dict) and isinstance(actual, dict):
+        for key in sorted(set(expected) | set(actual)):
+            yield from compare(expected.get(key), actual.get(key), f"{path}.{key}" if path else key)
+    elif isinstance(expected, list) and isinstance(actual, list) and len(expected) == len(actual):
+        for index, (e, a) in enumerate(zip(expected, actual)):
+            yield from compare(e, a, f"{path}[{index}]")
+    elif expected != actual:
+        yield f"{path}: expected {expected!r}, got {actual!r}"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Offline benchmark and regression check for the spider callbacks.")
+    parser.add_argument('--iterations', type=int, default=50, help="Fixture replays per callback")
+    parser.add_argument('--check', action='store_true', help="Compare callback output with the expected snapshot")
+    parser.add_argument('--update-expected', action='store_true', help="Rewrite the expected snapshot")
+    parser.add_argument('--json', action='store_true', help="Print the benchmark results as JSON")
+    args = parser.parse_args(argv)
+
+    bench = Bench()
+    try:
+        if args.update_expected:
+            EXPECTED_PATH.parent.mkdir(exist_ok=True)
+            EXPECTED_PATH.write_text(json.dumps(snapshot(bench), indent=2, ensure_ascii=False) + "\n", encoding="utf-8")
+            print(f"Wrote {EXPECTED_PATH}")
+            return 0
+
+        rows = run_benchmarks(bench, args.iterations)
+        if args.json:
+            print(json.dumps(rows, indent=2))
+        else:
+            print_report(rows)
+
+        if args.check:
+            expected = json.loads(EXPECTED_PATH.read_text(encoding="utf-8"))
+            differences = list(compare(expected, snapshot(bench)))
+            if differences:
+                print(f"\nRegression check failed ({len(differences)} differences):")
+                for difference in differences:
+                    print(f"  {difference}")
+                return 1
+            print("\nRegression check passed.")
+        return 0
+    finally:
+        bench.close()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,168 @@
+# Crawl the SRP fixture through a pool of local stand-in proxies.
+#
+# One healthy, one slow, one failing (502) and one challenging (429) proxy are
+# started in front of the fixture server and given to ProxyPoolMiddleware with
+# short breaker cooldowns. Failed attempts are retried through another exit,
+# so every page should still be parsed; the report shows how the requests were
+# spread and where each circuit breaker ended up. --force-breakers turns off
+# the error and challenge penalties in the health score, so the bad exits keep
+# being picked and only their breakers keep them out of the rotation.
+#
+# Usage (from the directory containing scrapy.cfg):
+#   python -m benchmarks.bench_proxies --pages 60
+#   python -m benchmarks.bench_proxies --check   # exit 1 if the pool misbehaved
+#   python -m benchmarks.bench_proxies --force-breakers --check
+
+import argparse
+import sys
+import time
+from contextlib import ExitStack
+
+import scrapy
+from scrapy import signals
+from scrapy.crawler import CrawlerProcess
+from scrapy.utils.project import get_project_settings
+
+from benchmarks.fixtures import FixtureServer, StandInProxy
+from EbayScrapper import proxies as proxy_pool
+from EbayScrapper.spiders.main import MainSpider
+
+BEHAVIOURS = ("healthy", "slow", "failing", "challenging")
+MIN_SAMPLES = 3
+
+
+class ProxyBenchSpider(MainSpider):
+    name = "bench_proxies"
+
+    def __init__(self, base_url=None, pages=60, **kwargs):
+        super().__init__(**kwargs)
+        self.base_url = base_url
+        self.pages = int(pages)
+        self.pages_parsed = 0
+        self.started_at = None
+        self.finished_at = None
+
+    @classmethod
+    def from_crawler(cls, crawler, *args, **kwargs):
+        spider = super().from_crawler(crawler, *args, **kwargs)
+        crawler.signals.connect(spider._on_opened, signal=signals.spider_opened)
+        crawler.signals.connect(spider._on_closed, signal=signals.spider_closed)
+        return spider
+
+    def _on_opened(self, spider):
+        self.started_at = time.perf_counter()
+
+    def _on_closed(self, spider):
+        self.finished_at = time.perf_counter()
+
+    async def start(self):
+        kwd = self.search_keywords[0]
+        for page_num in range(1, self.pages + 1):
+            meta = {
+                'source_keyword': kwd,
+                'current_keyword': kwd,
+                'category_id': "0",
+                'search_page_number': 1,
+                'search_url_template': self.search_base_url_template,
+            }
+            url = f"{self.base_url}/sch/i.html?_nkw=bench&_pgn={page_num}"
+            yield self._make_request(url, callback=self.parse_search_results, meta=meta)
+
+    def parse_search_results(self, response):
+        self.pages_parsed += 1
+        for result in super().parse_search_results(response):
+            # Product renders and follow-up pages point at live eBay; drop them.
+            if not isinstance(result, scrapy.Request):
+                yield result
+
+
+def run(pages):
+    with ExitStack() as stack:
+        server = stack.enter_context(FixtureServer())
+        proxies = {behaviour: stack.enter_context(StandInProxy(behaviour, latency=0.3)) for behaviour in BEHAVIOURS}
+        settings = get_project_settings()
+        overrides = {
+            'PROXY_POOL': [{'name': behaviour, 'url': proxy.base_url} for behaviour, proxy in proxies.items()],
+            'PROXY_CONCURRENCY': 2,
+            'PROXY_DELAY': 0,
+            'PROXY_BREAKER_WINDOW': 10,
+            'PROXY_BREAKER_MIN_SAMPLES': MIN_SAMPLES,
+            'PROXY_BREAKER_COOLDOWN': 0.5,
+            'PROXY_BREAKER_MAX_COOLDOWN': 2,
+            'PROXY_BREAKER_MAX_TRIPS': 3,
+            'RETRY_TIMES': 10,
+            'EBAY_REQUEST_ROUTING': 'split',
+            'HTTPCACHE_ENABLED': False,
+            'METRICS_ENABLED': False,
+            'DOWNLOAD_DELAY': 0,
+            'LOG_LEVEL': 'WARNING',
+        }
+        for name, value in overrides.items():
+            settings.set(name, value, priority='cmdline')
+        process = CrawlerProcess(settings)
+        crawler = process.create_crawler(ProxyBenchSpider)
+        process.crawl(crawler, base_url=server.base_url, pages=pages)
+        process.start()
+
+        spider = crawler.spider
+        stats = crawler.stats.get_stats()
+        report = {
+            'pages': spider.pages_parsed,
+            'seconds': round(spider.finished_at - spider.started_at, 3),
+            'proxies': {},
+        }
+        for behaviour, proxy in proxies.items():
+            prefix = f'proxies/{behaviour}'
+            report['proxies'][behaviour] = {
+                'requests': proxy.requests,
+                'errors': stats.get(f'{prefix}/errors', 0),
+                'challenges': stats.get(f'{prefix}/challenges', 0),
+                'trips': stats.get(f'{prefix}/trips', 0),
+                'state': stats.get(f'{prefix}/state', 'closed'),
+            }
+        return report
+
+
+def check(report, pages, force_breakers=False):
+    problems = []
+    if report['pages'] != pages:
+        problems.append(f"parsed {report['pages']} of {pages} pages")
+    proxies = report['proxies']
+    for behaviour in ("failing", "challenging"):
+        # Scoring alone should keep a bad exit idle; otherwise its breaker must trip
+        limit = 0 if force_breakers else MIN_SAMPLES
+        if proxies[behaviour]['trips'] == 0 and proxies[behaviour]['requests'] > limit:
+            problems.append(f"the {behaviour} proxy served {proxies[behaviour]['requests']} requests without tripping")
+    busiest = max(proxies, key=lambda behaviour: proxies[behaviour]['requests'])
+    if busiest != "healthy":
+        problems.append(f"the {busiest} proxy carried the most requests")
+    return problems
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Crawl SRP fixtures through local stand-in proxies.")
+    parser.add_argument('--pages', type=int, default=60, help="SRP fixture pages to fetch")
+    parser.add_argument('--check', action='store_true', help="Exit 1 unless every page was parsed and the bad exits were kept out")
+    parser.add_argument('--force-breakers', action='store_true', help="Score proxies on load alone, so the breakers must trip")
+    args = parser.parse_args(argv)
+
+    if args.force_breakers:
+        proxy_pool.ERROR_PENALTY = proxy_pool.CHALLENGE_PENALTY = 0
+
+    report = run(args.pages)
+    print(f"{report['pages']} pages in {report['seconds']} s")
+    print(f"{'proxy':<13}{'requests':>10}{'errors':>8}{'challenges':>12}{'trips':>7}  state")
+    for behaviour, r in report['proxies'].items():
+        print(f"{behaviour:<13}{r['requests']:>10}{r['errors']:>8}{r['challenges']:>12}{r['trips']:>7}  {r['state']}")
+
+    if args.check:
+        problems = check(report, args.pages, args.force_breakers)
+        for problem in problems:
+            print(f"FAIL: {problem}")
+        if problems:
+            sys.exit(1)
+        print("OK")
+
+
+if __name__ == '__main__':
+    main()
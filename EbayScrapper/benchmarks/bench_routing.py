@@ -0,0 +1,122 @@
+# Compare search-results (SRP) throughput for the two EBAY_REQUEST_ROUTING modes.
+#
+# The saved SRP fixture is served from a local HTTP server and crawled once with
+# "split" routing (plain HTTP) and once with "browser" routing (every page is
+# rendered by Playwright). Product requests produced by parse_search_results are
+# dropped, so only search-page handling is measured. Each mode runs in its own
+# process because the Twisted reactor cannot be restarted.
+#
+# Usage (from the directory containing scrapy.cfg):
+#   python -m benchmarks.bench_routing --pages 50
+
+import argparse
+import json
+import subprocess
+import sys
+import time
+
+import scrapy
+from scrapy import signals
+from scrapy.crawler import CrawlerProcess
+from scrapy.utils.project import get_project_settings
+
+from benchmarks.fixtures import FixtureServer
+from EbayScrapper.spiders.main import MainSpider
+
+MODES = ("split", "browser")
+
+
+class RoutingBenchSpider(MainSpider):
+    name = "bench_routing"
+
+    def __init__(self, base_url=None, pages=50, **kwargs):
+        super().__init__(**kwargs)
+        self.base_url = base_url
+        self.pages = int(pages)
+        self.pages_parsed = 0
+        self.links_found = 0
+        self.started_at = None
+        self.finished_at = None
+
+    @classmethod
+    def from_crawler(cls, crawler, *args, **kwargs):
+        spider = super().from_crawler(crawler, *args, **kwargs)
+        crawler.signals.connect(spider._on_opened, signal=signals.spider_opened)
+        crawler.signals.connect(spider._on_closed, signal=signals.spider_closed)
+        return spider
+
+    def _on_opened(self, spider):
+        self.started_at = time.perf_counter()
+
+    def _on_closed(self, spider):
+        self.finished_at = time.perf_counter()
+
+    async def start(self):
+        kwd = self.search_keywords[0]
+        for page_num in range(1, self.pages + 1):
+            meta = {
+                'source_keyword': kwd,
+                'current_keyword': kwd,
+                'category_id': "0",
+                'search_page_number': 1,
+                'search_url_template': self.search_base_url_template,
+            }
+            url = f"{self.base_url}/sch/i.html?_nkw=bench&_pgn={page_num}"
+            yield self._make_request(url, callback=self.parse_search_results, meta=meta)
+
+    def parse_search_results(self, response):
+        self.pages_parsed += 1
+        for result in super().parse_search_results(response):
+            # Product renders and follow-up pages point at live eBay; only count them.
+            if isinstance(result, scrapy.Request):
+                self.links_found += 1
+
+
+def run_mode(mode, pages):
+    with FixtureServer() as server:
+        settings = get_project_settings()
+        settings.set('EBAY_REQUEST_ROUTING', mode, priority='cmdline')
+        settings.set('DOWNLOAD_DELAY', 0, priority='cmdline')
+        settings.set('DOWNLOAD_SLOTS', {'playwright': {'concurrency': 4, 'delay': 0}}, priority='cmdline')
+        settings.set('PLAYWRIGHT_LAUNCH_OPTIONS', {'headless': True}, priority='cmdline')
+        settings.set('LOG_LEVEL', 'WARNING', priority='cmdline')
+        process = CrawlerProcess(settings)
+        crawler = process.create_crawler(RoutingBenchSpider)
+        process.crawl(crawler, base_url=server.base_url, pages=pages)
+        process.start()
+        spider = crawler.spider
+        elapsed = spider.finished_at - spider.started_at
+        return {
+            'mode': mode,
+            'pages': spider.pages_parsed,
+            'links': spider.links_found,
+            'seconds': round(elapsed, 3),
+            'pages_per_second': round(spider.pages_parsed / elapsed, 2) if elapsed else 0.0,
+        }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare SRP throughput for the request routing modes.")
+    parser.add_argument('--pages', type=int, default=50, help="SRP fixture pages to fetch per mode")
+    parser.add_argument('--mode', choices=MODES, help="Run a single mode and print its result as JSON")
+    args = parser.parse_args(argv)
+
+    if args.mode:
+        print(json.dumps(run_mode(args.mode, args.pages)))
+        return
+
+    results = []
+    for mode in MODES:
+        out = subprocess.run(
+            [sys.executable, '-m', 'benchmarks.bench_routing', '--mode', mode, '--pages', str(args.pages)],
+            check=True, capture_output=True, text=True,
+        )
+        results.append(json.loads(out.stdout.strip().splitlines()[-1]))
+
+    print(f"{'mode':<10}{'pages':>8}{'links':>8}{'seconds':>10}{'pages/s':>10}")
+    for r in results:
+        print(f"{r['mode']:<10}{r['pages']:>8}{r['links']:>8}{r['seconds']:>10}{r['pages_per_second']:>10}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,119 @@
+# Helpers for serving the saved eBay pages in benchmarks/fixtures over local HTTP.
+
+import threading
+import time
+import urllib.error
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import urlparse
+
+FIXTURES_DIR = Path(__file__).resolve().parent / "fixtures"
+
+# URL path prefix -> (fixture file, content type)
+ROUTES = {
+    "/sch/": ("srp_page1.html", "text/html; charset=utf-8"),
+}
+
+
+def load_fixture(name):
+    return (FIXTURES_DIR / name).read_bytes()
+
+
+class _FixtureHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        path = urlparse(self.path).path
+        for prefix, (name, content_type) in ROUTES.items():
+            if path.startswith(prefix):
+                body = self.server.cache.setdefault(name, load_fixture(name))
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+                return
+        self.send_error(404)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class _BackgroundServer:
+    handler = None
+
+    def __init__(self, port=0):
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", port), self.handler)
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    @property
+    def base_url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+class FixtureServer(_BackgroundServer):
+    # Serves fixtures on 127.0.0.1 from a background thread.
+    handler = _FixtureHandler
+
+    def __init__(self, port=0):
+        super().__init__(port)
+        self.httpd.cache = {}
+
+
+# Direct connections for the stand-in proxies, whatever http_proxy says
+_direct = urllib.request.build_opener(urllib.request.ProxyHandler({}))
+
+
+class _ProxyHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.requests += 1
+        if server.behaviour == "failing":
+            self.send_error(502, "Bad Gateway")
+            return
+        if server.behaviour == "challenging":
+            self.send_error(429, "Too Many Requests")
+            return
+        if server.behaviour == "slow":
+            time.sleep(server.latency)
+        try:
+            with _direct.open(self.path, timeout=30) as upstream:  # absolute URI from the client
+                status, content_type, body = upstream.status, upstream.headers.get("Content-Type"), upstream.read()
+        except urllib.error.HTTPError as e:
+            status, content_type, body = e.code, e.headers.get("Content-Type"), e.read()
+        self.send_response(status)
+        if content_type:
+            self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StandInProxy(_BackgroundServer):
+    # A local forward HTTP proxy standing in for a pool exit. behaviour is
+    # "healthy", "slow" (adds `latency` seconds), "failing" (502 Bad Gateway)
+    # or "challenging" (429, like an exit eBay has flagged).
+    handler = _ProxyHandler
+
+    def __init__(self, behaviour="healthy", latency=0.5, port=0):
+        super().__init__(port)
+        self.httpd.behaviour = behaviour
+        self.httpd.latency = latency
+        self.httpd.requests = 0
+        self.httpd.lock = threading.Lock()
+
+    @property
+    def requests(self):
+        return self.httpd.requests
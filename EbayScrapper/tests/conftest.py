@@ -0,0 +1,50 @@
+# Shared helpers for the unit tests. Run from the directory containing scrapy.cfg:
+#   python -m pytest tests
+
+import pytest
+from scrapy.utils.reactor import install_reactor
+
+install_reactor("twisted.internet.asyncioreactor.AsyncioSelectorReactor")
+
+import scrapy  # noqa: E402
+from scrapy.http import HtmlResponse  # noqa: E402
+from scrapy.utils.test import get_crawler  # noqa: E402
+
+from benchmarks.fixtures import load_fixture  # noqa: E402
+from EbayScrapper.spiders.main import MainSpider  # noqa: E402
+
+SRP_URL = "https://www.ebay.com/sch/i.html?_nkw=rtx+5090+founder+edition&_sacat=0&_ipg=240&_pgn=1"
+
+
+@pytest.fixture
+def make_spider():
+    # Builds MainSpider instances from spider arguments; closes them afterwards
+    spiders = []
+
+    def make(spider_cls=MainSpider, settings=None, **attrs):
+        crawler = get_crawler(spider_cls, settings)
+        spider = spider_cls.from_crawler(crawler, **attrs)
+        crawler.spider = spider
+        spiders.append(spider)
+        return spider
+
+    yield make
+    for spider in spiders:
+        spider.closed('finished')
+
+
+def srp_response(keyword="rtx 5090 founder edition", page=1, category="0"):
+    # The saved search results page, as if requested for `keyword`
+    meta = {
+        'source_keyword': keyword,
+        'current_keyword': keyword,
+        'category_id': category,
+        'search_page_number': page,
+        'search_url_template': MainSpider.search_base_url_template,
+    }
+    request = scrapy.Request(SRP_URL, meta=meta)
+    return HtmlResponse(SRP_URL, body=load_fixture("srp_page1.html"), encoding="utf-8", request=request)
+
+
+def product_requests(results):
+    return [r for r in results if isinstance(r, scrapy.Request) and '/itm/' in r.url]
@@ -0,0 +1,195 @@
+from types import SimpleNamespace
+
+import pytest
+import scrapy
+from scrapy.http import HtmlResponse
+from scrapy.utils.test import get_crawler
+
+from EbayScrapper import middlewares
+from EbayScrapper.middlewares import AdaptiveConcurrencyMiddleware, EndpointThrottle
+
+SRP_URL = "https://www.ebay.com/sch/i.html?_nkw=rtx+5090"
+WINDOW = 4
+
+
+def throttle(concurrency=2, delay=0.4, **overrides):
+    settings = dict(endpoint='srp', min_concurrency=1, max_concurrency=4, target_latency=3.0,
+                    challenge_threshold=0.0, window=WINDOW, min_delay=0.1, max_delay=5.0, cooldown=10.0)
+    settings.update(overrides)
+    throttle = EndpointThrottle(**settings)
+    throttle.adopt(SimpleNamespace(concurrency=concurrency, delay=delay))
+    return throttle
+
+
+def healthy_window(throttle, now=0.0, latency=1.0):
+    return [throttle.observe(latency, False, now) for _ in range(WINDOW)]
+
+
+@pytest.mark.parametrize('slot, limits', [
+    ((2, 0.4), (2, 0.4)),
+    ((0, 0.0), (1, 0.1)),     # raised to the minimums
+    ((64, 60.0), (4, 5.0)),   # lowered to the maximums
+])
+def test_adopted_slot_limits_are_clamped(slot, limits):
+    assert (throttle(*slot).concurrency, throttle(*slot).delay) == limits
+
+
+def test_healthy_window_adds_one_and_shortens_the_delay():
+    t = throttle(concurrency=2, delay=0.4)
+    assert healthy_window(t) == [False, False, False, True]
+    assert (t.concurrency, t.delay) == (3, pytest.approx(0.3))
+    healthy_window(t)
+    healthy_window(t)
+    assert (t.concurrency, t.delay) == (4, pytest.approx(0.16875))
+    for _ in range(5):
+        healthy_window(t)
+    assert (t.concurrency, t.delay) == (4, 0.1)
+    # At both limits a healthy window changes nothing
+    assert healthy_window(t)[-1] is False
+
+
+@pytest.mark.parametrize('latency, errors', [
+    (3.5, 0),   # latency EWMA above the target
+    (1.0, 1),   # a download error in the window
+])
+def test_unhealthy_window_holds_the_limits(latency, errors):
+    t = throttle(concurrency=2, delay=0.4)
+    for _ in range(errors):
+        t.observe_error()
+    assert healthy_window(t, latency=latency)[-1] is False
+    assert (t.concurrency, t.delay) == (2, 0.4)
+
+
+def test_tolerated_challenge_rate_still_counts_as_healthy():
+    t = throttle(concurrency=4, delay=0.4, challenge_threshold=0.25)
+    assert t.observe(1.0, True, 100.0)        # halved right away
+    assert t.concurrency == 2
+    # The next window has one challenge in four (within the cooldown): 25% is tolerated
+    assert [t.observe(1.0, challenged, 105.0) for challenged in (True, False, False, False)][-1]
+    assert t.concurrency == 3
+
+
+def test_challenge_halves_concurrency_and_doubles_the_delay():
+    t = throttle(concurrency=4, delay=0.4)
+    assert t.observe(1.0, True, 100.0)
+    assert (t.concurrency, t.delay) == (2, 1.0)     # the delay is at least one second after a challenge
+    assert t.observe(1.0, True, 110.0)
+    assert (t.concurrency, t.delay) == (1, 2.0)
+    assert t.observe(1.0, True, 120.0)
+    assert (t.concurrency, t.delay) == (1, 4.0)     # not below min_concurrency
+    assert t.observe(1.0, True, 130.0)
+    assert (t.concurrency, t.delay) == (1, 5.0)     # not above max_delay
+    assert t.challenges == 4
+
+
+def test_challenges_within_the_cooldown_do_not_decrease_again():
+    t = throttle(concurrency=4, delay=0.4)
+    assert t.observe(1.0, True, 100.0)
+    assert not t.observe(1.0, True, 105.0)
+    assert not t.observe(1.0, True, 109.9)
+    assert t.concurrency == 2
+    assert t.observe(1.0, True, 110.0)
+    assert t.concurrency == 1
+
+
+def test_throttle_without_a_slot_changes_nothing():
+    t = EndpointThrottle('srp', 1, 4, 3.0, 0.0, WINDOW, 0.1, 5.0, 10.0)
+    assert not t.observe(1.0, True, 100.0)
+    assert healthy_window(t)[-1] is False
+    assert t.concurrency is None
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def time(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(middlewares, "time", clock)
+    return clock
+
+
+@pytest.fixture
+def adaptive():
+    crawler = get_crawler(scrapy.Spider, {
+        'ADAPTIVE_CONCURRENCY_ENABLED': True,
+        'ADAPTIVE_CONCURRENCY_LIMITS': {'srp': [1, 4], 'other': [1, 8]},
+        'ADAPTIVE_TARGET_LATENCY': {'srp': 3.0},
+        'ADAPTIVE_CHALLENGE_THRESHOLD': 0.0,
+        'ADAPTIVE_WINDOW': WINDOW,
+        'ADAPTIVE_MIN_DELAY': 0.1,
+        'ADAPTIVE_BACKOFF_COOLDOWN': 10.0,
+    })
+    crawler.stats.open_spider(None)
+    crawler.engine = SimpleNamespace(downloader=SimpleNamespace(slots={}))
+    mw = AdaptiveConcurrencyMiddleware.from_crawler(crawler)
+    mw.spider = scrapy.Spider('main')
+    return mw
+
+
+def fetch(mw, url=SRP_URL, status=200, flags=None, latency=1.0, **meta):
+    # One request through process_request, its downloader slot and process_response
+    request = scrapy.Request(url, meta=meta)
+    mw.process_request(request, mw.spider)
+    request.meta['download_latency'] = latency
+    slots = mw.crawler.engine.downloader.slots
+    slots.setdefault(request.meta['download_slot'], SimpleNamespace(concurrency=2, delay=0.4))
+    response = HtmlResponse(url, status=status, body=b"<html></html>", request=request, flags=flags)
+    assert mw.process_response(request, response, mw.spider) is response
+    return slots[request.meta['download_slot']]
+
+
+def test_requests_get_a_slot_per_endpoint(adaptive):
+    request = scrapy.Request(SRP_URL)
+    adaptive.process_request(request, adaptive.spider)
+    assert (request.meta['ebay_endpoint'], request.meta['download_slot']) == ('srp', 'ebay-srp')
+    routed = scrapy.Request(SRP_URL, meta={'download_slot': 'playwright'})
+    adaptive.process_request(routed, adaptive.spider)
+    assert routed.meta['download_slot'] == 'playwright'
+
+
+def test_slot_limits_follow_the_throttle(adaptive, clock):
+    for _ in range(WINDOW):
+        slot = fetch(adaptive)
+    assert (slot.concurrency, slot.delay) == (3, pytest.approx(0.3))
+    stats = adaptive.crawler.stats
+    assert stats.get_value('adaptive/srp/concurrency') == 3
+    assert stats.get_value('adaptive/srp/responses') == WINDOW
+    slot = fetch(adaptive, status=429)
+    assert (slot.concurrency, slot.delay) == (1, 1.0)
+    assert stats.get_value('adaptive/srp/challenges') == 1
+    # A redirect to the challenge page counts as well
+    slot = fetch(adaptive, url="https://www.ebay.com/splashui/challenge?ap=1&appName=orch")
+    assert (slot.concurrency, stats.get_value('adaptive/other/challenges')) == (1, 1)
+
+
+def test_cached_responses_are_ignored(adaptive, clock):
+    for _ in range(WINDOW):
+        slot = fetch(adaptive, status=429, flags=['cached'])
+    assert (slot.concurrency, slot.delay) == (2, 0.4)
+    assert adaptive.throttles == {}
+    assert adaptive.crawler.stats.get_value('adaptive/srp/responses') is None
+
+
+def test_proxied_responses_leave_the_proxy_slot_alone(adaptive, clock):
+    for _ in range(WINDOW):
+        slot = fetch(adaptive, status=429, download_slot='proxy-a', proxy_name='a')
+    assert (slot.concurrency, slot.delay) == (2, 0.4)
+    assert adaptive.throttles['srp'].slots == set()
+    assert adaptive.crawler.stats.get_value('adaptive/srp/challenges') == WINDOW
+
+
+def test_download_errors_hold_back_the_next_increase(adaptive, clock):
+    adaptive.process_exception(scrapy.Request(SRP_URL), TimeoutError(), adaptive.spider)
+    for _ in range(WINDOW):
+        slot = fetch(adaptive)
+    assert slot.concurrency == 2
+    assert adaptive.crawler.stats.get_value('adaptive/srp/errors') == 1
+    for _ in range(WINDOW):
+        slot = fetch(adaptive)
+    assert slot.concurrency == 3
@@ -0,0 +1,124 @@
+import pytest
+
+from EbayScrapper.changes import MISSING_DESCRIPTION, ChangeStore
+from EbayScrapper.items import ListingChangeItem
+
+from tests.conftest import srp_response
+
+
+def listing(product_id='1', **fields):
+    item = {
+        'product_id': product_id,
+        'link': f'https://www.ebay.com/itm/{product_id}',
+        'title': 'NVIDIA GeForce RTX 5090 Founders Edition',
+        'price': '$2,999.00',
+        'condition': 'New',
+        'seller_name': 'gpu_outlet',
+        'seller_positive_feedback_percentage': '99.8%',
+        'seller_feedback_count': '1,204',
+        'top_rated_seller': True,
+        'description': 'Sealed in box.',
+        'location': 'Austin, Texas',
+    }
+    item.update(fields)
+    return item
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = ChangeStore(str(tmp_path / "changes.db"), disappear_after=2)
+    yield store
+    store.close()
+
+
+def test_first_sight_is_new_and_a_repeat_is_unchanged(store):
+    event, changed, previous_price = store.diff(listing(), 'rtx 5090', now=100)
+    assert event == 'new' and previous_price is None
+    assert 'title' in changed and 'location' in changed
+    assert store.diff(listing(), 'rtx 5090', now=200) is None
+    # Untracked fields do not count as changes
+    assert store.diff(listing(location='Dallas, Texas'), 'rtx 5090', now=300) is None
+
+
+def test_price_and_field_changes(store):
+    store.diff(listing(), 'rtx 5090', now=100)
+    assert store.diff(listing(price='$2,799.00'), 'rtx 5090', now=200) == ('price_changed', ['price'], '$2,999.00')
+    assert store.diff(listing(price='$2,799.00', seller_feedback_count='1,250'), 'rtx 5090', now=300) == (
+        'changed', ['seller_name', 'seller_positive_feedback_percentage', 'seller_feedback_count', 'top_rated_seller'],
+        None)
+    event, changed, previous_price = store.diff(
+        listing(price='$2,899.00', seller_feedback_count='1,250', title='RTX 5090 FE'), 'rtx 5090', now=400)
+    assert (event, previous_price) == ('price_changed', '$2,799.00')
+    assert changed == ['price', 'title']
+
+
+def test_missing_description_keeps_the_stored_one(store):
+    store.diff(listing(), 'rtx 5090', now=100)
+    assert store.diff(listing(description=MISSING_DESCRIPTION), 'rtx 5090', now=200) is None
+    assert store.diff(listing(description=None), 'rtx 5090', now=300) is None
+    assert store.diff(listing(), 'rtx 5090', now=400) is None
+    assert store.diff(listing(description='Open box.'), 'rtx 5090', now=500) == ('changed', ['description'], None)
+
+
+def test_fingerprints_survive_a_restart(tmp_path):
+    path = str(tmp_path / "changes.db")
+    store = ChangeStore(path, commit_every=1000)
+    store.diff(listing(), 'rtx 5090', now=100)
+    store.close()
+    store = ChangeStore(path)
+    try:
+        assert store.diff(listing(), 'rtx 5090', now=200) is None
+    finally:
+        store.close()
+
+
+def run(store, now, keywords, sighted=(), scraped=()):
+    # One completed crawl: result cards seen, listings scraped, then the sweep
+    store.scopes = set(keywords)
+    for product_id, keyword in sighted:
+        store.sighted(product_id, keyword, now=now)
+    events = [store.diff(item, keyword, now=now) for item, keyword in scraped]
+    return events, store.sweep(now=now + 10)
+
+
+def test_listing_disappears_after_missing_consecutive_runs_and_can_come_back(store):
+    run(store, 100, ['rtx 5090'], scraped=[(listing('1'), 'rtx 5090'), (listing('2'), 'rtx 5090')])
+    # Listing 2 is only seen as a result card; listing 1 is gone from the results
+    assert run(store, 200, ['rtx 5090'], sighted=[('2', 'rtx 5090')])[1] == []
+    assert run(store, 300, ['rtx 5090'], sighted=[('2', 'rtx 5090')])[1] == [
+        ('1', 'https://www.ebay.com/itm/1', 'rtx 5090', '$2,999.00')]
+    # Reported once
+    assert run(store, 400, ['rtx 5090'], sighted=[('2', 'rtx 5090')])[1] == []
+    events, gone = run(store, 500, ['rtx 5090'], scraped=[(listing('1', price='$2,499.00'), 'rtx 5090'),
+                                                          (listing('2'), 'rtx 5090')])
+    assert events == [('relisted', ['price'], '$2,999.00'), None]
+    assert gone == []
+
+
+def test_a_sighting_resets_the_missed_runs(store):
+    run(store, 100, ['rtx 5090'], scraped=[(listing('1'), 'rtx 5090')])
+    run(store, 200, ['rtx 5090'])
+    run(store, 300, ['rtx 5090'], sighted=[('1', 'rtx 5090')])
+    assert run(store, 400, ['rtx 5090'])[1] == []
+    assert [row[0] for row in run(store, 500, ['rtx 5090'])[1]] == ['1']
+
+
+def test_only_keywords_searched_in_the_run_are_swept(store):
+    run(store, 100, ['rtx 5090', 'rx 9070'], scraped=[(listing('1'), 'rtx 5090'), (listing('2'), 'rx 9070')])
+    run(store, 200, ['rtx 5090'])
+    run(store, 300, ['rtx 5090'])
+    assert [row[0] for row in run(store, 400, ['rtx 5090'])[1]] == []  # 1 was reported at 300
+    assert [row[0] for row in run(store, 500, ['rx 9070'])[1]] == []   # 2 missed one run so far
+    assert [row[0] for row in run(store, 600, ['rx 9070'])[1]] == ['2']
+
+
+def test_spider_emits_change_events_and_records_sightings(make_spider, tmp_path):
+    spider = make_spider(change_store_path=str(tmp_path / "changes.db"))
+    list(spider.parse_search_results(srp_response()))
+    assert spider.change_store.scopes == {'rtx 5090 founder edition'}
+    meta = {'current_keyword': 'rtx 5090 founder edition'}
+    event = spider._finalize_item(listing('356000000000', derived_from_keyword='rtx 5090 founder edition'), meta)
+    assert isinstance(event, ListingChangeItem)
+    assert event['event'] == 'new' and event['changes']['price'] == '$2,999.00'
+    assert spider._finalize_item(listing('356000000000', derived_from_keyword='rtx 5090 founder edition'), meta) is None
+    assert spider.crawler.stats.get_value('changes/unchanged') == 1
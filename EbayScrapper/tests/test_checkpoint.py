@@ -0,0 +1,128 @@
+import asyncio
+import json
+
+import pytest
+import scrapy
+from twisted.python.failure import Failure
+
+from EbayScrapper.checkpoint import CrawlCheckpoint
+
+from tests.conftest import product_requests, srp_response
+
+
+def test_units_are_added_once_and_completed_once(tmp_path):
+    checkpoint = CrawlCheckpoint(str(tmp_path / "crawl.json"), interval=3600)
+    assert checkpoint.add('product', 'product:1', 'https://www.ebay.com/itm/1', {'a': 1})
+    assert not checkpoint.add('product', 'product:1', 'https://www.ebay.com/itm/1', {'a': 1})
+    assert checkpoint.complete('product:1')
+    assert not checkpoint.complete('product:1')
+    assert not checkpoint.add('product', 'product:1', 'https://www.ebay.com/itm/1', {})  # done
+    assert checkpoint.counts() == {'pending': 0, 'failed': 0, 'done_product': 1}
+
+
+def test_failed_units_stay_pending_until_attempts_are_used_up(tmp_path):
+    checkpoint = CrawlCheckpoint(str(tmp_path / "crawl.json"), interval=3600, max_attempts=2)
+    checkpoint.add('search', 'search:0:rtx:1', 'u', {})
+    assert checkpoint.fail('search:0:rtx:1')
+    assert 'search:0:rtx:1' in checkpoint.pending
+    assert checkpoint.fail('search:0:rtx:1') is False
+    assert checkpoint.failed == {'search:0:rtx:1'}
+    assert not checkpoint.add('search', 'search:0:rtx:1', 'u', {})
+    # Settled or unknown units are not failed (again)
+    assert checkpoint.fail('search:0:rtx:1') is None
+    assert checkpoint.fail('search:0:unknown:1') is None
+    checkpoint.add('product', 'product:1', 'u', {})
+    checkpoint.complete('product:1')
+    assert checkpoint.fail('product:1') is None
+    assert checkpoint.done == {'product:1'} and 'product:1' not in checkpoint.failed
+
+
+def test_save_and_load_round_trip(tmp_path):
+    path = str(tmp_path / "crawl.json")
+    checkpoint = CrawlCheckpoint(path, interval=3600)
+    checkpoint.add('product', 'product:1', 'u1', {'srp_price': '$1'}, priority=5)
+    checkpoint.add('product', 'product:2', 'u2', {})
+    checkpoint.complete('product:2')
+    checkpoint.save()
+    resumed = CrawlCheckpoint(path)
+    assert resumed.load()
+    assert resumed.pending == {'product:1': {'kind': 'product', 'url': 'u1', 'meta': {'srp_price': '$1'},
+                                             'priority': 5, 'attempts': 0}}
+    assert resumed.done == {'product:2'}
+
+
+def test_crash_keeps_the_last_complete_checkpoint(tmp_path):
+    path = tmp_path / "crawl.json"
+    checkpoint = CrawlCheckpoint(str(path), interval=3600)
+    checkpoint.add('product', 'product:1', 'u1', {})
+    checkpoint.save()
+    # Changes after the last save are lost, and a write torn by the crash is ignored
+    checkpoint.add('product', 'product:2', 'u2', {})
+    (tmp_path / "crawl.json.tmp").write_text('{"version": 1, "pend')
+    resumed = CrawlCheckpoint(str(path))
+    assert resumed.load()
+    assert list(resumed.pending) == ['product:1']
+
+
+def test_changes_are_written_once_the_interval_has_passed(tmp_path):
+    path = tmp_path / "crawl.json"
+    checkpoint = CrawlCheckpoint(str(path), interval=0)
+    checkpoint.add('product', 'product:1', 'u1', {})
+    assert json.loads(path.read_text())['pending'].keys() == {'product:1'}
+    assert not (tmp_path / "crawl.json.tmp").exists()
+
+
+def test_load_rejects_other_versions_and_reports_missing_files(tmp_path):
+    path = tmp_path / "crawl.json"
+    assert not CrawlCheckpoint(str(path)).load()
+    path.write_text(json.dumps({'version': 99, 'pending': {}, 'done': [], 'failed': []}))
+    with pytest.raises(ValueError):
+        CrawlCheckpoint(str(path)).load()
+
+
+def start_requests(spider):
+    async def collect():
+        return [request async for request in spider.start()]
+
+    return asyncio.run(collect())
+
+
+def test_resumed_spider_replays_only_unfinished_units(make_spider, tmp_path):
+    path = str(tmp_path / "crawl.json")
+    first = make_spider(checkpoint=path, checkpoint_interval=3600)
+    requests = product_requests(first.parse_search_results(srp_response()))
+    keys = [request.meta['work_unit'] for request in requests]
+    assert keys and all(key.startswith('product:') for key in keys)
+    for key in keys[:10]:
+        assert first.complete_work_unit(key)
+    assert not first.complete_work_unit(keys[0])
+    first.fail_work_unit(keys[10])          # retried on resume
+    first.checkpoint.save()                 # what closed() does; the run then "crashes"
+
+    second = make_spider(checkpoint=path, resume="true")
+    assert second.resumed
+    started = {request.meta.get('work_unit') for request in start_requests(second)}
+    assert started >= set(keys[10:]) and started.isdisjoint(keys[:10])
+    # The unfinished products plus page 2, which the first run had requested as well
+    assert second.crawler.stats.get_value('checkpoint/replayed') == len(keys) - 10 + 1
+    # Listings found again on the search page are neither pending twice nor rendered again
+    assert product_requests(second.parse_search_results(srp_response())) == []
+    assert second.crawler.stats.get_value('checkpoint/skipped') == len(keys) + 1  # and page 2
+
+
+def test_description_failure_completes_the_unit_without_counting_a_failure(make_spider, tmp_path):
+    spider = make_spider(checkpoint=str(tmp_path / "crawl.json"), checkpoint_interval=3600)
+    key = product_requests(spider.parse_search_results(srp_response()))[0].meta['work_unit']
+    failure = Failure(TimeoutError("description timed out"))
+    failure.request = scrapy.Request('https://vi.vipr.ebaydesc.com/ws/eBayISAPI.dll', meta={
+        'work_unit': key, 'item': {'product_id': key.split(':', 1)[1], 'price': '$1.00'}})
+    [item] = spider.description_error_handler(failure)
+    assert item.description == "Description not found."
+    assert key in spider.checkpoint.done
+    assert spider.crawler.stats.get_value('checkpoint/failed') is None
+    assert spider.crawler.stats.get_value('checkpoint/retry_on_resume') is None
+
+
+def test_resume_without_a_checkpoint_file_is_an_error(make_spider):
+    with pytest.raises(ValueError):
+        make_spider(resume="true")
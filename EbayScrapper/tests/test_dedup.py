@@ -0,0 +1,73 @@
+from EbayScrapper.dedup import BloomFilter, ListingDeduplicator
+
+from tests.conftest import product_requests, srp_response
+
+
+def test_set_backend_reports_first_sighting_once():
+    dedup = ListingDeduplicator("set")
+    assert dedup.first_sighting("1", "rtx 5090")
+    assert not dedup.first_sighting("1", "rtx 5090 fe")
+    assert not dedup.first_sighting("1", "rtx 5090")
+    assert dedup.duplicates == 2
+    assert dedup.keywords_for("1") == ["rtx 5090", "rtx 5090 fe"]
+    assert dedup.keywords_for("2") == []
+
+
+def test_set_backend_forgets_oldest_listing_past_max_entries():
+    dedup = ListingDeduplicator("set", max_entries=2)
+    for product_id in ("1", "2", "3"):
+        assert dedup.first_sighting(product_id)
+    assert len(dedup) == 2
+    assert dedup.first_sighting("1")       # forgotten, so new again
+    assert not dedup.first_sighting("3")
+
+
+def test_keyword_provenance_is_capped():
+    dedup = ListingDeduplicator("set", max_keywords_per_listing=2)
+    for keyword in ("a", "b", "c"):
+        dedup.first_sighting("1", keyword)
+    assert dedup.keywords_for("1") == ["a", "b"]
+
+
+def test_bloom_backend_has_no_false_negatives():
+    dedup = ListingDeduplicator("bloom", max_entries=1000)
+    ids = [str(356000000000 + n) for n in range(1000)]
+    assert all(dedup.first_sighting(product_id) for product_id in ids[:500])
+    assert not any(dedup.first_sighting(product_id) for product_id in ids[:500])
+    assert dedup.keywords_for(ids[0]) == []
+
+
+def test_bloom_filter_false_positive_rate_is_near_target():
+    bloom = BloomFilter(10_000, error_rate=0.01)
+    for n in range(10_000):
+        bloom.add(f"in-{n}")
+    false_positives = sum(f"out-{n}" in bloom for n in range(10_000))
+    assert false_positives < 300
+
+
+def test_unknown_backend_is_rejected():
+    try:
+        ListingDeduplicator("redis")
+    except ValueError:
+        return
+    raise AssertionError("expected ValueError")
+
+
+def test_spider_schedules_each_listing_once_per_run(make_spider):
+    # An empty deduplicator is falsy (it defines __len__); it must still be consulted
+    spider = make_spider()
+    assert spider.listing_dedup is not None and len(spider.listing_dedup) == 0
+    first = product_requests(spider.parse_search_results(srp_response("rtx 5090 founder edition")))
+    assert first
+    assert len({r.url for r in first}) == len(first)
+    again = product_requests(spider.parse_search_results(srp_response("rtx 5090 fe", category="27386")))
+    assert again == []
+    product_id = first[0].meta['product_id_from_link']
+    assert spider.listing_dedup.keywords_for(product_id) == ["rtx 5090 founder edition", "rtx 5090 fe"]
+
+
+def test_spider_without_dedup_schedules_repeat_sightings(make_spider):
+    spider = make_spider(dedup_listings=False)
+    first = product_requests(spider.parse_search_results(srp_response()))
+    again = product_requests(spider.parse_search_results(srp_response()))
+    assert len(again) == len(first) > 0
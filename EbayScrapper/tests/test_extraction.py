@@ -0,0 +1,22 @@
+import pytest
+import scrapy
+
+from benchmarks.fixtures import load_fixture
+from EbayScrapper.extraction import PRODUCT_FIELDS, PRODUCT_SCOPES, FieldExtractor
+
+
+def extract(fixture):
+    root = scrapy.Selector(text=load_fixture(fixture).decode("utf-8")).root
+    return FieldExtractor(PRODUCT_FIELDS, PRODUCT_SCOPES).extract(root)
+
+
+@pytest.mark.parametrize('fixture', ["item_page.html", "item_page_sections.html"])
+def test_product_fields(fixture):
+    # item_page_sections.html has a condition section before the item specifics
+    # and a delivery block before the one with the item location
+    values, missing = extract(fixture)
+    assert missing == []
+    assert values['brand'] == "NVIDIA"
+    assert values['location'] == "Austin, Texas, United States"
+    assert values['price'] == "US $2,499.99"
+    assert values['seller_name'] == "gpu_outlet"
@@ -0,0 +1,170 @@
+import os
+
+import pytest
+import scrapy
+from scrapy.http import HtmlResponse
+from scrapy.settings import Settings
+from scrapy.utils.test import get_crawler
+
+from EbayScrapper import httpcache
+from EbayScrapper.httpcache import EndpointCachePolicy, SqliteCacheStorage
+
+SRP_URL = "https://www.ebay.com/sch/i.html?_nkw=rtx+5090"
+ITEM_URL = "https://www.ebay.com/itm/356000000000"
+TTLS = {'autosug': 3600, 'srp': 600, 'item': 60, 'description': 86400}
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def time(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(httpcache, "time", clock)
+    return clock
+
+
+def cache_settings(tmp_path, **settings):
+    return {'HTTPCACHE_DIR': str(tmp_path / "httpcache"), 'HTTPCACHE_ENDPOINT_TTLS': TTLS,
+            'HTTPCACHE_MAX_BYTES': 1024 * 1024, **settings}
+
+
+@pytest.fixture
+def open_storage(tmp_path):
+    storages = []
+
+    def open_(**settings):
+        crawler = get_crawler(scrapy.Spider, cache_settings(tmp_path, **settings))
+        crawler.stats.open_spider(None)
+        spider = scrapy.Spider.from_crawler(crawler, name='main')
+        storage = SqliteCacheStorage(crawler.settings)
+        storage.open_spider(spider)
+        storage.spider = spider
+        storages.append(storage)
+        return storage
+
+    yield open_
+    for storage in storages:
+        if storage.conn is not None:
+            storage.close_spider(storage.spider)
+            storage.conn = None
+
+
+def store(storage, url, body=b"<html>listing</html>", **meta):
+    request = scrapy.Request(url, meta=meta)
+    response = HtmlResponse(url, body=body, headers={'Content-Type': 'text/html'}, request=request)
+    storage.store_response(storage.spider, request, response)
+    return request
+
+
+def retrieve(storage, url, **meta):
+    return storage.retrieve_response(storage.spider, scrapy.Request(url, meta=meta))
+
+
+@pytest.mark.parametrize('url, meta, settings, cached', [
+    (SRP_URL, {}, {}, True),
+    ("https://autosug.ebaystatic.com/autosug?kwd=rtx", {}, {}, True),
+    ("https://www.ebay.com/help/home", {}, {}, False),              # no TTL for "other"
+    (ITEM_URL, {'playwright': True}, {}, False),                     # renders only when asked for
+    (ITEM_URL, {'playwright': True, 'cache_render': True}, {}, True),
+    (ITEM_URL, {'playwright': True}, {'HTTPCACHE_CACHE_RENDERS': True}, True),
+    (ITEM_URL, {'playwright': True, 'cache_render': False}, {'HTTPCACHE_CACHE_RENDERS': True}, False),
+])
+def test_policy_caches_listed_endpoints_and_requested_renders(url, meta, settings, cached):
+    policy = EndpointCachePolicy(Settings({'HTTPCACHE_ENDPOINT_TTLS': TTLS, **settings}))
+    assert policy.should_cache_request(scrapy.Request(url, meta=meta)) is cached
+
+
+@pytest.mark.parametrize('status, url, cached', [
+    (200, SRP_URL, True),
+    (404, SRP_URL, False),
+    (503, SRP_URL, False),
+    (200, "https://www.ebay.com/splashui/challenge?ap=1", False),
+])
+def test_policy_caches_only_real_pages(status, url, cached):
+    policy = EndpointCachePolicy(Settings({'HTTPCACHE_ENDPOINT_TTLS': TTLS}))
+    response = HtmlResponse(url, status=status, body=b"")
+    assert policy.should_cache_response(response, scrapy.Request(SRP_URL)) is cached
+
+
+@pytest.mark.parametrize('compression', ['zlib', 'zstd'])
+def test_round_trip(open_storage, clock, compression):
+    if compression == 'zstd':
+        pytest.importorskip('zstandard')
+    storage = open_storage(HTTPCACHE_COMPRESSION=compression)
+    store(storage, SRP_URL, body=b"<html>" + b"listing " * 1000 + b"</html>")
+    response = retrieve(storage, SRP_URL)
+    assert isinstance(response, HtmlResponse)
+    assert (response.url, response.status) == (SRP_URL, 200)
+    assert response.body == b"<html>" + b"listing " * 1000 + b"</html>"
+    assert response.headers['Content-Type'] == b'text/html'
+    assert storage.total_bytes < 1000   # stored compressed
+    assert retrieve(storage, ITEM_URL) is None
+
+
+def test_renders_and_plain_responses_have_separate_entries(open_storage, clock):
+    storage = open_storage()
+    store(storage, ITEM_URL, body=b"<html>plain</html>")
+    assert retrieve(storage, ITEM_URL, playwright=True) is None
+    store(storage, ITEM_URL, body=b"<html>rendered</html>", playwright=True)
+    assert retrieve(storage, ITEM_URL).body == b"<html>plain</html>"
+    assert retrieve(storage, ITEM_URL, playwright=True).body == b"<html>rendered</html>"
+
+
+def test_entries_expire_after_their_endpoint_ttl(open_storage, clock):
+    storage = open_storage()
+    store(storage, SRP_URL)
+    store(storage, SRP_URL, playwright=True)    # renders live as long as item pages
+    clock.now += 60
+    assert retrieve(storage, SRP_URL) is not None
+    assert retrieve(storage, SRP_URL, playwright=True) is not None
+    clock.now += 1
+    assert retrieve(storage, SRP_URL, playwright=True) is None
+    clock.now += 540
+    assert retrieve(storage, SRP_URL) is None
+    assert storage._stats.get_value('httpcache/expired') == 2
+    assert storage.total_bytes == 0
+    assert storage.conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0] == 0
+
+
+def test_endpoints_without_a_ttl_are_not_stored(open_storage, clock):
+    storage = open_storage()
+    store(storage, "https://www.ebay.com/help/home")
+    assert storage.total_bytes == 0
+
+
+def test_least_recently_used_entries_are_evicted_down_to_90_percent(tmp_path, open_storage, clock):
+    # Random bodies do not compress, so every entry has the same stored size
+    probe = open_storage(HTTPCACHE_DIR=str(tmp_path / "probe"))
+    store(probe, SRP_URL, body=os.urandom(2000))
+    entry = probe.total_bytes
+
+    storage = open_storage(HTTPCACHE_MAX_BYTES=int(5.5 * entry))
+    urls = [f"{SRP_URL}&_pgn={page}" for page in range(1, 7)]
+    for url in urls[:5]:
+        clock.now += 1
+        store(storage, url, body=os.urandom(2000))
+    clock.now += 1
+    assert retrieve(storage, urls[0]) is not None     # now the most recently used
+    clock.now += 1
+    store(storage, urls[5], body=os.urandom(2000))    # 6 entries > 5.5: down to at most 4.95
+    assert storage._stats.get_value('httpcache/evicted') == 2
+    assert [url for url in urls if retrieve(storage, url) is None] == urls[1:3]
+    assert storage.total_bytes == 4 * entry
+
+
+def test_stored_size_is_tracked_across_replacements_and_restarts(open_storage, clock):
+    storage = open_storage()
+    store(storage, SRP_URL, body=os.urandom(1000))
+    store(storage, ITEM_URL, body=os.urandom(1000))
+    store(storage, SRP_URL, body=os.urandom(3000))    # replaces the first entry
+    total = storage.total_bytes
+    assert total == storage.conn.execute("SELECT SUM(size) FROM responses").fetchone()[0]
+    storage.close_spider(storage.spider)
+    storage.conn = None
+    assert open_storage().total_bytes == total
@@ -0,0 +1,66 @@
+import pytest
+
+from EbayScrapper.normalize import parse_breadcrumbs, parse_count, parse_percentage, parse_price
+
+
+@pytest.mark.parametrize('text, parsed', [
+    ("US $1,999.99", (1999.99, "USD")),
+    ("US $2,499.99 to US $2,799.99", (2499.99, "USD")),   # ranges use the lower bound
+    ("C $1,234,567.50", (1234567.5, "CAD")),
+    ("AU\xa0$89.00", (89.0, "AUD")),
+    ("£45.50", (45.5, "GBP")),
+    ("$10", (10.0, "USD")),
+    ("EUR 12,00", (12.0, "EUR")),                          # decimal comma
+    ("EUR 1.999,99", (1999.99, "EUR")),
+    ("EUR 1.234.567", (1234567.0, "EUR")),
+    ("EUR 1,999", (1999.0, "EUR")),                        # three digits: thousands
+    ("€5,5", (5.5, "EUR")),
+    ("CHF 12.", (12.0, "CHF")),                            # a trailing full stop is not a decimal point
+    ("1,999.99", (1999.99, None)),
+    ("See price", (None, None)),
+    ("", (None, None)),
+    (None, (None, None)),
+])
+def test_parse_price(text, parsed):
+    assert parse_price(text) == parsed
+
+
+@pytest.mark.parametrize('text, count', [
+    ("(12,345)", 12345),
+    ("12345", 12345),
+    ("1.2K", 1200),
+    ("3m items sold", 3_000_000),
+    ("0", 0),
+    (42, 42),
+    ("no feedback", None),
+    (None, None),
+])
+def test_parse_count(text, count):
+    assert parse_count(text) == count
+
+
+@pytest.mark.parametrize('text, percentage', [
+    ("99.5% Positive feedback", 99.5),
+    ("100 % positive", 100.0),
+    (98, 98.0),
+    (99.1, 99.1),
+    ("Positive feedback", None),
+    (None, None),
+])
+def test_parse_percentage(text, percentage):
+    assert parse_percentage(text) == percentage
+
+
+@pytest.mark.parametrize('text, path', [
+    ("Computers/Tablets > Graphics Cards", ["Computers/Tablets", "Graphics Cards"]),
+    ("Computers/Tablets >  Components & Parts  > Graphics Cards",
+     ["Computers/Tablets", "Components & Parts", "Graphics Cards"]),
+    ("Graphics Cards", ["Graphics Cards"]),
+    ("Graphics Cards > ", ["Graphics Cards"]),
+    ("27386", []),          # a bare category ID
+    ("N/A", []),
+    ("", []),
+    (None, []),
+])
+def test_parse_breadcrumbs(text, path):
+    assert parse_breadcrumbs(text) == path
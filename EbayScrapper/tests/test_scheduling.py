@@ -0,0 +1,83 @@
+import pytest
+
+from EbayScrapper.scheduling import PRODUCT_PRIORITY, SearchPolicy
+
+policy = SearchPolicy(items_per_page=240, max_pages=10, min_page_yield=0.15, max_suggestions=6)
+
+
+@pytest.mark.parametrize('total_results, max_pages, pages', [
+    (0, None, 1),          # always at least the first page
+    (240, None, 1),
+    (241, None, 2),
+    (482, None, 3),
+    (100_000, None, 10),   # policy cap
+    (100_000, 3, 3),       # per-job cap
+    (100, 3, 1),
+])
+def test_planned_pages(total_results, max_pages, pages):
+    assert policy.planned_pages(total_results, max_pages) == pages
+
+
+@pytest.mark.parametrize('previous, new_listings, listings, expected', [
+    (None, 60, 240, 0.25),     # first page: the page's own yield
+    (None, 0, 0, 0.0),         # an empty page yields nothing
+    (0.5, 0, 240, 0.25),       # halfway to the latest page
+    (0.2, 240, 240, 0.6),
+    (0.08, 120, 240, 0.29),    # a suggestion's estimate stands in for the previous page
+])
+def test_page_yield(previous, new_listings, listings, expected):
+    assert policy.page_yield(previous, new_listings, listings) == pytest.approx(expected)
+
+
+@pytest.mark.parametrize('page, total_results, expected_yield, max_pages, reason', [
+    (1, 482, 1.0, None, None),
+    (2, 482, 0.15, None, None),                                            # at the threshold
+    (3, 482, 1.0, None, "482 results fit in 3 page(s) of 240"),
+    (1, 100, 1.0, None, "100 results fit in 1 page(s) of 240"),
+    (10, 100_000, 1.0, None, "reached max_search_pages_per_keyword (10)"),
+    (2, 100_000, 1.0, 2, "reached max_search_pages_per_keyword (2)"),
+    (2, 100_000, 0.1, None, "new-listing yield 0.10 is below 0.15"),
+    (3, 482, 0.0, None, "482 results fit in 3 page(s) of 240"),           # the page count is checked first
+])
+def test_stop_reason(page, total_results, expected_yield, max_pages, reason):
+    assert policy.stop_reason(page, total_results, expected_yield, max_pages) == reason
+
+
+@pytest.mark.parametrize('page, expected_yield, priority', [
+    (1, 1.0, 9),
+    (2, 1.0, 8),      # deeper pages wait
+    (2, 0.3, 1),      # and so do pages expected to find little
+    (5, 0.0, -5),
+])
+def test_search_priority(page, expected_yield, priority):
+    assert policy.search_priority(page, expected_yield) == priority
+
+
+def test_product_renders_come_before_every_search_page():
+    assert policy.product_priority(1) == PRODUCT_PRIORITY - 1
+    assert policy.product_priority(10) > policy.search_priority(0, 1.0)
+    assert policy.product_priority(1) > policy.product_priority(2)
+
+
+@pytest.mark.parametrize('completions, ranked', [
+    (["rtx 5090"], [("rtx 5090", 1.0)]),
+    # Same words in another order or case, and empty entries, are dropped
+    (["RTX 5090", "rtx 5090", "", None, "5090 rtx"], [("RTX 5090", 1.0)]),
+    # Unrelated completions only lose weight by position: 1 / (1 + 0.25 * position)
+    (["rtx 5090", "rx 9070"], [("rtx 5090", 1.0), ("rx 9070", 0.8)]),
+    # A refinement of a picked completion falls behind a partly overlapping one
+    (["rtx 5090", "rtx 5090 fe", "rtx 4090"],
+     [("rtx 5090", 1.0), ("rtx 4090", 0.556), ("rtx 5090 fe", 0.08)]),
+    # The broader keyword after a narrow one is not a refinement, only an overlap
+    (["rtx 5090 fe", "rtx 5090"], [("rtx 5090 fe", 1.0), ("rtx 5090", 0.533)]),
+    ([], []),
+])
+def test_rank_suggestions(completions, ranked):
+    assert policy.rank_suggestions(completions) == ranked
+
+
+def test_rank_suggestions_is_capped_at_max_suggestions():
+    completions = ["rtx 5090", "rtx 5090 fe", "rtx 4090", "rx 9070", "arc b580"]
+    assert [keyword for keyword, _ in SearchPolicy(max_suggestions=2).rank_suggestions(completions)] == [
+        "rtx 5090", "rx 9070"]
+    assert len(policy.rank_suggestions(completions)) == 5
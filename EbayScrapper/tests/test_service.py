@@ -0,0 +1,116 @@
+import os
+from collections import Counter
+from types import SimpleNamespace
+
+import pytest
+import scrapy
+from scrapy.dupefilters import RFPDupeFilter
+from scrapy.utils.test import get_crawler
+
+from EbayScrapper.service import FairShareScheduler, Job
+
+SPIDER = SimpleNamespace(allowed_categories=['0'])
+
+
+def payload_job(tmp_path, **payload):
+    return Job.from_payload({'keywords': ['rtx 5090'], **payload}, SPIDER, str(tmp_path / "jobs"))
+
+
+def test_payload_defaults(tmp_path):
+    job = payload_job(tmp_path, job_id='nightly-5090')
+    assert (job.keywords, job.categories, job.weight) == (['rtx 5090'], ['0'], 1.0)
+    assert job.output == os.path.realpath(tmp_path / "jobs" / "nightly-5090.jsonl")
+
+
+@pytest.mark.parametrize('payload', [
+    [],
+    {'keywords': []},
+    {'keywords': ['rtx 5090', ' ']},
+    {'keywords': ['rtx 5090'], 'max_pages': 0},
+    {'keywords': ['rtx 5090'], 'weight': -1},
+    {'keywords': ['rtx 5090'], 'job_id': '../../etc/cron.d/x'},
+    {'keywords': ['rtx 5090'], 'job_id': 'a b'},
+    {'keywords': ['rtx 5090'], 'job_id': 'x' * 65},
+    {'keywords': ['rtx 5090'], 'output': '../escaped.jsonl'},
+    {'keywords': ['rtx 5090'], 'output': '/tmp/escaped.jsonl'},
+    {'keywords': ['rtx 5090'], 'output': '.'},
+    {'keywords': ['rtx 5090'], 'output': ['a.jsonl']},
+])
+def test_invalid_payloads_are_rejected(payload, tmp_path):
+    with pytest.raises(ValueError):
+        Job.from_payload(payload, SPIDER, str(tmp_path / "jobs"))
+
+
+def test_output_stays_inside_the_output_directory(tmp_path):
+    job = payload_job(tmp_path, output='gpus/rtx.jsonl')
+    assert job.output == os.path.realpath(tmp_path / "jobs" / "gpus" / "rtx.jsonl")
+    # A symlink inside the directory does not lead out of it either
+    (tmp_path / "jobs").mkdir()
+    os.symlink(tmp_path, tmp_path / "jobs" / "up")
+    with pytest.raises(ValueError):
+        payload_job(tmp_path, output='up/escaped.jsonl')
+
+
+@pytest.fixture
+def scheduler():
+    crawler = get_crawler(scrapy.Spider)
+    scheduler = FairShareScheduler(crawler, RFPDupeFilter.from_crawler(crawler))
+    scheduler.open(scrapy.Spider('service'))
+    yield scheduler
+    scheduler.close('finished')
+
+
+def enqueue(scheduler, job_id, count, priority=0, start=0):
+    for n in range(start, start + count):
+        scheduler.enqueue_request(scrapy.Request(f'https://www.ebay.com/{job_id}/{n}', priority=priority,
+                                                 meta={'job_id': job_id}))
+
+
+def serve(scheduler, count):
+    served = [scheduler.next_request() for _ in range(count)]
+    return [request.meta['job_id'] for request in served if request is not None]
+
+
+def test_jobs_are_served_in_proportion_to_their_weight(scheduler):
+    scheduler.add_job('big', 2.0)
+    scheduler.add_job('small', 1.0)
+    enqueue(scheduler, 'big', 100)
+    enqueue(scheduler, 'small', 100)
+    assert Counter(serve(scheduler, 30)) == {'big': 20, 'small': 10}
+
+
+def test_late_small_job_is_not_queued_behind_a_large_one(scheduler):
+    scheduler.add_job('large', 1.0)
+    enqueue(scheduler, 'large', 500)
+    serve(scheduler, 100)
+    scheduler.add_job('late', 1.0)
+    enqueue(scheduler, 'late', 5)
+    # No credit is banked for the time the late job was not there, in either direction
+    assert Counter(serve(scheduler, 10)) == {'large': 5, 'late': 5}
+    assert scheduler.pending('late') == 0
+
+
+def test_priorities_apply_within_a_job(scheduler):
+    scheduler.add_job('a')
+    enqueue(scheduler, 'a', 2, priority=0)
+    enqueue(scheduler, 'a', 1, priority=10, start=2)
+    assert scheduler.next_request().url == 'https://www.ebay.com/a/2'
+
+
+def test_duplicates_are_filtered_per_job(scheduler):
+    scheduler.add_job('a')
+    scheduler.add_job('b')
+    request = scrapy.Request('https://www.ebay.com/sch/i.html?_nkw=rtx')
+    assert scheduler.enqueue_request(request.replace(meta={'job_id': 'a'}))
+    assert not scheduler.enqueue_request(request.replace(meta={'job_id': 'a'}))
+    assert scheduler.enqueue_request(request.replace(meta={'job_id': 'b'}))
+    assert len(scheduler) == 2
+
+
+def test_removed_job_drops_its_queue_and_later_requests(scheduler):
+    scheduler.add_job('a')
+    enqueue(scheduler, 'a', 3)
+    assert scheduler.remove_job('a') == 3
+    assert not scheduler.has_pending_requests()
+    enqueue(scheduler, 'a', 1, start=3)
+    assert scheduler.next_request() is None
@@ -0,0 +1,208 @@
+# Both work-queue backends against the same contract. The Redis backend runs
+# its Lua claim/fail scripts on fakeredis, an in-process stand-in for the
+# server (pip install "fakeredis[lua]"); two queue objects on one backing
+# store play two workers.
+
+import threading
+
+import pytest
+
+from EbayScrapper import workqueue
+from EbayScrapper.workqueue import RedisWorkQueue, SqliteWorkQueue
+
+LEASE = 60
+MAX_ATTEMPTS = 2
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def time(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(workqueue, "time", clock)
+    return clock
+
+
+@pytest.fixture(params=["sqlite", "redis"])
+def open_queue(request, tmp_path):
+    # Returns a factory: each call is another worker's handle on the same queue.
+    # Handles made with closed_by_caller=True are closed by the caller (SQLite
+    # connections must be closed in the thread that opened them).
+    queues = []
+    if request.param == "sqlite":
+        path = str(tmp_path / "work.db")
+
+        def make(closed_by_caller=False):
+            queue = SqliteWorkQueue(path, lease_seconds=LEASE, max_attempts=MAX_ATTEMPTS)
+            if not closed_by_caller:
+                queues.append(queue)
+            return queue
+    else:
+        fakeredis = pytest.importorskip("fakeredis")
+        pytest.importorskip("lupa")
+        server = fakeredis.FakeServer()
+
+        def make(closed_by_caller=False):
+            client = fakeredis.FakeRedis(server=server, decode_responses=True)
+            queue = RedisWorkQueue(None, lease_seconds=LEASE, max_attempts=MAX_ATTEMPTS, client=client)
+            if not closed_by_caller:
+                queues.append(queue)
+            return queue
+
+    yield make
+    for queue in queues:
+        queue.close()
+
+
+def keys(units):
+    return [unit.key for unit in units]
+
+
+def test_push_is_idempotent_per_key(open_queue, clock):
+    a, b = open_queue(), open_queue()
+    assert a.push('product', 'product:1', {'url': 'u1'})
+    assert not a.push('product', 'product:1', {'url': 'u1'})
+    assert not b.push('product', 'product:1', {'url': 'other'})
+    [unit] = b.claim('w2', 10)
+    assert (unit.key, unit.kind, unit.payload) == ('product:1', 'product', {'url': 'u1'})
+
+
+def test_claim_order_and_exclusive_leases(open_queue, clock):
+    a, b = open_queue(), open_queue()
+    a.push('search', 'search:1', {}, priority=0)
+    a.push('product', 'product:1', {}, priority=5)
+    a.push('search', 'search:2', {}, priority=0)
+    assert keys(a.claim('w1', 2)) == ['product:1', 'search:1']
+    assert keys(b.claim('w2', 10)) == ['search:2']
+    assert a.claim('w1', 10) == [] and b.claim('w2', 10) == []
+    assert a.open_units() == 3
+
+
+def test_concurrent_claims_hand_out_each_unit_once(open_queue, clock):
+    seeder = open_queue()
+    for n in range(200):
+        seeder.push('product', f'product:{n}', {})
+    claimed = [[] for _ in range(4)]
+
+    def run(index):
+        worker = open_queue(closed_by_caller=True)
+        try:
+            while True:
+                batch = worker.claim(f'w{index}', 7)
+                if not batch:
+                    return
+                claimed[index].extend(keys(batch))
+        finally:
+            worker.close()
+
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(len(claimed))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    everything = [key for batch in claimed for key in batch]
+    assert sorted(everything) == sorted(f'product:{n}' for n in range(200))
+
+
+def test_expired_lease_is_reclaimed_and_only_one_completion_wins(open_queue, clock):
+    a, b = open_queue(), open_queue()
+    a.push('product', 'product:1', {})
+    assert keys(a.claim('w1', 1)) == ['product:1']
+    clock.now += LEASE - 1
+    assert b.claim('w2', 1) == []           # still leased to w1
+    clock.now += 2
+    assert keys(b.claim('w2', 1)) == ['product:1']  # w1 looks dead; w2 takes over
+    # Both workers finish the listing; exactly one may emit it
+    assert b.complete('product:1')
+    assert not a.complete('product:1')
+    clock.now += LEASE * 2
+    assert a.claim('w1', 1) == [] and a.open_units() == 0
+    assert a.counts().get('done') == 1
+
+
+def test_completion_by_original_worker_after_requeue(open_queue, clock):
+    a, b = open_queue(), open_queue()
+    a.push('product', 'product:1', {})
+    a.claim('w1', 1)
+    clock.now += LEASE + 1
+    assert a.complete('product:1')          # late, but first
+    assert b.claim('w2', 1) == []           # not handed out again
+    assert not b.complete('product:1')
+
+
+def test_fail_requeues_until_attempts_are_used_up(open_queue, clock):
+    queue = open_queue()
+    queue.push('product', 'product:1', {})
+    queue.claim('w1', 1)
+    assert queue.fail('product:1')          # attempt 1 of 2: back to pending
+    assert keys(queue.claim('w1', 1)) == ['product:1']
+    assert not queue.fail('product:1')      # attempt 2 of 2: failed for good
+    assert queue.claim('w1', 1) == []
+    assert queue.open_units() == 0
+    assert queue.counts().get('failed') == 1
+    assert not queue.fail('product:1')      # not leased any more
+
+
+def test_expired_lease_without_attempts_left_is_not_handed_out(open_queue, clock):
+    a, b = open_queue(), open_queue()
+    a.push('product', 'product:1', {})
+    a.claim('w1', 1)
+    clock.now += LEASE + 1
+    assert keys(b.claim('w2', 1)) == ['product:1']  # second and last attempt
+    clock.now += LEASE + 1
+    assert a.claim('w1', 1) == []
+    assert a.counts().get('failed') == 1
+
+
+@pytest.fixture
+def redis_queue():
+    fakeredis = pytest.importorskip("fakeredis")
+    pytest.importorskip("lupa")
+    queue = RedisWorkQueue(None, lease_seconds=LEASE, max_attempts=MAX_ATTEMPTS,
+                           client=fakeredis.FakeRedis(decode_responses=True))
+    yield queue
+    queue.close()
+
+
+def test_redis_push_interrupted_before_it_ran_can_be_retried(redis_queue, clock):
+    push = redis_queue._push
+
+    def dead_worker(**kwargs):
+        raise ConnectionError("worker died before the push reached the server")
+
+    redis_queue._push = dead_worker
+    with pytest.raises(ConnectionError):
+        redis_queue.push('product', 'product:1', {'url': 'u1'})
+    redis_queue._push = push
+    assert redis_queue.open_units() == 0
+    assert redis_queue.push('product', 'product:1', {'url': 'u1'})
+    assert keys(redis_queue.claim('w1', 10)) == ['product:1']
+
+
+def test_redis_push_interrupted_after_it_ran_left_a_claimable_unit(redis_queue, clock):
+    push = redis_queue._push
+
+    def dead_worker(**kwargs):
+        push(**kwargs)
+        raise ConnectionError("worker died before the reply arrived")
+
+    redis_queue._push = dead_worker
+    with pytest.raises(ConnectionError):
+        redis_queue.push('product', 'product:1', {'url': 'u1'}, priority=5)
+    redis_queue._push = push
+    assert not redis_queue.push('product', 'product:1', {'url': 'u1'})
+    [unit] = redis_queue.claim('w1', 10)
+    assert (unit.key, unit.payload) == ('product:1', {'url': 'u1'})
+
+
+def test_redis_push_queues_keys_only_marked_seen_by_a_lost_push(redis_queue, clock):
+    # Left behind by earlier versions, which marked the key in a separate round trip
+    redis_queue.client.sadd('ebay:work:seen', 'product:1')
+    assert redis_queue.push('product', 'product:1', {})
+    assert keys(redis_queue.claim('w1', 10)) == ['product:1']